@@ -1,29 +1,68 @@
 from django.contrib import admin
 from django.utils.html import format_html
-from .models import Backup
+from .models import ArchivedBackup, Backup
+from .purge import request_backup_purge
+
+
+class PurgeInBackgroundMixin:
+    """Deleting only marks backups; backups.tasks.purge_deleted_backups removes rows and files."""
+
+    def delete_model(self, request, obj):
+        self.delete_queryset(request, type(obj).objects.filter(id=obj.id))
+
+    def delete_queryset(self, request, queryset):
+        marked = request_backup_purge(queryset)
+        self.message_user(request, f"{marked} backup(s) will be deleted in the background.", level="info")
+
 
 @admin.register(Backup)
-class BackupAdmin(admin.ModelAdmin):
+class BackupAdmin(PurgeInBackgroundMixin, admin.ModelAdmin):
     list_display = (
         "college",
         "uploaded_at",
         "file_link",
         "file_size_display",
         "short_checksum",
+        "content_encoding",
+        "replication_state",
     )
-    list_filter = ("college", "uploaded_at")
+    list_filter = ("college", "uploaded_at", "content_encoding", "replication_state", "pending_deletion")
+    list_select_related = ("college",)
     search_fields = ("college__name", "college__code", "remarks", "checksum")
     readonly_fields = (
         "uploaded_at",
         "file_size",
+        "content_size",
+        "content_encoding",
         "checksum",
+        "key_id",
+        "volume",
+        "original_name",
+        "pack_offset",
+        "pack_length",
+        "replication_state",
+        "replication_status",
+        "pending_deletion",
+        "manifest",
     )
     fieldsets = (
         ("Backup Details", {
             "fields": ("college", "file", "remarks")
         }),
         ("Metadata", {
-            "fields": ("uploaded_at", "file_size", "checksum"),
+            "fields": (
+                "uploaded_at", "file_size", "content_encoding", "content_size", "checksum", "key_id", "pending_deletion",
+            ),
+        }),
+        ("Storage", {
+            "fields": ("volume", "original_name", "pack_offset", "pack_length"),
+        }),
+        ("Replication", {
+            "fields": ("replication_state", "replication_status"),
+        }),
+        ("Contents", {
+            "fields": ("manifest",),
+            "classes": ("collapse",),
         }),
     )
 
@@ -58,3 +97,21 @@ class BackupAdmin(admin.ModelAdmin):
         if not obj.remarks:
             obj.remarks = f"Uploaded by {request.user.email or request.user.username}"
         super().save_model(request, obj, form, change)
+
+
+@admin.register(ArchivedBackup)
+class ArchivedBackupAdmin(PurgeInBackgroundMixin, admin.ModelAdmin):
+    list_display = ("id", "college", "uploaded_at", "archived_at", "file_size", "content_encoding")
+    list_filter = ("college", "uploaded_at", "pending_deletion")
+    list_select_related = ("college",)
+    search_fields = ("college__name", "college__code", "checksum")
+    date_hierarchy = "uploaded_at"
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return request.user.is_superuser
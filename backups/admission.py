@@ -0,0 +1,134 @@
+"""
+Admission control for backup uploads.
+
+Two limits are checked in Redis before an upload body is read:
+
+* a global semaphore (a sorted set of leases) capping concurrent ingests at
+  settings.UPLOAD_MAX_CONCURRENT, so the disk keeps its sustainable rate
+  instead of every upload slowing down together; when full the client gets
+  503 with a jittered Retry-After;
+* a token bucket per college (UPLOAD_BUCKET_SIZE uploads, one token back every
+  UPLOAD_BUCKET_REFILL seconds) so a misbehaving client cannot hog the slots;
+  when empty the client gets 429 with the time until the next token.
+
+Leases expire after UPLOAD_SLOT_TTL so a crashed worker cannot leak a slot.
+If Redis is not configured or unreachable, uploads are admitted (fail open).
+"""
+import logging
+import random
+import time
+import uuid
+
+from django.conf import settings
+from redis.exceptions import RedisError
+
+from monitoring.metrics import UPLOAD_ADMISSIONS
+
+logger = logging.getLogger(__name__)
+
+SLOTS_KEY = "upload:slots"
+
+
+class Admission:
+    def __init__(self, admitted=True, status_code=None, retry_after=None, release=None):
+        self.admitted = admitted
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self._release = release
+
+    def release(self):
+        release, self._release = self._release, None
+        if release is None:
+            return
+        try:
+            release()
+        except RedisError as e:
+            logger.warning(f"Failed to release upload slot (it will expire on its own): {e}")
+
+
+class UploadGate:
+
+    # Drops expired leases, then takes a slot if one is free.
+    ACQUIRE_SCRIPT = """
+    redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+    if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[2]) then return 0 end
+    redis.call('ZADD', KEYS[1], ARGV[3], ARGV[4])
+    redis.call('EXPIRE', KEYS[1], ARGV[5])
+    return 1
+    """
+
+    # Refills the bucket for the time elapsed and takes one token.
+    # Returns {allowed, seconds until the next token}.
+    BUCKET_SCRIPT = """
+    local capacity = tonumber(ARGV[1])
+    local refill = tonumber(ARGV[2])
+    local now = tonumber(ARGV[3])
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    local tokens = tonumber(bucket[1]) or capacity
+    local ts = tonumber(bucket[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - ts) / refill)
+    local allowed, wait = 0, 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+        allowed = 1
+    else
+        wait = math.ceil((1 - tokens) * refill)
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+    redis.call('EXPIRE', KEYS[1], math.ceil(capacity * refill))
+    return {allowed, wait}
+    """
+
+    def __init__(self, client=None):
+        from checkmate_central.redis_client import get_redis
+
+        self.redis = client or get_redis()
+        self._acquire = self.redis.register_script(self.ACQUIRE_SCRIPT)
+        self._bucket = self.redis.register_script(self.BUCKET_SCRIPT)
+
+    @staticmethod
+    def bucket_key(college_code):
+        return f"upload:bucket:{college_code}"
+
+    def admit(self, college_code):
+        now = time.time()
+        lease = uuid.uuid4().hex
+        ttl = settings.UPLOAD_SLOT_TTL
+
+        if not self._acquire(keys=[SLOTS_KEY], args=[now, settings.UPLOAD_MAX_CONCURRENT, now + ttl, lease, ttl]):
+            retry_after = settings.UPLOAD_RETRY_AFTER + random.randint(0, settings.UPLOAD_RETRY_AFTER)
+            return Admission(False, 503, retry_after)
+
+        def release():
+            self.redis.zrem(SLOTS_KEY, lease)
+
+        try:
+            allowed, wait = self._bucket(
+                keys=[self.bucket_key(college_code)],
+                args=[settings.UPLOAD_BUCKET_SIZE, settings.UPLOAD_BUCKET_REFILL, now],
+            )
+        except RedisError:
+            release()
+            raise
+        if not allowed:
+            release()
+            return Admission(False, 429, max(1, int(wait)))
+        return Admission(release=release)
+
+
+def admit_upload(college):
+    """Admit or reject an upload for `college`; always returns an Admission."""
+    if not settings.REDIS_URL or settings.UPLOAD_MAX_CONCURRENT <= 0:
+        return Admission()
+    try:
+        admission = UploadGate().admit(college.code)
+    except RedisError as e:
+        logger.warning(f"Upload admission check failed, admitting {college.code}: {e}")
+        UPLOAD_ADMISSIONS.labels(result="error").inc()
+        return Admission()
+
+    if admission.admitted:
+        UPLOAD_ADMISSIONS.labels(result="admitted").inc()
+    else:
+        UPLOAD_ADMISSIONS.labels(result="busy" if admission.status_code == 503 else "throttled").inc()
+    return admission
@@ -0,0 +1,209 @@
+"""
+Garbage collection of backup files no row refers to.
+
+A failed upload or a crash can leave files behind: an upload still in
+"backups/temp/", a moved file whose encryption failed, an unfinished
+".tmp" pack file, or the plaintext a download decrypted into the system
+temp directory. `collect_garbage` scans "backups/" under MEDIA_ROOT and
+every BACKUP_VOLUMES location, one thread per college directory, and
+checks the names it finds against Backup and ArchivedBackup in batches.
+Names that no row refers to are orphans. Files modified within the last
+BACKUP_GC_GRACE_HOURS are never touched, so uploads, encryptions and packs
+that are still running are safe.
+
+Orphans are moved to ".quarantine/<date>/" next to "backups/" on the same
+volume, keeping their relative path, so a mistake is undone with a plain
+`mv`. Quarantined files older than BACKUP_GC_QUARANTINE_DAYS are deleted.
+With BACKUP_GC_DELETE they are deleted straight away.
+"""
+import logging
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from monitoring.metrics import GC_BYTES
+from .storage import backup_storage
+
+logger = logging.getLogger(__name__)
+
+# Prefix of the temp files views decrypt downloads into.
+DECRYPT_PREFIX = "checkmate-decrypt-"
+QUARANTINE_DIR = ".quarantine"
+
+
+@dataclass
+class GarbageReport:
+    scanned: int = 0
+    orphans: list = field(default_factory=list)  # (name, size)
+    reclaimed_bytes: int = 0
+    quarantined_bytes: int = 0
+    temp_files: int = 0
+
+    @property
+    def orphan_bytes(self):
+        return sum(size for _, size in self.orphans)
+
+
+def media_roots():
+    """(volume, location) of every root that holds backup files."""
+    return [("", str(settings.MEDIA_ROOT)), *settings.BACKUP_VOLUMES.items()]
+
+
+def _walk(path, recursive=True):
+    """(path, size, mtime) of every regular file below `path`."""
+    stack = [path]
+    while stack:
+        try:
+            entries = list(os.scandir(stack.pop()))
+        except FileNotFoundError:
+            continue
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if recursive:
+                    stack.append(entry.path)
+            elif entry.is_file(follow_symlinks=False):
+                st = entry.stat(follow_symlinks=False)
+                yield entry.path, st.st_size, st.st_mtime
+
+
+def scan_files(cutoff):
+    """{stored name: (path, size)} of backup files last modified before `cutoff`, and the number of files seen."""
+    jobs = []
+    for volume, location in media_roots():
+        base = os.path.join(location, "backups")
+        try:
+            subdirs = [entry.path for entry in os.scandir(base) if entry.is_dir(follow_symlinks=False)]
+        except FileNotFoundError:
+            continue
+        jobs.append((volume, location, base, False))
+        jobs.extend((volume, location, path, True) for path in subdirs)
+
+    def scan(job):
+        volume, location, path, recursive = job
+        found, seen = {}, 0
+        for file_path, size, mtime in _walk(path, recursive):
+            seen += 1
+            if mtime < cutoff:
+                name = backup_storage.join(volume, os.path.relpath(file_path, location).replace(os.sep, "/"))
+                found[name] = (file_path, size)
+        return found, seen
+
+    candidates, scanned = {}, 0
+    with ThreadPoolExecutor(max_workers=settings.BACKUP_GC_WORKERS) as pool:
+        for found, seen in pool.map(scan, jobs):
+            candidates.update(found)
+            scanned += seen
+    return candidates, scanned
+
+
+def referenced_names(names):
+    """The subset of `names` some Backup or ArchivedBackup row refers to, in batched queries."""
+    from .models import ArchivedBackup, Backup
+
+    names = list(names)
+    referenced = set()
+    batch = settings.BACKUP_GC_BATCH_SIZE
+    for i in range(0, len(names), batch):
+        chunk = names[i:i + batch]
+        for model in (Backup, ArchivedBackup):
+            referenced.update(model.objects.filter(file__in=chunk).values_list("file", flat=True))
+    return referenced
+
+
+def _quarantine(name, path):
+    volume = backup_storage.volume_of(name)
+    location = settings.BACKUP_VOLUMES[volume] if volume else str(settings.MEDIA_ROOT)
+    relative = name[len(volume) + 1:] if volume else name
+    target = os.path.join(location, QUARANTINE_DIR, timezone.localdate().isoformat(), relative)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    os.replace(path, target)
+
+
+def purge_quarantine(before):
+    """Delete quarantine days older than the date `before`; returns the bytes freed."""
+    freed = 0
+    for _, location in media_roots():
+        root = os.path.join(location, QUARANTINE_DIR)
+        try:
+            days = [entry for entry in os.scandir(root) if entry.is_dir(follow_symlinks=False)]
+        except FileNotFoundError:
+            continue
+        for day in days:
+            try:
+                expired = date.fromisoformat(day.name) < before
+            except ValueError:
+                continue
+            if expired:
+                freed += sum(size for _, size, _ in _walk(day.path))
+                shutil.rmtree(day.path, ignore_errors=True)
+    return freed
+
+
+def collect_temp_files(cutoff, dry_run=False):
+    """Remove download decrypt files left in the temp directory; returns (count, bytes)."""
+    count = size = 0
+    with os.scandir(tempfile.gettempdir()) as entries:
+        for entry in entries:
+            if not entry.name.startswith(DECRYPT_PREFIX) or not entry.is_file(follow_symlinks=False):
+                continue
+            st = entry.stat(follow_symlinks=False)
+            if st.st_mtime >= cutoff:
+                continue
+            if not dry_run:
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    continue
+            count += 1
+            size += st.st_size
+    return count, size
+
+
+def collect_garbage(dry_run=False, delete=None, grace_hours=None):
+    """Find orphaned backup files and quarantine (or delete) them; returns a GarbageReport."""
+    delete = settings.BACKUP_GC_DELETE if delete is None else delete
+    grace = settings.BACKUP_GC_GRACE_HOURS if grace_hours is None else grace_hours
+    cutoff = time.time() - grace * 60 * 60
+
+    candidates, scanned = scan_files(cutoff)
+    referenced = referenced_names(candidates)
+    report = GarbageReport(scanned=scanned)
+    report.orphans = sorted((name, size) for name, (_, size) in candidates.items() if name not in referenced)
+
+    report.temp_files, temp_bytes = collect_temp_files(cutoff, dry_run)
+    if dry_run:
+        return report
+    report.reclaimed_bytes += temp_bytes
+    GC_BYTES.labels(action="temp").inc(temp_bytes)
+
+    action = "deleted" if delete else "quarantined"
+    for name, size in report.orphans:
+        path = candidates[name][0]
+        try:
+            if delete:
+                os.remove(path)
+            else:
+                _quarantine(name, path)
+        except FileNotFoundError:
+            continue
+        except OSError as e:
+            logger.error(f"Could not remove orphaned backup file {name}: {e}")
+            continue
+        if delete:
+            report.reclaimed_bytes += size
+        else:
+            report.quarantined_bytes += size
+        GC_BYTES.labels(action=action).inc(size)
+        logger.info(f"{action.capitalize()} orphaned backup file {name} ({size} bytes)")
+
+    purged = purge_quarantine(timezone.localdate() - timedelta(days=settings.BACKUP_GC_QUARANTINE_DAYS))
+    report.reclaimed_bytes += purged
+    GC_BYTES.labels(action="purged").inc(purged)
+    return report
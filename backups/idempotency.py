@@ -0,0 +1,88 @@
+"""
+Idempotency-Key support for the backup API.
+
+A client that retries a request with the same `Idempotency-Key` header gets
+the original response replayed from the cache instead of the dump being
+stored and encrypted again. Keys are scoped to the caller's API key and kept
+for settings.IDEMPOTENCY_TTL. While the first request is still running,
+retries get 409 so two copies are never processed side by side.
+"""
+import hashlib
+import logging
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+
+logger = logging.getLogger(__name__)
+
+HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 255
+
+
+def _cache_key(scope, request, idempotency_key):
+    credentials = request.headers.get("Authorization", "")
+    digest = hashlib.sha256(f"{credentials}\n{idempotency_key}".encode()).hexdigest()
+    return f"idempotency:{scope}:{digest}"
+
+
+def _fingerprint(request):
+    # The body is not read until the request is processed, so retries are
+    # matched on what the headers already tell us.
+    return request.method, request.path, request.headers.get("Content-Length", "")
+
+
+def _should_store(response):
+    # Rejections the client is expected to retry (throttling, busy, conflict)
+    # and server errors are not final answers.
+    return 200 <= response.status_code < 300 or response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def idempotent(scope):
+    """Decorator for APIView handlers that honours the Idempotency-Key header."""
+    def decorator(handler):
+        @wraps(handler)
+        def wrapper(view, request, *args, **kwargs):
+            idempotency_key = request.headers.get(HEADER)
+            if not idempotency_key:
+                return handler(view, request, *args, **kwargs)
+            if len(idempotency_key) > MAX_KEY_LENGTH:
+                return Response(
+                    {"error": f"{HEADER} must be at most {MAX_KEY_LENGTH} characters."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+
+            key = _cache_key(scope, request, idempotency_key)
+            fingerprint = _fingerprint(request)
+            stored = cache.get(key)
+            if stored is not None:
+                if stored["fingerprint"] != fingerprint:
+                    return Response(
+                        {"error": f"{HEADER} was already used for a different request."},
+                        status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                    )
+                logger.info(f"Replaying {scope} response for a retried request")
+                return Response(stored["data"], status=stored["status"], headers={"Idempotent-Replayed": "true"})
+
+            lock = f"{key}:lock"
+            if not cache.add(lock, 1, settings.IDEMPOTENCY_LOCK_TTL):
+                return Response(
+                    {"error": "A request with this Idempotency-Key is still being processed."},
+                    status=status.HTTP_409_CONFLICT,
+                    headers={"Retry-After": str(settings.UPLOAD_RETRY_AFTER)},
+                )
+            try:
+                response = handler(view, request, *args, **kwargs)
+                if _should_store(response):
+                    cache.set(key, {
+                        "fingerprint": fingerprint,
+                        "status": response.status_code,
+                        "data": response.data,
+                    }, settings.IDEMPOTENCY_TTL)
+                return response
+            finally:
+                cache.delete(lock)
+        return wrapper
+    return decorator
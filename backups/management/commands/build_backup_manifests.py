@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+
+from backups.models import ArchivedBackup, Backup
+
+
+class Command(BaseCommand):
+    help = (
+        "Build the table manifest of backups uploaded before manifests were recorded at ingest. "
+        "Each stored file is decrypted once; backups sharing it share the result."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=None, help="Stop after this many files")
+
+    def handle(self, *args, **options):
+        built = failed = 0
+        for model in (Backup, ArchivedBackup):
+            names = (
+                model.objects.filter(manifest__isnull=True, pending_deletion=False)
+                .exclude(file="").order_by().values_list("file", "pack_offset").distinct()
+            )
+            for name, pack_offset in names.iterator():
+                if options["limit"] is not None and built + failed >= options["limit"]:
+                    break
+                # Entries of one pack share the file name; the offset tells them apart.
+                stored = {"file": name, "pack_offset": pack_offset}
+                backup = model.objects.filter(**stored).first()
+                try:
+                    manifest = backup.build_manifest()
+                except Exception as e:
+                    self.stdout.write(self.style.ERROR(f"❌ {name}: {e}"))
+                    failed += 1
+                    continue
+                # Every row sharing the stored content gets it.
+                for each in (Backup, ArchivedBackup):
+                    each.objects.filter(**stored, manifest__isnull=True).update(manifest=manifest)
+                built += 1
+                self.stdout.write(f"   → {name}: {len(manifest['tables'])} tables")
+
+        self.stdout.write(self.style.SUCCESS(f"✅ Built {built} manifests."))
+        if failed:
+            self.stdout.write(self.style.WARNING(f"⚠️ {failed} files could not be read."))
@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from backups.cleanup import collect_garbage
+from backups.tasks import collect_backup_garbage
+
+
+class Command(BaseCommand):
+    help = (
+        "Quarantine (or delete) backup files that no backup row refers to, and stale download temp files. "
+        "Queues the collection on the maintenance worker unless --now or --dry-run is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Only report the orphans")
+        parser.add_argument("--now", action="store_true", help="Collect in this process")
+        parser.add_argument("--delete", action="store_true", help="Delete orphans instead of quarantining them")
+        parser.add_argument(
+            "--grace-hours", type=int, default=None,
+            help=f"Leave files modified more recently alone (default {settings.BACKUP_GC_GRACE_HOURS})",
+        )
+
+    def handle(self, *args, **options):
+        if not (options["dry_run"] or options["now"]):
+            result = collect_backup_garbage.delay()
+            self.stdout.write(self.style.SUCCESS(f"✅ Garbage collection queued (task id {result.id})."))
+            return
+
+        report = collect_garbage(
+            dry_run=options["dry_run"], delete=options["delete"] or None, grace_hours=options["grace_hours"],
+        )
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"📘 {report.scanned} files scanned, {len(report.orphans)} orphans ({report.orphan_bytes} bytes), "
+            f"{report.temp_files} stale temp files"
+        ))
+        for name, size in report.orphans:
+            self.stdout.write(f"   → {name} ({size} bytes)")
+        if options["dry_run"]:
+            self.stdout.write(self.style.WARNING("⚠️ Dry run: nothing was removed."))
+            return
+        if report.quarantined_bytes:
+            self.stdout.write(self.style.SUCCESS(f"✅ Quarantined {report.quarantined_bytes} bytes."))
+        self.stdout.write(self.style.SUCCESS(f"✅ Reclaimed {report.reclaimed_bytes} bytes."))
@@ -0,0 +1,35 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from backups.storage import backup_storage
+from backups.tasks import misplaced_files, rebalance_backup_volumes
+
+
+class Command(BaseCommand):
+    help = (
+        "Move backup files onto the volume their college hashes to (see BACKUP_VOLUMES). "
+        "Queues the move on the maintenance worker unless --now is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Only report what would move")
+        parser.add_argument("--now", action="store_true", help="Move the files in this process")
+
+    def handle(self, *args, **options):
+        if not backup_storage.ring:
+            raise CommandError("❌ No BACKUP_VOLUMES configured.")
+
+        misplaced = misplaced_files()
+        self.stdout.write(self.style.MIGRATE_HEADING(f"📘 {len(misplaced)} files to move"))
+        for volume, count in sorted(Counter(misplaced.values()).items()):
+            self.stdout.write(f"   → {volume}: {count}")
+        if options["dry_run"] or not misplaced:
+            return
+
+        if options["now"]:
+            moved = rebalance_backup_volumes()
+            self.stdout.write(self.style.SUCCESS(f"✅ Moved {moved} files."))
+        else:
+            result = rebalance_backup_volumes.delay()
+            self.stdout.write(self.style.SUCCESS(f"✅ Rebalance queued (task id {result.id})."))
@@ -0,0 +1,108 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+
+from backups.models import ArchivedBackup, Backup
+from backups.utils.encryption import DEFAULT_KEY_ID, current_key_id, master_keys, rewrap, wrap_legacy_key
+
+MODELS = (Backup, ArchivedBackup)
+
+
+def legacy_backups(model):
+    """Encrypted rows from before envelope encryption, still using BACKUP_ENCRYPTION_KEY directly."""
+    return model.objects.filter(Q(wrapped_key__isnull=True) | Q(wrapped_key=""), is_encrypted=True)
+
+
+class Command(BaseCommand):
+    help = (
+        "Rewrap every backup data key, archived backups included, with the current master key "
+        "(the first entry of BACKUP_MASTER_KEYS). Backups encrypted before envelope encryption get "
+        "BACKUP_ENCRYPTION_KEY wrapped as their data key. Backup files are not touched."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--workers", type=int, default=8)
+        parser.add_argument("--dry-run", action="store_true", help="Only count the keys that need rewrapping")
+
+    def handle(self, *args, **options):
+        try:
+            configured = master_keys()
+            target = current_key_id()
+        except ValueError as e:
+            raise CommandError(f"❌ {e}")
+
+        stale = {
+            model: model.objects.filter(wrapped_key__isnull=False).exclude(wrapped_key="").exclude(key_id=target)
+            for model in MODELS
+        }
+        unknown = set()
+        for queryset in stale.values():
+            unknown.update(queryset.values_list("key_id", flat=True).distinct())
+        unknown -= set(configured)
+        if unknown:
+            raise CommandError(
+                f"❌ Backups use master key(s) {', '.join(sorted(unknown))} that are not in BACKUP_MASTER_KEYS."
+            )
+
+        total = sum(queryset.count() for queryset in stale.values())
+        legacy_total = sum(legacy_backups(model).count() for model in MODELS)
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"📘 {total} data keys to rewrap and {legacy_total} pre-envelope backups to move "
+            f"to master key '{target}'"
+        ))
+        if options["dry_run"]:
+            return
+
+        done = 0
+        with ThreadPoolExecutor(max_workers=options["workers"]) as pool:
+            for model, queryset in stale.items():
+                while True:
+                    # Rows leave the queryset as they are rewrapped, so always take the first batch.
+                    batch = list(queryset.order_by("id").only("id", "wrapped_key", "key_id")[:options["batch_size"]])
+                    if not batch:
+                        break
+                    rewrapped = pool.map(lambda b: rewrap(b.wrapped_key, b.key_id, target), batch)
+                    for backup, wrapped_key in zip(batch, rewrapped):
+                        backup.wrapped_key, backup.key_id = wrapped_key, target
+                    with transaction.atomic():
+                        model.objects.bulk_update(batch, ["wrapped_key", "key_id"])
+                    done += len(batch)
+                    self.stdout.write(f"   {done}/{total}")
+        if total:
+            self.stdout.write(self.style.SUCCESS(f"✅ Rewrapped {done} data keys."))
+
+        if legacy_total:
+            self.migrate_legacy(target, legacy_total, options["batch_size"])
+
+        remaining = sum(legacy_backups(model).count() for model in MODELS)
+        if remaining:
+            self.stdout.write(self.style.WARNING(
+                f"⚠️ {remaining} backups still use BACKUP_ENCRYPTION_KEY directly; "
+                "keep it and run this command again."
+            ))
+        elif target == DEFAULT_KEY_ID:
+            self.stdout.write(self.style.SUCCESS("✅ Old master keys can now be removed."))
+        else:
+            self.stdout.write(self.style.SUCCESS("✅ Old master keys and BACKUP_ENCRYPTION_KEY can now be removed."))
+
+    def migrate_legacy(self, target, total, batch_size):
+        """Give pre-envelope backups BACKUP_ENCRYPTION_KEY, wrapped by `target`, as their data key."""
+        try:
+            # One data key for all of them: they were all encrypted with the same key.
+            wrapped_key = wrap_legacy_key(target)
+        except ValueError as e:
+            raise CommandError(f"❌ {e}")
+
+        done = 0
+        for model in MODELS:
+            queryset = legacy_backups(model)
+            while True:
+                ids = list(queryset.order_by("id").values_list("id", flat=True)[:batch_size])
+                if not ids:
+                    break
+                done += model.objects.filter(id__in=ids).update(wrapped_key=wrapped_key, key_id=target)
+                self.stdout.write(f"   {done}/{total}")
+        self.stdout.write(self.style.SUCCESS(f"✅ Moved {done} pre-envelope backups to master key '{target}'."))
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 19:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backups', '0005_backup_is_encrypted'),
+        ('colleges', '0002_college_updated_at_alter_college_code_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='backup',
+            index=models.Index(fields=['college', 'checksum'], name='backups_bac_college_9405de_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-19 19:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backups', '0006_backup_college_checksum_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='backup',
+            name='content_encoding',
+            field=models.CharField(choices=[('identity', 'None'), ('gzip', 'gzip'), ('zstd', 'zstd')], default='identity', help_text='Compression the dump was uploaded (and is stored) with', max_length=16),
+        ),
+        migrations.AddField(
+            model_name='backup',
+            name='content_size',
+            field=models.BigIntegerField(blank=True, help_text='Size of the decompressed dump', null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-19 19:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backups', '0007_backup_content_encoding'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='backup',
+            name='key_id',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='backup',
+            name='wrapped_key',
+            field=models.CharField(blank=True, editable=False, help_text='Per-backup data key, encrypted with the master key `key_id`', max_length=255, null=True),
+        ),
+    ]
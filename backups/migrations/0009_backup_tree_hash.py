@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 19:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backups', '0008_backup_envelope_keys'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='backup',
+            name='tree_hash',
+            field=models.CharField(blank=True, editable=False, help_text='SHA256 over the per-segment digests of a segmented (parallel) encrypted file', max_length=64, null=True),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.7 on 2026-10-19 19:10
+
+import backups.models
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backups', '0009_backup_tree_hash'),
+        ('colleges', '0002_college_updated_at_alter_college_code_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedBackup',
+            fields=[
+                ('file', models.FileField(upload_to=backups.models.temp_backup_upload_path)),
+                ('file_size', models.BigIntegerField(blank=True, null=True)),
+                ('checksum', models.CharField(blank=True, help_text='SHA256 checksum', max_length=64, null=True)),
+                ('remarks', models.TextField(blank=True, null=True)),
+                ('is_encrypted', models.BooleanField(default=False)),
+                ('content_encoding', models.CharField(choices=[('identity', 'None'), ('gzip', 'gzip'), ('zstd', 'zstd')], default='identity', help_text='Compression the dump was uploaded (and is stored) with', max_length=16)),
+                ('content_size', models.BigIntegerField(blank=True, help_text='Size of the decompressed dump', null=True)),
+                ('wrapped_key', models.CharField(blank=True, editable=False, help_text='Per-backup data key, encrypted with the master key `key_id`', max_length=255, null=True)),
+                ('key_id', models.CharField(blank=True, db_index=True, editable=False, max_length=64, null=True)),
+                ('tree_hash', models.CharField(blank=True, editable=False, help_text='SHA256 over the per-segment digests of a segmented (parallel) encrypted file', max_length=64, null=True)),
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('uploaded_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('college', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_backups', to='colleges.college')),
+            ],
+            options={
+                'ordering': ['-uploaded_at'],
+                'abstract': False,
+                'indexes': [models.Index(fields=['college', '-uploaded_at'], name='backups_arc_college_38b878_idx')],
+            },
+        ),
+    ]
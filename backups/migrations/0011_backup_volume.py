@@ -0,0 +1,35 @@
+# Generated by Django 5.2.7 on 2026-10-19 19:21
+
+import backups.models
+import backups.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backups', '0010_archivedbackup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedbackup',
+            name='volume',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, help_text='Storage volume holding the file (empty for MEDIA_ROOT)', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='backup',
+            name='volume',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, help_text='Storage volume holding the file (empty for MEDIA_ROOT)', max_length=64),
+        ),
+        migrations.AlterField(
+            model_name='archivedbackup',
+            name='file',
+            field=models.FileField(storage=backups.storage.get_backup_storage, upload_to=backups.models.temp_backup_upload_path),
+        ),
+        migrations.AlterField(
+            model_name='backup',
+            name='file',
+            field=models.FileField(storage=backups.storage.get_backup_storage, upload_to=backups.models.temp_backup_upload_path),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-19 19:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backups', '0011_backup_volume'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedbackup',
+            name='replication_state',
+            field=models.CharField(blank=True, choices=[('pending', 'Pending'), ('done', 'Replicated'), ('failed', 'Failed')], db_index=True, default='', editable=False, help_text='Empty when no replication targets were configured', max_length=16),
+        ),
+        migrations.AddField(
+            model_name='archivedbackup',
+            name='replication_status',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Per-target result of the last replication attempt'),
+        ),
+        migrations.AddField(
+            model_name='backup',
+            name='replication_state',
+            field=models.CharField(blank=True, choices=[('pending', 'Pending'), ('done', 'Replicated'), ('failed', 'Failed')], db_index=True, default='', editable=False, help_text='Empty when no replication targets were configured', max_length=16),
+        ),
+        migrations.AddField(
+            model_name='backup',
+            name='replication_status',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Per-target result of the last replication attempt'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.7 on 2026-10-19 19:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backups', '0012_backup_replication'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedbackup',
+            name='original_name',
+            field=models.CharField(blank=True, default='', editable=False, help_text='File name the backup had before it was packed', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='archivedbackup',
+            name='pack_length',
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='archivedbackup',
+            name='pack_offset',
+            field=models.BigIntegerField(blank=True, editable=False, help_text="Offset of this backup's entry when `file` is a cold pack file", null=True),
+        ),
+        migrations.AddField(
+            model_name='backup',
+            name='original_name',
+            field=models.CharField(blank=True, default='', editable=False, help_text='File name the backup had before it was packed', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='backup',
+            name='pack_length',
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='backup',
+            name='pack_offset',
+            field=models.BigIntegerField(blank=True, editable=False, help_text="Offset of this backup's entry when `file` is a cold pack file", null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-19 19:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backups', '0013_backup_packs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedbackup',
+            name='pending_deletion',
+            field=models.BooleanField(db_index=True, default=False, editable=False, help_text='Hidden and waiting for backups.tasks.purge_deleted_backups'),
+        ),
+        migrations.AddField(
+            model_name='backup',
+            name='pending_deletion',
+            field=models.BooleanField(db_index=True, default=False, editable=False, help_text='Hidden and waiting for backups.tasks.purge_deleted_backups'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-19 19:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backups', '0014_backup_pending_deletion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedbackup',
+            name='manifest',
+            field=models.JSONField(blank=True, editable=False, help_text='Tables of the dump with offsets, row estimates and sizes (backups/utils/manifest.py)', null=True),
+        ),
+        migrations.AddField(
+            model_name='backup',
+            name='manifest',
+            field=models.JSONField(blank=True, editable=False, help_text='Tables of the dump with offsets, row estimates and sizes (backups/utils/manifest.py)', null=True),
+        ),
+    ]
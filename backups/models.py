@@ -1,35 +1,249 @@
+import heapq
 import os
 import hashlib
-from django.db import models
+from functools import partial
+from tempfile import NamedTemporaryFile
+from django.db import models, transaction
+from django.db.models import Max, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
 from django.utils import timezone
-from django.core.files.storage import default_storage
+from .storage import backup_storage, get_backup_storage
+from .replication import queue_replication
+from django.conf import settings
 from colleges.models import College
-from .utils.encryption import encrypt_file
+from .cleanup import DECRYPT_PREFIX
+from .utils.compression import digest_stream
+from .utils.encryption import encrypt_backup_file, decrypt_file, decrypt_pack_entry, new_data_key
+from .utils.manifest import DumpManifest
 
 def temp_backup_upload_path(instance, filename):
-    return os.path.join("backups", "temp", filename)
+    # Land the upload on the college's volume so moving it into place is local.
+    volume = backup_storage.volume_for_college(instance.college.code) if instance.college_id else ""
+    return backup_storage.join(volume, os.path.join("backups", "temp", filename))
 
 
-class Backup(models.Model):
-    college = models.ForeignKey(College, on_delete=models.CASCADE, related_name="backups")
-    file = models.FileField(upload_to=temp_backup_upload_path)
-    uploaded_at = models.DateTimeField(auto_now_add=True)
+# Rows not marked for deletion (see backups/purge.py).
+VISIBLE = {"pending_deletion": False, "college__pending_deletion": False}
+
+
+class BackupCatalog:
+    """
+    Backups matching `filters` from both the hot table and the archive,
+    newest first. Supports the subset of the QuerySet API the views need.
+    """
+
+    def __init__(self, **filters):
+        self.filters = filters
+        self._result_cache = None
+
+    def filter(self, **filters):
+        return BackupCatalog(**{**self.filters, **filters})
+
+    def _querysets(self):
+        return (
+            # Lists never show the manifest, which can be large.
+            Backup.objects.filter(**self.filters, **VISIBLE).select_related("college").defer("manifest"),
+            ArchivedBackup.objects.filter(**self.filters, **VISIBLE).select_related("college").defer("manifest"),
+        )
+
+    def _fetch_all(self):
+        if self._result_cache is None:
+            hot, archived = self._querysets()
+            # Both are ordered by -uploaded_at; archived rows are older, so in
+            # practice this is hot rows followed by archived ones.
+            self._result_cache = list(heapq.merge(hot, archived, key=lambda b: b.uploaded_at, reverse=True))
+        return self._result_cache
+
+    def __iter__(self):
+        return iter(self._fetch_all())
+
+    def __getitem__(self, k):
+        if self._result_cache is None and isinstance(k, slice) and k.stop is not None and not k.start and not k.step:
+            # The first n of the union are among the first n of each table.
+            hot, archived = self._querysets()
+            merged = heapq.merge(hot[:k.stop], archived[:k.stop], key=lambda b: b.uploaded_at, reverse=True)
+            return list(merged)[:k.stop]
+        return self._fetch_all()[k]
+
+    def __len__(self):
+        return len(self._fetch_all())
+
+    def count(self):
+        if self._result_cache is not None:
+            return len(self._result_cache)
+        hot, archived = self._querysets()
+        return hot.count() + archived.count()
+
+    def exists(self):
+        if self._result_cache is not None:
+            return bool(self._result_cache)
+        hot, archived = self._querysets()
+        return hot.exists() or archived.exists()
+
+    def get(self, **lookup):
+        try:
+            return Backup.objects.select_related("college").get(**self.filters, **lookup, **VISIBLE)
+        except Backup.DoesNotExist:
+            pass
+        try:
+            return ArchivedBackup.objects.select_related("college").get(**self.filters, **lookup, **VISIBLE)
+        except ArchivedBackup.DoesNotExist:
+            raise Backup.DoesNotExist(f"No backup matches {lookup}")
+
+
+class BackupManager(models.Manager):
+
+    def catalog(self, **filters):
+        """Query the hot table and the archive together (see BackupCatalog)."""
+        return BackupCatalog(**filters)
+
+    @staticmethod
+    def last_backup_time():
+        """College annotation: latest upload, looking in the archive only if the hot table has none."""
+        archived = (
+            ArchivedBackup.objects.filter(college=OuterRef("pk"))
+            .order_by("-uploaded_at")
+            .values("uploaded_at")[:1]
+        )
+        return Coalesce(Max("backups__uploaded_at"), Subquery(archived))
+
+
+class ContentEncoding(models.TextChoices):
+    IDENTITY = "identity", "None"
+    GZIP = "gzip", "gzip"
+    ZSTD = "zstd", "zstd"
+
+
+class ReplicationState(models.TextChoices):
+    PENDING = "pending", "Pending"
+    DONE = "done", "Replicated"
+    FAILED = "failed", "Failed"
+
+
+class BackupRecord(models.Model):
+    """Columns shared by the hot `Backup` table and the `ArchivedBackup` table."""
+    file = models.FileField(upload_to=temp_backup_upload_path, storage=get_backup_storage)
+    volume = models.CharField(
+        max_length=64, blank=True, default="", db_index=True, editable=False,
+        help_text="Storage volume holding the file (empty for MEDIA_ROOT)",
+    )
     file_size = models.BigIntegerField(null=True, blank=True)
     checksum = models.CharField(max_length=64, blank=True, null=True, help_text="SHA256 checksum")
     remarks = models.TextField(blank=True, null=True)
     is_encrypted = models.BooleanField(default=False)
+    content_encoding = models.CharField(
+        max_length=16,
+        choices=ContentEncoding.choices,
+        default=ContentEncoding.IDENTITY,
+        help_text="Compression the dump was uploaded (and is stored) with",
+    )
+    content_size = models.BigIntegerField(null=True, blank=True, help_text="Size of the decompressed dump")
+    wrapped_key = models.CharField(
+        max_length=255, blank=True, null=True, editable=False,
+        help_text="Per-backup data key, encrypted with the master key `key_id`",
+    )
+    key_id = models.CharField(max_length=64, blank=True, null=True, db_index=True, editable=False)
+    tree_hash = models.CharField(
+        max_length=64, blank=True, null=True, editable=False,
+        help_text="SHA256 over the per-segment digests of a segmented (parallel) encrypted file",
+    )
+    pack_offset = models.BigIntegerField(
+        null=True, blank=True, editable=False,
+        help_text="Offset of this backup's entry when `file` is a cold pack file",
+    )
+    pack_length = models.BigIntegerField(null=True, blank=True, editable=False)
+    original_name = models.CharField(
+        max_length=255, blank=True, default="", editable=False,
+        help_text="File name the backup had before it was packed",
+    )
+    manifest = models.JSONField(
+        null=True, blank=True, editable=False,
+        help_text="Tables of the dump with offsets, row estimates and sizes (backups/utils/manifest.py)",
+    )
+    pending_deletion = models.BooleanField(
+        default=False, db_index=True, editable=False,
+        help_text="Hidden and waiting for backups.tasks.purge_deleted_backups",
+    )
+    replication_state = models.CharField(
+        max_length=16, choices=ReplicationState.choices, blank=True, default="", db_index=True, editable=False,
+        help_text="Empty when no replication targets were configured",
+    )
+    replication_status = models.JSONField(
+        default=dict, blank=True, editable=False,
+        help_text="Per-target result of the last replication attempt",
+    )
+
+    is_archived = False
 
     class Meta:
+        abstract = True
         ordering = ["-uploaded_at"]
 
+    @property
+    def is_packed(self):
+        return self.pack_offset is not None
+
+    @property
+    def download_name(self):
+        """File name to serve the decrypted backup under."""
+        return os.path.basename(self.original_name or self.file.name).replace(".enc", "")
+
+    def build_manifest(self):
+        """Compute the manifest from the stored file (for backups uploaded before manifests existed)."""
+        with NamedTemporaryFile(prefix=DECRYPT_PREFIX) as plain:
+            if self.is_encrypted:
+                self.decrypt_to(plain.name)
+                source = plain.name
+            else:
+                source = self.file.path
+            manifest = DumpManifest()
+            with open(source, "rb") as f:
+                chunks = iter(lambda: f.read(settings.BACKUP_HASH_CHUNK_SIZE), b"")
+                digest_stream(chunks, self.content_encoding, sink=manifest.feed)
+        return manifest.finish()
+
+    def decrypt_to(self, output_path):
+        """Write the decrypted file to `output_path`."""
+        if self.is_packed:
+            decrypt_pack_entry(
+                self.file.path, self.pack_offset, self.pack_length, output_path,
+                wrapped_key=self.wrapped_key, key_id=self.key_id, tree_hash=self.tree_hash,
+            )
+            return
+        decrypt_file(
+            self.file.path, output_path,
+            wrapped_key=self.wrapped_key, key_id=self.key_id, tree_hash=self.tree_hash,
+        )
+
+    def __str__(self):
+        return (
+            f"{self.college.code} - {self.uploaded_at.strftime('%Y-%m-%d %H:%M:%S')}"
+            if self.college_id else f"Unassigned Backup ({self.uploaded_at})"
+        )
+
+
+class Backup(BackupRecord):
+    college = models.ForeignKey(College, on_delete=models.CASCADE, related_name="backups")
+    uploaded_at = models.DateTimeField(auto_now_add=True)
+
+    objects = BackupManager()
+
+    class Meta(BackupRecord.Meta):
+        indexes = [models.Index(fields=["college", "checksum"])]
+
     def save(self, *args, **kwargs):
         is_new = self._state.adding
+        replicate = is_new and self.file and settings.BACKUP_REPLICATION_TARGETS
+        if replicate:
+            self.replication_state = ReplicationState.PENDING
         if self.file and not self.file_size:
             self.file_size = self.file.size
+        if self.content_encoding == ContentEncoding.IDENTITY and self.content_size is None:
+            self.content_size = self.file_size
 
         if self.file and not self.checksum:
             sha256 = hashlib.sha256()
-            for chunk in self.file.chunks():
+            for chunk in self.file.chunks(settings.BACKUP_HASH_CHUNK_SIZE):
                 sha256.update(chunk)
             self.checksum = sha256.hexdigest()
 
@@ -39,30 +253,63 @@ class Backup(models.Model):
         if is_new and self.college_id and "temp" in self.file.name:
             timestamp = timezone.now().strftime("%Y-%m-%d_%H-%M-%S")
             filename = os.path.basename(self.file.name)
-            new_path = os.path.join("backups", self.college.code, f"{timestamp}_{filename}")
+            self.volume = backup_storage.volume_of(self.file.name)
+            new_path = backup_storage.join(
+                self.volume, os.path.join("backups", self.college.code, f"{timestamp}_{filename}")
+            )
             old_path = self.file.name
 
             file_content = self.file
-            default_storage.save(new_path, file_content)
-            default_storage.delete(old_path)
+            new_path = backup_storage.save(new_path, file_content)
+            backup_storage.delete(old_path)
 
             self.file.name = new_path
-            super().save(update_fields=["file"])
+            super().save(update_fields=["file", "volume"])
 
             # Encrypt in place (add .enc suffix)
             try:
-                encrypted_path = encrypt_file(self.file.path)
+                wrapped_key, key_id = new_data_key()
+                _, self.tree_hash = encrypt_backup_file(self.file.path, wrapped_key=wrapped_key, key_id=key_id)
                 os.remove(self.file.path)
                 self.file.name = f"{self.file.name}.enc"
                 self.is_encrypted = True
-                super().save(update_fields=["file", "is_encrypted"])
+                self.wrapped_key, self.key_id = wrapped_key, key_id
+                super().save(update_fields=["file", "is_encrypted", "wrapped_key", "key_id", "tree_hash"])
             except Exception as e:
                 import logging
                 logger = logging.getLogger(__name__)
                 logger.error(f"Encryption failed for backup {self.id}: {e}")
 
-    def __str__(self):
-        return (
-            f"{self.college.code} - {self.uploaded_at.strftime('%Y-%m-%d %H:%M:%S')}"
-            if self.college_id else f"Unassigned Backup ({self.uploaded_at})"
-        )
+        if replicate:
+            transaction.on_commit(partial(queue_replication, self.id))
+
+    def find_duplicate(self):
+        """Latest stored backup of this college with the same content, if its file still exists."""
+        size = self.content_size if self.content_size is not None else self.file_size
+        candidates = Backup.objects.filter(
+            Q(content_size=size) | Q(content_size__isnull=True, file_size=size),
+            college_id=self.college_id,
+            checksum=self.checksum,
+            pending_deletion=False,
+        ).exclude(file="").order_by("-uploaded_at")
+        for candidate in candidates[:5]:
+            if backup_storage.exists(candidate.file.name):
+                return candidate
+        return None
+
+
+class ArchivedBackup(BackupRecord):
+    """
+    Backups older than BACKUP_ARCHIVE_AFTER_DAYS, moved here by
+    `backups.tasks.archive_old_backups` so the hot table stays small.
+    Rows keep their original id, so links to a backup survive archiving.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    college = models.ForeignKey(College, on_delete=models.CASCADE, related_name="archived_backups")
+    uploaded_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    is_archived = True
+
+    class Meta(BackupRecord.Meta):
+        indexes = [models.Index(fields=["college", "-uploaded_at"])]
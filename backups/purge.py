@@ -0,0 +1,117 @@
+"""
+Deleting colleges and backups in the background.
+
+Deleting a college used to cascade to all its backup rows in one
+transaction and left every file on disk. Now `request_college_purge` and
+`request_backup_purge` only mark the rows `pending_deletion` (and revoke
+the college's API key), which is instant. Marked rows drop out of the
+views and the upload deduplication right away. The `purge_deleted_backups`
+task then deletes them in batches of BACKUP_PURGE_BATCH_SIZE, each in its
+own short transaction, so no long locks are held.
+
+After each batch, a file is removed only once no Backup or ArchivedBackup
+row refers to it any more. A deduplicated file or a cold pack file shared
+with rows that are kept stays on disk. Files are removed on
+BACKUP_PURGE_WORKERS threads. A college is deleted last, once none of its
+rows are left, together with its "backups/<code>/" directories on every
+volume.
+"""
+import logging
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from .cleanup import media_roots, referenced_names
+from .storage import backup_storage
+
+logger = logging.getLogger(__name__)
+
+
+def queue_purge():
+    """Queue the purge task; a broker outage is left to the periodic run."""
+    from .tasks import purge_deleted_backups
+
+    try:
+        purge_deleted_backups.delay()
+    except Exception as e:
+        logger.warning(f"Could not queue the backup purge; the periodic run will pick it up: {e}")
+
+
+def request_backup_purge(queryset):
+    """Mark the backups in `queryset` for deletion; returns how many were marked."""
+    marked = queryset.filter(pending_deletion=False).update(pending_deletion=True)
+    transaction.on_commit(queue_purge)
+    return marked
+
+
+def request_college_purge(college):
+    """Mark `college` for deletion and revoke its API key."""
+    from colleges.models import College
+    from rest_framework_api_key.models import APIKey
+    from users.auth_cache import invalidate_college
+
+    College.objects.filter(id=college.id).update(pending_deletion=True)
+    college.pending_deletion = True
+    # update() sends no post_save, so the users' cached snapshots are dropped here,
+    # once the change is visible to the requests that would cache them again.
+    transaction.on_commit(partial(invalidate_college, college.id))
+    if college.api_key_id:
+        APIKey.objects.filter(id=college.api_key_id).update(revoked=True)
+    transaction.on_commit(queue_purge)
+
+
+def _remove(name):
+    try:
+        size = backup_storage.size(name)
+        backup_storage.delete(name)
+    except FileNotFoundError:
+        return 0
+    return size
+
+
+def purge_batch(model, batch_size):
+    """Delete up to `batch_size` marked rows of `model` and the files left unreferenced; returns (rows, bytes)."""
+    marked = Q(pending_deletion=True) | Q(college__pending_deletion=True)
+    with transaction.atomic():
+        rows = list(
+            model.objects.filter(marked).order_by("id")
+            .select_for_update(skip_locked=True, of=("self",))
+            .values_list("id", "file")[:batch_size]
+        )
+        if not rows:
+            return 0, 0
+        model.objects.filter(id__in=[row_id for row_id, _ in rows]).delete()
+
+    names = {name for _, name in rows if name}
+    unreferenced = names - referenced_names(names)
+    with ThreadPoolExecutor(max_workers=settings.BACKUP_PURGE_WORKERS) as pool:
+        freed = sum(pool.map(_remove, unreferenced))
+    return len(rows), freed
+
+
+def purge_college(college):
+    """Remove the directories of a college whose rows are all gone, then the college; returns the bytes freed."""
+    from rest_framework_api_key.models import APIKey
+
+    paths = [os.path.join(location, "backups", college.code) for _, location in media_roots()]
+    paths = [path for path in paths if os.path.isdir(path)]
+
+    def remove_tree(path):
+        size = sum(
+            os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(path) for name in files
+        )
+        shutil.rmtree(path, ignore_errors=True)
+        return size
+
+    with ThreadPoolExecutor(max_workers=settings.BACKUP_PURGE_WORKERS) as pool:
+        freed = sum(pool.map(remove_tree, paths))
+    api_key_id = college.api_key_id
+    college.delete()
+    if api_key_id:
+        APIKey.objects.filter(id=api_key_id).delete()
+    return freed
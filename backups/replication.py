@@ -0,0 +1,220 @@
+"""
+Replication of backup files to secondary targets.
+
+Targets are configured as BACKUP_REPLICATION_TARGETS, "name=url,...":
+
+    nas=file:///mnt/nas/checkmate          a directory, e.g. an NFS mount
+    offsite=s3://bucket/checkmate          S3 or an S3-compatible endpoint
+                                           (BACKUP_REPLICATION_S3_ENDPOINT)
+
+S3 targets need the optional `boto3` package; credentials come from the
+usual AWS environment variables.
+
+A new backup is marked pending and queued on the `replication` queue once
+its row is committed. The upload request never waits for a copy, and a
+broker outage only delays replication: `replicate_pending_backups` runs
+periodically and requeues what is left. Each backup is sent to its targets
+in parallel. Reads of the local file are throttled to
+BACKUP_REPLICATION_BANDWIDTH bytes/s per worker process. A failed target is
+retried with exponential backoff. Per-target results are kept in
+`replication_status` on the row.
+
+Files are stored on the target under their name without the volume prefix
+(see backups/storage.py), so rebalancing volumes does not copy them again.
+"""
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from urllib.parse import urlparse
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+
+from monitoring.metrics import REPLICATION_BYTES, REPLICATIONS
+from .storage import backup_storage
+
+try:
+    import boto3
+    from boto3.s3.transfer import TransferConfig
+    from botocore.exceptions import ClientError
+except ImportError:  # optional dependency
+    boto3 = None
+
+logger = logging.getLogger(__name__)
+
+READ_SIZE = 1024 * 1024
+
+
+class Throttle:
+    """Caps the combined read rate of every transfer in this process."""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self._free_at = 0.0
+        self._lock = threading.Lock()
+
+    def consume(self, size):
+        if not self.rate or not size:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(self._free_at, now)
+            self._free_at = start + size / self.rate
+        time.sleep(max(0.0, self._free_at - now))
+
+
+class ThrottledReader:
+
+    def __init__(self, fileobj, throttle):
+        self._f = fileobj
+        self._throttle = throttle
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            return b"".join(iter(lambda: self.read(READ_SIZE), b""))
+        data = self._f.read(min(size, READ_SIZE))
+        self._throttle.consume(len(data))
+        return data
+
+
+class DirectoryTarget:
+
+    def __init__(self, name, root):
+        self.name = name
+        self.root = root
+
+    def _path(self, key):
+        return os.path.join(self.root, key)
+
+    def exists(self, key, size):
+        try:
+            return os.path.getsize(self._path(key)) == size
+        except OSError:
+            return False
+
+    def put(self, key, fileobj, size):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        partial = f"{path}.{uuid.uuid4().hex}.part"
+        with open(partial, "wb") as out:
+            for chunk in iter(lambda: fileobj.read(READ_SIZE), b""):
+                out.write(chunk)
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(partial, path)
+
+
+class S3Target:
+
+    def __init__(self, name, bucket, prefix):
+        if boto3 is None:
+            raise ImproperlyConfigured(f"Replication target '{name}' needs the boto3 package.")
+        self.name = name
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.client = boto3.client("s3", endpoint_url=settings.BACKUP_REPLICATION_S3_ENDPOINT or None)
+        self.config = TransferConfig(max_concurrency=settings.BACKUP_REPLICATION_S3_CONCURRENCY)
+
+    def _key(self, key):
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def exists(self, key, size):
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self._key(key))["ContentLength"] == size
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def put(self, key, fileobj, size):
+        # Multipart upload with parts sent on max_concurrency threads.
+        self.client.upload_fileobj(fileobj, self.bucket, self._key(key), Config=self.config)
+
+
+def build_target(name, url):
+    parsed = urlparse(url)
+    if parsed.scheme == "file":
+        return DirectoryTarget(name, parsed.path)
+    if parsed.scheme == "s3":
+        return S3Target(name, parsed.netloc, parsed.path)
+    raise ImproperlyConfigured(f"Unsupported replication target '{name}': {url}")
+
+
+@lru_cache(maxsize=4)
+def _targets(config):
+    return {name: build_target(name, url) for name, url in config}
+
+
+def get_targets():
+    return _targets(tuple(settings.BACKUP_REPLICATION_TARGETS.items()))
+
+
+@lru_cache(maxsize=1)
+def _throttle(rate):
+    return Throttle(rate)
+
+
+def replica_key(name):
+    volume = backup_storage.volume_of(name)
+    return name[len(volume) + 1:] if volume else name
+
+
+def _transfer(target, backup):
+    """Copy `backup`'s file to `target`; returns the bytes sent (0 if it was already there)."""
+    key = replica_key(backup.file.name)
+    size = backup_storage.size(backup.file.name)
+    if target.exists(key, size):
+        return 0
+    with backup_storage.open(backup.file.name) as f:
+        target.put(key, ThrottledReader(f, _throttle(settings.BACKUP_REPLICATION_BANDWIDTH)), size)
+    return size
+
+
+def replicate(backup, names=None):
+    """
+    Send `backup` to the configured targets (or only to `names`), in parallel,
+    and record the outcome on the row. Returns the names of the targets that failed.
+    """
+    from .models import ReplicationState
+
+    targets = {name: t for name, t in get_targets().items() if names is None or name in names}
+    status = dict(backup.replication_status or {})
+    failed = []
+    with ThreadPoolExecutor(max_workers=max(1, len(targets))) as pool:
+        futures = {name: pool.submit(_transfer, target, backup) for name, target in targets.items()}
+        for name, future in futures.items():
+            entry = {"attempts": status.get(name, {}).get("attempts", 0) + 1, "at": timezone.now().isoformat()}
+            try:
+                sent = future.result()
+            except Exception as e:
+                logger.warning(f"Replication of backup {backup.id} to {name} failed: {e}")
+                REPLICATIONS.labels(target=name, result="failed").inc()
+                entry.update(state=ReplicationState.FAILED, error=str(e)[:500])
+                failed.append(name)
+            else:
+                REPLICATIONS.labels(target=name, result="copied" if sent else "present").inc()
+                REPLICATION_BYTES.labels(target=name).inc(sent)
+                entry.update(state=ReplicationState.DONE)
+            status[name] = entry
+
+    backup.replication_status = status
+    backup.replication_state = ReplicationState.DONE if not failed else ReplicationState.PENDING
+    type(backup).objects.filter(id=backup.id).update(
+        replication_status=status, replication_state=backup.replication_state,
+    )
+    return failed
+
+
+def queue_replication(backup_id):
+    """Queue replication of a committed backup; a broker outage is left to the periodic sweep."""
+    from .tasks import replicate_backup
+
+    try:
+        replicate_backup.delay(backup_id)
+    except Exception as e:
+        logger.warning(f"Could not queue replication of backup {backup_id}; it stays pending: {e}")
@@ -0,0 +1,215 @@
+"""
+Nightly upload scheduling.
+
+Colleges ask for their upload slot before they push a dump. The night's
+window (UPLOAD_WINDOW_START_HOUR for UPLOAD_WINDOW_HOURS) is cut into
+UPLOAD_SLOT_MINUTES slots. Each college's dump size is predicted from the
+median `file_size` of its recent backups, and its transfer time from
+UPLOAD_EXPECTED_THROUGHPUT. Colleges are then placed largest first at the
+start slot that keeps the peak number of concurrent uploads lowest,
+preferring the time they usually upload at (taken from `uploaded_at`).
+
+The plan for a night is built once and cached, so every college gets an
+answer consistent with everyone else's. A college that is not in the cached
+plan yet is placed into its free capacity without moving anyone else.
+"""
+import math
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+from statistics import median
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from colleges.models import College
+from .models import Backup
+
+
+@dataclass
+class Assignment:
+    college_id: int
+    code: str
+    name: str
+    start: object
+    end: object
+    predicted_bytes: int
+    predicted_seconds: int
+
+
+@dataclass
+class Plan:
+    night_start: object
+    slot_seconds: int
+    assignments: dict  # college_id -> Assignment
+    planned_load: list  # concurrent uploads per slot
+    usual_load: list  # concurrent uploads per slot if everyone kept their usual time
+
+    def slot_start(self, index):
+        return self.night_start + timedelta(seconds=index * self.slot_seconds)
+
+    @property
+    def curve(self):
+        return [
+            (self.slot_start(i), planned, usual)
+            for i, (planned, usual) in enumerate(zip(self.planned_load, self.usual_load))
+        ]
+
+
+def window_seconds():
+    return settings.UPLOAD_WINDOW_HOURS * 60 * 60
+
+
+def night_start_for(now=None):
+    """Start of the window that is in progress or comes next."""
+    local = timezone.localtime(now)
+    start = local.replace(hour=settings.UPLOAD_WINDOW_START_HOUR, minute=0, second=0, microsecond=0)
+    start -= timedelta(days=1)
+    while start + timedelta(seconds=window_seconds()) <= local:
+        start += timedelta(days=1)
+    return start
+
+
+def upload_history(since, college_ids=None):
+    """{college_id: (median size, usual offset into the window in seconds or None)}."""
+    start_offset = settings.UPLOAD_WINDOW_START_HOUR * 60 * 60
+    sizes, offsets = {}, {}
+    rows = Backup.objects.filter(uploaded_at__gte=since)
+    if college_ids is not None:
+        rows = rows.filter(college_id__in=college_ids)
+    rows = rows.order_by().values_list("college_id", "file_size", "uploaded_at")
+    for college_id, file_size, uploaded_at in rows.iterator():
+        if file_size:
+            sizes.setdefault(college_id, []).append(file_size)
+        local = timezone.localtime(uploaded_at)
+        offset = (local.hour * 3600 + local.minute * 60 + local.second - start_offset) % 86400
+        if offset < window_seconds():
+            offsets.setdefault(college_id, []).append(offset)
+
+    return {
+        college_id: (
+            int(median(sizes[college_id])) if college_id in sizes else None,
+            int(median(offsets[college_id])) if college_id in offsets else None,
+        )
+        for college_id in set(sizes) | set(offsets)
+    }
+
+
+def _job(college_id, code, name, history, n_slots, slot_seconds):
+    size, usual_offset = history.get(college_id, (None, None))
+    size = size or settings.UPLOAD_DEFAULT_BYTES
+    seconds = math.ceil(size / settings.UPLOAD_EXPECTED_THROUGHPUT)
+    length = min(n_slots, max(1, math.ceil(seconds / slot_seconds)))
+    usual = None if usual_offset is None else min(usual_offset // slot_seconds, n_slots - length)
+    return (length, size, seconds, usual, college_id, code, name)
+
+
+def _place(plan, job):
+    """Assign `job` the start slot with the lowest peak load, leaving the rest of `plan` alone."""
+    length, size, seconds, usual, college_id, code, name = job
+    planned = plan.planned_load
+    best = min(
+        range(len(planned) - length + 1),
+        key=lambda s: (max(planned[s:s + length]), abs(s - usual) if usual is not None else 0, s),
+    )
+    for i in range(best, best + length):
+        planned[i] += 1
+    usual_start = best if usual is None else usual
+    for i in range(usual_start, usual_start + length):
+        plan.usual_load[i] += 1
+
+    start = plan.slot_start(best)
+    plan.assignments[college_id] = Assignment(
+        college_id=college_id,
+        code=code,
+        name=name,
+        start=start,
+        end=start + timedelta(seconds=length * plan.slot_seconds),
+        predicted_bytes=size,
+        predicted_seconds=seconds,
+    )
+
+
+def _history_since(night_start):
+    return night_start - timedelta(days=settings.UPLOAD_HISTORY_DAYS)
+
+
+def build_plan(night_start):
+    slot_seconds = settings.UPLOAD_SLOT_MINUTES * 60
+    n_slots = max(1, window_seconds() // slot_seconds)
+    history = upload_history(_history_since(night_start))
+
+    jobs = [
+        _job(college_id, code, name, history, n_slots, slot_seconds)
+        for college_id, code, name in College.objects.filter(pending_deletion=False).values_list("id", "code", "name")
+    ]
+
+    plan = Plan(night_start, slot_seconds, {}, [0] * n_slots, [0] * n_slots)
+    # Longest first: the big dumps are the hardest to fit.
+    for job in sorted(jobs, key=lambda j: (-j[0], -j[1], j[4])):
+        _place(plan, job)
+    return plan
+
+
+def plan_cache_key(night_start):
+    return f"upload-schedule:{night_start.isoformat()}"
+
+
+def _plan_timeout(night_start):
+    # Kept until the night is over.
+    return max(60, int((night_start - timezone.now()).total_seconds()) + window_seconds())
+
+
+def get_plan(night_start):
+    key = plan_cache_key(night_start)
+    plan = cache.get(key)
+    if plan is None:
+        plan = build_plan(night_start)
+        cache.set(key, plan, _plan_timeout(night_start))
+    return plan
+
+
+def add_to_plan(night_start, college):
+    """
+    Place `college` into the cached plan for `night_start` and write it back.
+
+    Assignments already handed out keep their slots. The read-modify-write
+    is done under a short cache lock so two new colleges asking at once
+    don't overwrite each other's placement.
+    """
+    key = plan_cache_key(night_start)
+    lock = f"{key}:lock"
+    locked = False
+    for _ in range(50):
+        locked = cache.add(lock, 1, 10)
+        if locked:
+            break
+        time.sleep(0.1)
+    try:
+        plan = get_plan(night_start)
+        if college.id not in plan.assignments:
+            history = upload_history(_history_since(night_start), college_ids=[college.id])
+            _place(plan, _job(
+                college.id, college.code, college.name, history, len(plan.planned_load), plan.slot_seconds,
+            ))
+            cache.set(key, plan, _plan_timeout(night_start))
+        return plan
+    finally:
+        if locked:
+            cache.delete(lock)
+
+
+def next_window(college, now=None):
+    """Return the Assignment for `college`'s next upload that has not already passed."""
+    now = now or timezone.now()
+    night_start = night_start_for(now)
+    for _ in range(2):
+        plan = get_plan(night_start)
+        if college.id not in plan.assignments:
+            plan = add_to_plan(night_start, college)
+        assignment = plan.assignments[college.id]
+        if assignment.end > now:
+            return assignment
+        night_start += timedelta(days=1)
+    return assignment
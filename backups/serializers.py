@@ -1,18 +1,44 @@
+from django.conf import settings
 from rest_framework import serializers
 from .models import Backup
-import hashlib
+from .utils.compression import CorruptStreamError, digest_stream, supported_encodings
+from .utils.manifest import DumpManifest
+
 
 class BackupUploadSerializer(serializers.ModelSerializer):
     class Meta:
         model = Backup
-        fields = ['file', 'remarks']
+        fields = ['file', 'remarks', 'content_encoding']
+
+    def validate_content_encoding(self, value):
+        if value not in supported_encodings():
+            raise serializers.ValidationError(f"This server does not accept '{value}' uploads.")
+        return value
 
-    def create(self, validated_data):
-        file_obj = validated_data['file']
+    def validate(self, attrs):
+        # Decompress once while hashing: proves the stream is intact and keeps
+        # the checksum comparable across encodings. The stored bytes stay as sent.
+        # The same pass builds the dump's manifest.
+        file_obj = attrs['file']
+        file_obj.seek(0)
+        manifest = DumpManifest()
+        try:
+            attrs['checksum'], attrs['content_size'] = digest_stream(
+                file_obj.chunks(settings.BACKUP_HASH_CHUNK_SIZE), attrs.get('content_encoding', 'identity'),
+                sink=manifest.feed, max_size=settings.BACKUP_MAX_CONTENT_SIZE,
+            )
+        except CorruptStreamError as e:
+            raise serializers.ValidationError({'file': str(e)})
+        attrs['manifest'] = manifest.finish()
         file_obj.seek(0)
-        sha256 = hashlib.sha256()
-        for chunk in file_obj.chunks():
-            sha256.update(chunk)
-        validated_data['checksum'] = sha256.hexdigest()
-        validated_data['file_size'] = file_obj.size
-        return super().create(validated_data)
+        attrs['file_size'] = file_obj.size
+        return attrs
+
+
+class BackupPrecheckSerializer(serializers.Serializer):
+    size = serializers.IntegerField(min_value=0)
+    sha256 = serializers.RegexField(r"^[0-9a-fA-F]{64}$")
+    remarks = serializers.CharField(required=False, allow_blank=True)
+
+    def validate_sha256(self, value):
+        return value.lower()
@@ -0,0 +1,146 @@
+"""
+Backup files spread over several disks.
+
+Extra volumes are configured as BACKUP_VOLUMES, e.g.
+"disk1:/mnt/disk1,disk2:/mnt/disk2". Every college is placed on one volume
+by consistent hashing of its code. Adding a volume therefore moves only the
+colleges that now hash to it, about 1/n of them; the rest stay put.
+
+A file on a volume is stored under a name that starts with the volume,
+e.g. "disk2/backups/C0001/<file>.enc". Its path is resolved from that
+prefix. Names without a volume prefix (everything stored before volumes
+were configured) stay under MEDIA_ROOT. The volume is also recorded on the
+Backup row, so `manage.py rebalance_backups` can find misplaced files.
+"""
+import bisect
+import hashlib
+from functools import cached_property
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.storage import FileSystemStorage, Storage
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.deconstruct import deconstructible
+
+RESERVED_VOLUME_NAMES = {"backups"}
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.sha1(key.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """Consistent hash ring with `vnodes` points per volume."""
+
+    def __init__(self, volumes, vnodes=64):
+        points = sorted((_hash(f"{volume}#{i}"), volume) for volume in volumes for i in range(vnodes))
+        self._hashes = [h for h, _ in points]
+        self._volumes = [v for _, v in points]
+
+    def __bool__(self):
+        return bool(self._volumes)
+
+    def volume_for(self, key):
+        index = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._volumes[index]
+
+
+@deconstructible
+class ShardedStorage(Storage):
+    """FileSystemStorage per volume, chosen by the first component of the file name."""
+
+    @cached_property
+    def _legacy(self):
+        return FileSystemStorage()
+
+    @cached_property
+    def _volumes(self):
+        volumes = {}
+        for name, location in settings.BACKUP_VOLUMES.items():
+            if not name or "/" in name or name in RESERVED_VOLUME_NAMES:
+                raise ImproperlyConfigured(f"Invalid backup volume name '{name}'.")
+            volumes[name] = FileSystemStorage(location=location)
+        return volumes
+
+    @cached_property
+    def ring(self):
+        return HashRing(self._volumes, settings.BACKUP_VOLUME_VNODES)
+
+    def reset(self):
+        for attr in ("_volumes", "ring"):
+            self.__dict__.pop(attr, None)
+
+    @staticmethod
+    def volume_of(name):
+        """Volume encoded in a stored file name ("" for MEDIA_ROOT)."""
+        head, sep, _ = name.partition("/")
+        return head if sep and head in settings.BACKUP_VOLUMES else ""
+
+    def _route(self, name):
+        volume = self.volume_of(name)
+        if not volume:
+            return self._legacy, "", name
+        return self._volumes[volume], volume, name[len(volume) + 1:]
+
+    def volume_for_college(self, code):
+        """Volume new files of college `code` belong on ("" when no volumes are configured)."""
+        return self.ring.volume_for(code) if self.ring else ""
+
+    @staticmethod
+    def join(volume, name):
+        return f"{volume}/{name}" if volume else name
+
+    def _open(self, name, mode="rb"):
+        storage, _, rest = self._route(name)
+        return storage.open(rest, mode)
+
+    def _save(self, name, content):
+        storage, volume, rest = self._route(name)
+        return self.join(volume, storage.save(rest, content))
+
+    def get_available_name(self, name, max_length=None):
+        storage, volume, rest = self._route(name)
+        if max_length is not None and volume:
+            max_length -= len(volume) + 1
+        return self.join(volume, storage.get_available_name(rest, max_length=max_length))
+
+    def delete(self, name):
+        storage, _, rest = self._route(name)
+        storage.delete(rest)
+
+    def exists(self, name):
+        storage, _, rest = self._route(name)
+        return storage.exists(rest)
+
+    def listdir(self, path):
+        storage, _, rest = self._route(path)
+        return storage.listdir(rest)
+
+    def size(self, name):
+        storage, _, rest = self._route(name)
+        return storage.size(rest)
+
+    def path(self, name):
+        storage, _, rest = self._route(name)
+        return storage.path(rest)
+
+    def url(self, name):
+        return self._legacy.url(name)
+
+    def get_modified_time(self, name):
+        storage, _, rest = self._route(name)
+        return storage.get_modified_time(rest)
+
+
+backup_storage = ShardedStorage()
+
+
+def get_backup_storage():
+    return backup_storage
+
+
+@receiver(setting_changed)
+def _reset_volumes(setting, **kwargs):
+    if setting in ("BACKUP_VOLUMES", "BACKUP_VOLUME_VNODES"):
+        backup_storage.reset()
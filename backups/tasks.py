@@ -0,0 +1,247 @@
+# backups/tasks.py
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from celery import shared_task
+from celery.utils.time import get_exponential_backoff_interval
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+ARCHIVED_FIELDS = (
+    "id", "college_id", "file", "uploaded_at", "file_size", "checksum", "remarks", "is_encrypted",
+    "content_encoding", "content_size", "wrapped_key", "key_id", "tree_hash", "volume",
+    "replication_state", "replication_status", "pack_offset", "pack_length", "original_name", "pending_deletion",
+    "manifest",
+)
+
+
+def archive_batch(cutoff, batch_size):
+    """Move up to `batch_size` backups uploaded before `cutoff` to the archive; returns how many moved."""
+    from .models import ArchivedBackup, Backup
+
+    with transaction.atomic():
+        rows = list(
+            Backup.objects.filter(uploaded_at__lt=cutoff)
+            .order_by("id")
+            .select_for_update(skip_locked=True)
+            .values(*ARCHIVED_FIELDS)[:batch_size]
+        )
+        if not rows:
+            return 0
+        ArchivedBackup.objects.bulk_create([ArchivedBackup(**row) for row in rows], batch_size=batch_size)
+        Backup.objects.filter(id__in=[row["id"] for row in rows]).delete()
+    return len(rows)
+
+
+@shared_task(ignore_result=True)
+def archive_old_backups():
+    """Move backups older than BACKUP_ARCHIVE_AFTER_DAYS out of the hot table, in batches."""
+    cutoff = timezone.now() - timedelta(days=settings.BACKUP_ARCHIVE_AFTER_DAYS)
+    deadline = time.monotonic() + settings.BACKUP_ARCHIVE_MAX_SECONDS
+    moved = 0
+    while time.monotonic() < deadline:
+        count = archive_batch(cutoff, settings.BACKUP_ARCHIVE_BATCH_SIZE)
+        moved += count
+        if count < settings.BACKUP_ARCHIVE_BATCH_SIZE:
+            break
+    logger.info(f"Archived {moved} backups uploaded before {cutoff:%Y-%m-%d}")
+    return moved
+
+
+def misplaced_files():
+    """{file name: target volume} for stored files whose college now hashes to another volume."""
+    from colleges.models import College
+    from .models import ArchivedBackup, Backup
+    from .storage import backup_storage
+    from .tiering import pack_volume
+
+    if not backup_storage.ring:
+        return {}
+    targets, pack_targets = {}, {}
+    for college_id, code in College.objects.values_list("id", "code"):
+        targets[college_id] = backup_storage.volume_for_college(code)
+        pack_targets[college_id] = pack_volume(code)
+    misplaced = {}
+    for model in (Backup, ArchivedBackup):
+        rows = model.objects.exclude(file="").order_by().values_list(
+            "college_id", "file", "volume", "pack_offset",
+        ).distinct()
+        for college_id, name, volume, pack_offset in rows.iterator():
+            target = pack_targets[college_id] if pack_offset is not None else targets[college_id]
+            if volume != target:
+                misplaced[name] = target
+    return misplaced
+
+
+def copy_to_volume(name, volume):
+    """Copy stored file `name` to `volume`; returns the new name, or None if the file is missing."""
+    from .storage import backup_storage
+
+    source = backup_storage.volume_of(name)
+    target = backup_storage.join(volume, name[len(source) + 1:] if source else name)
+    if not backup_storage.exists(name):
+        return None
+    # A copy left by an interrupted run is reused.
+    if backup_storage.exists(target) and backup_storage.size(target) == backup_storage.size(name):
+        return target
+    with backup_storage.open(name) as src:
+        return backup_storage.save(target, src)
+
+
+@shared_task(ignore_result=True)
+def rebalance_backup_volumes():
+    """Move backup files onto the volume their college hashes to, e.g. after BACKUP_VOLUMES grew."""
+    from .models import ArchivedBackup, Backup
+    from .storage import backup_storage
+
+    misplaced = misplaced_files()
+    moved = missing = 0
+    with ThreadPoolExecutor(max_workers=settings.BACKUP_REBALANCE_WORKERS) as pool:
+        copies = pool.map(lambda item: copy_to_volume(*item), misplaced.items())
+        for (name, volume), new_name in zip(misplaced.items(), copies):
+            if new_name is None:
+                logger.warning(f"Backup file {name} is missing; left where it is")
+                missing += 1
+                continue
+            # Rows sharing a deduplicated file move together.
+            with transaction.atomic():
+                for model in (Backup, ArchivedBackup):
+                    model.objects.filter(file=name).update(file=new_name, volume=volume)
+            backup_storage.delete(name)
+            moved += 1
+    logger.info(f"Rebalanced backup volumes: {moved} files moved, {missing} missing")
+    return moved
+
+
+@shared_task(bind=True, ignore_result=True, max_retries=None)
+def replicate_backup(self, backup_id, targets=None):
+    """Copy one backup to the replication targets; failed targets are retried with backoff."""
+    from .models import Backup, ReplicationState
+    from . import replication
+
+    try:
+        backup = Backup.objects.catalog().get(id=backup_id)
+    except Backup.DoesNotExist:
+        return
+    if not backup.file:
+        return
+
+    failed = replication.replicate(backup, targets)
+    if not failed:
+        return
+    if self.request.retries >= settings.BACKUP_REPLICATION_MAX_RETRIES:
+        type(backup).objects.filter(id=backup.id).update(replication_state=ReplicationState.FAILED)
+        logger.error(f"Giving up replicating backup {backup.id} to {', '.join(failed)}")
+        return
+    countdown = get_exponential_backoff_interval(
+        settings.BACKUP_REPLICATION_RETRY_BACKOFF, self.request.retries,
+        settings.BACKUP_REPLICATION_RETRY_BACKOFF_MAX, full_jitter=True,
+    )
+    raise self.retry(kwargs={"backup_id": backup_id, "targets": failed}, countdown=countdown)
+
+
+@shared_task(ignore_result=True)
+def replicate_pending_backups():
+    """Requeue backups whose replication failed or whose task was lost (e.g. broker outage)."""
+    from .models import ArchivedBackup, Backup, ReplicationState
+    from .replication import queue_replication
+
+    if not settings.BACKUP_REPLICATION_TARGETS:
+        return 0
+    stale = timezone.now() - timedelta(minutes=settings.BACKUP_REPLICATION_STALE_MINUTES)
+    due = Q(replication_state=ReplicationState.FAILED) | Q(replication_state=ReplicationState.PENDING, uploaded_at__lt=stale)
+    queued = 0
+    for model in (Backup, ArchivedBackup):
+        ids = list(model.objects.filter(due).order_by("uploaded_at").values_list("id", flat=True)[
+            :settings.BACKUP_REPLICATION_SWEEP_BATCH - queued
+        ])
+        if ids:
+            model.objects.filter(id__in=ids).update(replication_state=ReplicationState.PENDING)
+        for backup_id in ids:
+            queue_replication(backup_id)
+        queued += len(ids)
+    logger.info(f"Requeued replication of {queued} backups")
+    return queued
+
+
+@shared_task(ignore_result=True)
+def pack_old_backups():
+    """Move backups older than BACKUP_PACK_AFTER_DAYS into per-college cold pack files."""
+    from colleges.models import College
+    from .models import ArchivedBackup, Backup
+    from .tiering import pack_college
+
+    cutoff = timezone.now() - timedelta(days=settings.BACKUP_PACK_AFTER_DAYS)
+    deadline = time.monotonic() + settings.BACKUP_PACK_MAX_SECONDS
+    college_ids = set()
+    for model in (Backup, ArchivedBackup):
+        college_ids.update(
+            model.objects.filter(uploaded_at__lt=cutoff, pack_offset__isnull=True)
+            .exclude(file="").order_by().values_list("college_id", flat=True).distinct()
+        )
+
+    packed = before = after = 0
+    for college in College.objects.filter(id__in=college_ids).order_by("id"):
+        if time.monotonic() >= deadline:
+            logger.info("Packing stopped at its time limit; the rest is left for the next run")
+            break
+        files, size_before, size_after = pack_college(college, cutoff)
+        packed += files
+        before += size_before
+        after += size_after
+    logger.info(f"Packed {packed} backup files uploaded before {cutoff:%Y-%m-%d}: {before} → {after} bytes")
+    return packed
+
+
+@shared_task(ignore_result=True)
+def collect_backup_garbage():
+    """Quarantine (or delete) backup files no row refers to; see backups/cleanup.py."""
+    from .cleanup import collect_garbage
+
+    report = collect_garbage()
+    logger.info(
+        f"Backup garbage collection: {report.scanned} files scanned, {len(report.orphans)} orphans "
+        f"({report.orphan_bytes} bytes), {report.temp_files} temp files, "
+        f"{report.quarantined_bytes} bytes quarantined, {report.reclaimed_bytes} bytes reclaimed"
+    )
+    return report.reclaimed_bytes
+
+
+@shared_task(ignore_result=True)
+def purge_deleted_backups():
+    """Delete backups and colleges marked for deletion, in batches; see backups/purge.py."""
+    from colleges.models import College
+    from .models import ArchivedBackup, Backup
+    from .purge import purge_batch, purge_college, queue_purge
+
+    deadline = time.monotonic() + settings.BACKUP_PURGE_MAX_SECONDS
+    rows = freed = colleges = 0
+    finished = False
+    while time.monotonic() < deadline:
+        deleted = 0
+        for model in (Backup, ArchivedBackup):
+            count, size = purge_batch(model, settings.BACKUP_PURGE_BATCH_SIZE)
+            deleted += count
+            freed += size
+        rows += deleted
+        if not deleted:
+            finished = True
+            break
+
+    if finished:
+        for college in College.objects.filter(pending_deletion=True):
+            # Rows another run still holds are left for that run.
+            if college.backups.exists() or college.archived_backups.exists():
+                continue
+            freed += purge_college(college)
+            colleges += 1
+    logger.info(f"Purged {rows} backups and {colleges} colleges, {freed} bytes freed")
+    if not finished:
+        queue_purge()
+    return rows
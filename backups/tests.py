@@ -1,3 +1,1055 @@
-from django.test import TestCase
+import gzip
+import hashlib
+import os
+import shutil
+from io import StringIO
+from tempfile import NamedTemporaryFile, mkdtemp
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from cryptography.fernet import Fernet
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+from checkmate_central.testing import QueryBudgetTestCase
+from .admission import SLOTS_KEY, Admission, UploadGate
+from colleges.models import College
+from rest_framework_api_key.models import APIKey
+from .cleanup import DECRYPT_PREFIX, QUARANTINE_DIR, collect_garbage
+from .utils import compression, encryption
+from .utils.manifest import DumpManifest
+from . import scheduling
+from .models import ArchivedBackup, Backup, ReplicationState
+from .purge import request_college_purge
+from .replication import Throttle
+from .storage import HashRing, backup_storage
+from .tasks import (
+    archive_old_backups, pack_old_backups, purge_deleted_backups, replicate_backup, replicate_pending_backups,
+)
+
+
+class BackupViewQueryBudgetTests(QueryBudgetTestCase):
+
+    def test_upload(self):
+        def upload():
+            return self.client.post(
+                reverse("backups:backup-upload"),
+                {"file": SimpleUploadedFile("dump.sql", b"CREATE TABLE t (id INT);\n")},
+                HTTP_AUTHORIZATION=f"Api-Key {self.api_key}",
+            )
+        self.assertQueryBudget(6, upload)
+
+    def test_precheck(self):
+        self.assertQueryBudget(4, lambda: self.client.post(
+            reverse("backups:backup-precheck"),
+            {"size": 10, "sha256": "0" * 64},
+            HTTP_AUTHORIZATION=f"Api-Key {self.api_key}",
+        ))
+
+    def uncached(self, fn):
+        """Drop the cached upload plan so the request has to build it."""
+        def call():
+            cache.delete(scheduling.plan_cache_key(scheduling.night_start_for()))
+            return fn()
+        return call
+
+    def test_schedule(self):
+        self.assertQueryBudget(5, self.uncached(lambda: self.client.get(
+            reverse("backups:backup-schedule"), HTTP_AUTHORIZATION=f"Api-Key {self.api_key}"
+        )))
+
+    def test_upload_schedule_page(self):
+        self.login(self.staff)
+        self.assertQueryBudget(2, self.uncached(lambda: self.client.get(reverse("backups:upload_schedule"))))
+
+    def test_backup_list(self):
+        self.login(self.staff)
+        self.assertQueryBudget(1, lambda: self.client.get(reverse("backups:backup_list")))
+
+    def test_college_backup_list(self):
+        self.login(self.staff)
+        self.assertQueryBudget(3, lambda: self.client.get(
+            reverse("backups:college_backup_list", args=[self.college.id])
+        ))
+
+    def test_college_backup_list_filtered(self):
+        self.login(self.college_user)
+        self.assertQueryBudget(3, lambda: self.client.get(
+            reverse("backups:college_backup_list", args=[self.college.id]),
+            {"start_date": "2000-01-01", "end_date": "2100-01-01"},
+        ))
+
+    def test_college_backup_zip_download(self):
+        self.login(self.staff)
+        self.assertQueryBudget(4, lambda: self.client.get(
+            reverse("backups:college_backup_list", args=[self.college.id]), {"download": "1"}
+        ))
+
+    def test_download_backup(self):
+        self.login(self.staff)
+        self.assertQueryBudget(1, lambda: self.client.get(reverse("backups:download_backup", args=[self.backup.id])))
+
+
+class BackupAdminQueryBudgetTests(QueryBudgetTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.login(self.staff)
+
+    def test_archived_backup_changelist(self):
+        self.assertQueryBudget(6, lambda: self.client.get(reverse("admin:backups_archivedbackup_changelist")))
+
+    def test_backup_changelist(self):
+        self.assertQueryBudget(4, lambda: self.client.get(reverse("admin:backups_backup_changelist")))
+
+
+@override_settings(REDIS_URL="redis://redis:6379/0")
+class UploadAdmissionTests(QueryBudgetTestCase):
+
+    def upload(self):
+        return self.client.post(
+            reverse("backups:backup-upload"),
+            {"file": SimpleUploadedFile("dump.sql", b"CREATE TABLE t (id INT);\n")},
+            HTTP_AUTHORIZATION=f"Api-Key {self.api_key}",
+        )
+
+    @mock.patch("backups.admission.UploadGate")
+    def test_rejected_upload_gets_retry_after(self, gate):
+        gate.return_value.admit.return_value = Admission(False, 429, 120)
+        count = Backup.objects.count()
+
+        response = self.upload()
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "120")
+        self.assertEqual(Backup.objects.count(), count)
+        gate.return_value.admit.assert_called_once_with(self.college.code)
+
+    @mock.patch("backups.admission.UploadGate")
+    def test_slot_released_after_upload(self, gate):
+        release = mock.Mock()
+        gate.return_value.admit.return_value = Admission(release=release)
+
+        self.assertEqual(self.upload().status_code, 201)
+        release.assert_called_once()
+
+    @mock.patch("backups.admission.UploadGate")
+    def test_fails_open_when_redis_is_down(self, gate):
+        gate.return_value.admit.side_effect = RedisConnectionError("down")
+
+        self.assertEqual(self.upload().status_code, 201)
+
+    @skipUnless(fakeredis, "fakeredis is not installed")
+    @override_settings(UPLOAD_BUCKET_SIZE=1, UPLOAD_BUCKET_REFILL=600)
+    def test_second_upload_is_throttled(self):
+        redis = fakeredis.FakeRedis(decode_responses=True)
+        with mock.patch("checkmate_central.redis_client.get_redis", return_value=redis):
+            self.assertEqual(self.upload().status_code, 201)
+            response = self.upload()
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["Retry-After"], "600")
+        self.assertEqual(redis.zcard(SLOTS_KEY), 0)
+
+
+@skipUnless(fakeredis, "fakeredis is not installed")
+@override_settings(
+    UPLOAD_MAX_CONCURRENT=2, UPLOAD_SLOT_TTL=3600, UPLOAD_BUCKET_SIZE=3, UPLOAD_BUCKET_REFILL=60, UPLOAD_RETRY_AFTER=30,
+)
+class UploadGateTests(SimpleTestCase):
+    """ACQUIRE_SCRIPT and BUCKET_SCRIPT run on fakeredis's Lua interpreter."""
+
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis(decode_responses=True)
+        self.gate = UploadGate(client=self.redis)
+        self.now = 1_000_000.0
+        for target, replacement in (
+            ("backups.admission.time", mock.Mock(time=lambda: self.now)),
+            ("backups.admission.random.randint", lambda low, high: high),
+        ):
+            patcher = mock.patch(target, replacement)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_slots_are_taken_up_to_the_limit(self):
+        first, second = self.gate.admit("A"), self.gate.admit("B")
+        third = self.gate.admit("C")
+
+        self.assertTrue(first.admitted and second.admitted)
+        self.assertFalse(third.admitted)
+        self.assertEqual((third.status_code, third.retry_after), (503, 60))
+        self.assertEqual(self.redis.zcard(SLOTS_KEY), 2)
+        # A college turned away for lack of slots keeps its tokens.
+        self.assertIsNone(self.redis.hget(UploadGate.bucket_key("C"), "tokens"))
+
+    def test_release_frees_the_slot(self):
+        first = self.gate.admit("A")
+        self.gate.admit("A")
+
+        first.release()
+        first.release()
+
+        self.assertEqual(self.redis.zcard(SLOTS_KEY), 1)
+        self.assertTrue(self.gate.admit("B").admitted)
+        self.assertFalse(self.gate.admit("B").admitted)
+
+    def test_unreleased_leases_expire(self):
+        self.gate.admit("A")
+        self.now += 1800
+        self.gate.admit("A")
+        self.assertFalse(self.gate.admit("A").admitted)
+
+        self.now += 1801
+        self.assertTrue(self.gate.admit("B").admitted)
+        self.assertEqual(self.redis.zcard(SLOTS_KEY), 2)
+
+    def test_bucket_throttles_and_refills(self):
+        for _ in range(3):
+            self.gate.admit("A").release()
+
+        throttled = self.gate.admit("A")
+        self.assertEqual((throttled.admitted, throttled.status_code, throttled.retry_after), (False, 429, 60))
+        self.assertEqual(self.redis.zcard(SLOTS_KEY), 0)
+        self.assertTrue(self.gate.admit("B").admitted)
+
+        self.now += 45
+        self.assertEqual(self.gate.admit("A").retry_after, 15)
+        self.now += 15
+        self.assertTrue(self.gate.admit("A").admitted)
+
+    def test_bucket_does_not_fill_past_its_size(self):
+        self.gate.admit("A").release()
+        self.now += 24 * 60 * 60
+
+        for _ in range(3):
+            self.assertTrue(self.gate.admit("A").admitted)
+            self.redis.delete(SLOTS_KEY)
+        self.assertEqual(self.gate.admit("A").status_code, 429)
+
+
+@override_settings(UPLOAD_WINDOW_HOURS=2, UPLOAD_SLOT_MINUTES=10, UPLOAD_EXPECTED_THROUGHPUT=1024)
+class UploadSchedulingTests(QueryBudgetTestCase):
+
+    def test_plan_spreads_colleges_across_the_window(self):
+        self.grow()
+        night_start = scheduling.night_start_for()
+        # Every fixture backup was uploaded at the same moment, so the
+        # colleges' usual times all collide.
+        Backup.objects.update(uploaded_at=night_start - timezone.timedelta(days=1), file_size=10 * 60 * 1024)
+
+        plan = scheduling.build_plan(night_start)
+
+        self.assertEqual(len(plan.assignments), 11)
+        self.assertEqual(max(plan.usual_load), 11)
+        self.assertLessEqual(max(plan.planned_load), 2)
+
+    def test_next_window_skips_a_window_that_has_passed(self):
+        now = scheduling.night_start_for() + timezone.timedelta(hours=1, minutes=59)
+        window = scheduling.next_window(self.college, now=now)
+        self.assertGreater(window.end, now)
+
+    def test_new_college_does_not_move_issued_windows(self):
+        self.grow()
+        night_start = scheduling.night_start_for()
+        Backup.objects.update(uploaded_at=night_start - timezone.timedelta(days=1), file_size=10 * 60 * 1024)
+        issued = {
+            college_id: (a.start, a.end)
+            for college_id, a in scheduling.get_plan(night_start).assignments.items()
+        }
+
+        # The biggest dump of the night: a rebuild would place it first and shuffle everyone else.
+        college, _ = self.make_college(College.objects.count())
+        Backup.objects.filter(college=college).update(
+            uploaded_at=night_start - timezone.timedelta(days=1), file_size=40 * 60 * 1024,
+        )
+        window = scheduling.next_window(college, now=night_start - timezone.timedelta(hours=1))
+
+        plan = scheduling.get_plan(night_start)
+        self.assertEqual(plan.assignments[college.id], window)
+        self.assertEqual(
+            {college_id: (a.start, a.end) for college_id, a in plan.assignments.items() if college_id != college.id},
+            issued,
+        )
+        self.assertEqual(sum(plan.planned_load), sum(
+            (a.end - a.start) // timezone.timedelta(seconds=plan.slot_seconds) for a in plan.assignments.values()
+        ))
+
+
+class BackupPrecheckTests(QueryBudgetTestCase):
+
+    def precheck(self, content):
+        return self.client.post(
+            reverse("backups:backup-precheck"),
+            {"size": len(content), "sha256": hashlib.sha256(content).hexdigest()},
+            HTTP_AUTHORIZATION=f"Api-Key {self.api_key}",
+        )
+
+    def test_unchanged_dump_is_recorded_without_upload(self):
+        content = b"CREATE TABLE t (id INT);\n"
+        self.client.post(
+            reverse("backups:backup-upload"),
+            {"file": SimpleUploadedFile("dump.sql", content)},
+            HTTP_AUTHORIZATION=f"Api-Key {self.api_key}",
+        )
+        original = Backup.objects.filter(college=self.college).latest("id")
+
+        response = self.precheck(content)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(response.json()["skip_upload"])
+        duplicate = Backup.objects.filter(college=self.college).latest("id")
+        self.assertNotEqual(duplicate.id, original.id)
+        self.assertEqual(duplicate.file.name, original.file.name)
+        self.assertEqual(duplicate.is_encrypted, original.is_encrypted)
+
+    def test_new_content_must_be_uploaded(self):
+        count = Backup.objects.count()
+        response = self.precheck(b"something new")
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.json()["skip_upload"])
+        self.assertEqual(Backup.objects.count(), count)
+
+
+class CompressedUploadTests(QueryBudgetTestCase):
+    dump = b"INSERT INTO t VALUES (1);\n" * 1000
+
+    def upload(self, content, encoding, name="dump.sql.gz"):
+        return self.client.post(
+            reverse("backups:backup-upload"),
+            {"file": SimpleUploadedFile(name, content), "content_encoding": encoding},
+            HTTP_AUTHORIZATION=f"Api-Key {self.api_key}",
+        )
+
+    def test_gzip_upload_is_stored_as_sent(self):
+        compressed = gzip.compress(self.dump)
+        response = self.upload(compressed, "gzip")
+
+        self.assertEqual(response.status_code, 201)
+        backup = Backup.objects.filter(college=self.college).latest("id")
+        self.assertEqual(backup.content_encoding, "gzip")
+        self.assertEqual(backup.checksum, hashlib.sha256(self.dump).hexdigest())
+        self.assertEqual(backup.content_size, len(self.dump))
+        self.assertEqual(backup.file_size, len(compressed))
+
+    def test_corrupt_gzip_is_rejected(self):
+        response = self.upload(gzip.compress(self.dump)[:-20], "gzip")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("file", response.json())
+
+    @skipUnless(compression.zstandard, "zstandard is not installed")
+    def test_zstd_checksum_matches_plain_upload(self):
+        compressed = compression.zstandard.ZstdCompressor().compress(self.dump)
+        self.assertEqual(self.upload(compressed, "zstd", "dump.sql.zst").status_code, 201)
+        backup = Backup.objects.filter(college=self.college).latest("id")
+        self.assertEqual(backup.checksum, hashlib.sha256(self.dump).hexdigest())
+
+    @override_settings(BACKUP_MAX_CONTENT_SIZE=1024 * 1024)
+    def test_content_over_the_limit_is_rejected(self):
+        count = Backup.objects.count()
+        response = self.upload(gzip.compress(b"\0" * (64 * 1024 * 1024)), "gzip")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("limit", response.json()["file"][0])
+        self.assertEqual(Backup.objects.count(), count)
+
+    def test_zstd_is_refused_without_zstandard(self):
+        with mock.patch.object(compression, "zstandard", None):
+            response = self.upload(b"(\xb5/\xfd", "zstd", "dump.sql.zst")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("does not accept 'zstd'", str(response.json()))
+
+
+# 128 KiB of output per 4 bytes of zstd input, at most.
+ZSTD_OUTPUT_BOUND = compression.ZSTD_INPUT_SLICE // 4 * 128 * 1024
+
+
+class DigestStreamTests(SimpleTestCase):
+    plain = os.urandom(256 * 1024) + b"\0" * (8 * 1024 * 1024)
+
+    def digest(self, chunks, encoding, **kwargs):
+        """Run digest_stream over `chunks`; returns (digest, size, largest piece passed to the sink)."""
+        pieces = []
+        digest, size = compression.digest_stream(iter(chunks), encoding, sink=lambda d: pieces.append(len(d)), **kwargs)
+        return digest, size, max(pieces)
+
+    def split(self, data, size=64 * 1024):
+        return [data[i:i + size] for i in range(0, len(data), size)]
+
+    def assert_plain(self, result, bound=compression.OUTPUT_CHUNK):
+        digest, size, largest = result
+        self.assertEqual((digest, size), (hashlib.sha256(self.plain).hexdigest(), len(self.plain)))
+        self.assertLessEqual(largest, bound)
+
+    def test_gzip_output_is_bounded(self):
+        self.assert_plain(self.digest([gzip.compress(self.plain)], "gzip"))
+        self.assert_plain(self.digest(self.split(gzip.compress(self.plain)), "gzip"))
+
+    def test_concatenated_gzip_members(self):
+        half = len(self.plain) // 2
+        self.assert_plain(self.digest(
+            self.split(gzip.compress(self.plain[:half]) + gzip.compress(self.plain[half:])), "gzip",
+        ))
+
+    @skipUnless(compression.zstandard, "zstandard is not installed")
+    def test_zstd_output_is_bounded(self):
+        compressed = compression.zstandard.ZstdCompressor().compress(self.plain)
+        self.assert_plain(self.digest([compressed], "zstd"), ZSTD_OUTPUT_BOUND)
+
+    @skipUnless(compression.zstandard, "zstandard is not installed")
+    def test_concatenated_zstd_frames(self):
+        half = len(self.plain) // 2
+        compressor = compression.zstandard.ZstdCompressor()
+        self.assert_plain(self.digest(
+            self.split(compressor.compress(self.plain[:half]) + compressor.compress(self.plain[half:])), "zstd",
+        ), ZSTD_OUTPUT_BOUND)
+
+    @skipUnless(compression.zstandard, "zstandard is not installed")
+    def test_truncated_zstd_is_rejected(self):
+        compressed = compression.zstandard.ZstdCompressor().compress(self.plain)
+        with self.assertRaisesMessage(compression.CorruptStreamError, "Truncated"):
+            self.digest(self.split(compressed[:-10]), "zstd")
+
+    def test_max_size(self):
+        limit = len(self.plain) - 1
+        compressed = [gzip.compress(self.plain)]
+        if compression.zstandard:
+            compressed.append(compression.zstandard.ZstdCompressor().compress(self.plain))
+        for encoding, chunks in zip(("identity", "gzip", "zstd"), [self.split(self.plain), *([c] for c in compressed)]):
+            with self.subTest(encoding=encoding), self.assertRaises(compression.ContentTooLargeError):
+                self.digest(chunks, encoding, max_size=limit)
+        self.assert_plain(self.digest([gzip.compress(self.plain)], "gzip", max_size=len(self.plain)))
+
+
+class IdempotentUploadTests(QueryBudgetTestCase):
+
+    def upload(self, key, content=b"CREATE TABLE t (id INT);\n"):
+        return self.client.post(
+            reverse("backups:backup-upload"),
+            {"file": SimpleUploadedFile("dump.sql", content)},
+            HTTP_AUTHORIZATION=f"Api-Key {self.api_key}",
+            HTTP_IDEMPOTENCY_KEY=key,
+        )
+
+    def test_retry_replays_the_original_response(self):
+        count = Backup.objects.count()
+        first = self.upload("nightly-2026-01-01")
+        retry = self.upload("nightly-2026-01-01")
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(Backup.objects.count(), count + 1)
+
+    def test_key_reused_for_a_different_request(self):
+        self.upload("nightly-2026-01-02")
+        response = self.upload("nightly-2026-01-02", content=b"a different, longer dump\n" * 10)
+        self.assertEqual(response.status_code, 422)
+
+    def test_retry_while_first_request_runs(self):
+        with mock.patch("backups.idempotency.cache.add", return_value=False):
+            response = self.upload("nightly-2026-01-03")
+        self.assertEqual(response.status_code, 409)
+
+
+class EnvelopeEncryptionTests(QueryBudgetTestCase):
+    dump = b"CREATE TABLE t (id INT);\n"
+
+    def setUp(self):
+        super().setUp()
+        self.client.post(
+            reverse("backups:backup-upload"),
+            {"file": SimpleUploadedFile("dump.sql", self.dump)},
+            HTTP_AUTHORIZATION=f"Api-Key {self.api_key}",
+        )
+        self.uploaded = Backup.objects.filter(college=self.college).latest("id")
+
+    def decrypted(self, backup):
+        with NamedTemporaryFile() as out:
+            backup.decrypt_to(out.name)
+            return out.read()
+
+    def test_backup_gets_its_own_wrapped_data_key(self):
+        self.assertTrue(self.uploaded.is_encrypted)
+        self.assertEqual(self.uploaded.key_id, "default")
+        self.assertTrue(self.uploaded.wrapped_key)
+        self.assertEqual(self.decrypted(self.uploaded), self.dump)
+
+    def test_rotation_rewraps_keys_without_touching_files(self):
+        old_key = os.environ["BACKUP_ENCRYPTION_KEY"]
+        with open(self.uploaded.file.path, "rb") as f:
+            ciphertext = f.read()
+
+        keys = f"2026-new:{Fernet.generate_key().decode()},default:{old_key}"
+        with mock.patch.dict(os.environ, {"BACKUP_MASTER_KEYS": keys}):
+            call_command("rotate_backup_keys", stdout=StringIO())
+            self.uploaded.refresh_from_db()
+            self.assertEqual(self.uploaded.key_id, "2026-new")
+
+        # The old master key is no longer needed.
+        with mock.patch.dict(os.environ, {"BACKUP_MASTER_KEYS": keys.split(",")[0]}):
+            self.assertEqual(self.decrypted(self.uploaded), self.dump)
+        with open(self.uploaded.file.path, "rb") as f:
+            self.assertEqual(f.read(), ciphertext)
+
+    def test_rotation_rewraps_archived_backups(self):
+        old_key = os.environ["BACKUP_ENCRYPTION_KEY"]
+        Backup.objects.filter(id=self.uploaded.id).update(uploaded_at=timezone.now() - timezone.timedelta(days=365))
+        archive_old_backups()
+        archived = ArchivedBackup.objects.get(id=self.uploaded.id)
+
+        keys = f"2026-new:{Fernet.generate_key().decode()},default:{old_key}"
+        with mock.patch.dict(os.environ, {"BACKUP_MASTER_KEYS": keys}):
+            call_command("rotate_backup_keys", stdout=StringIO())
+        archived.refresh_from_db()
+        self.assertEqual(archived.key_id, "2026-new")
+
+        with mock.patch.dict(os.environ, {"BACKUP_MASTER_KEYS": keys.split(",")[0]}):
+            self.assertEqual(self.decrypted(archived), self.dump)
+
+    def make_legacy(self, backup):
+        """Turn `backup` into a row from before envelope encryption: the file encrypted with BACKUP_ENCRYPTION_KEY."""
+        with NamedTemporaryFile() as plain:
+            plain.write(self.dump)
+            plain.flush()
+            encryption.encrypt_file(plain.name, backup.file.path)
+        type(backup).objects.filter(id=backup.id).update(wrapped_key=None, key_id=None, tree_hash=None)
+
+    def test_rotation_moves_pre_envelope_backups(self):
+        old_key = os.environ["BACKUP_ENCRYPTION_KEY"]
+        Backup.objects.filter(id=self.uploaded.id).update(uploaded_at=timezone.now() - timezone.timedelta(days=365))
+        archive_old_backups()
+        archived = ArchivedBackup.objects.get(id=self.uploaded.id)
+        self.make_legacy(archived)
+        self.client.post(
+            reverse("backups:backup-upload"),
+            {"file": SimpleUploadedFile("dump.sql", self.dump + b"-- again\n")},
+            HTTP_AUTHORIZATION=f"Api-Key {self.api_key}",
+        )
+        hot = Backup.objects.filter(college=self.college).latest("id")
+        self.make_legacy(hot)
+
+        new_keys = f"2026-new:{Fernet.generate_key().decode()}"
+        out = StringIO()
+        with mock.patch.dict(os.environ, {"BACKUP_MASTER_KEYS": f"{new_keys},default:{old_key}"}):
+            call_command("rotate_backup_keys", "--dry-run", stdout=out)
+            legacy = sum(model.objects.filter(wrapped_key=None).count() for model in (Backup, ArchivedBackup))
+            self.assertIn(f"{legacy} pre-envelope backups", out.getvalue())
+            self.assertNotIn("can now be removed", out.getvalue())
+            call_command("rotate_backup_keys", stdout=out)
+        self.assertIn("BACKUP_ENCRYPTION_KEY can now be removed", out.getvalue())
+
+        # Neither the old master key nor BACKUP_ENCRYPTION_KEY is needed any more.
+        with mock.patch.dict(os.environ, {"BACKUP_MASTER_KEYS": new_keys}):
+            del os.environ["BACKUP_ENCRYPTION_KEY"]
+            for backup in (hot, archived):
+                backup.refresh_from_db()
+                self.assertEqual(backup.key_id, "2026-new")
+                self.assertEqual(self.decrypted(backup), self.dump)
+
+
+@override_settings(BACKUP_CRYPTO_WORKERS=4, BACKUP_PARALLEL_THRESHOLD=1, BACKUP_SEGMENT_SIZE=1024)
+class ParallelEncryptionTests(QueryBudgetTestCase):
+    dump = b"".join(f"INSERT INTO t VALUES ({i});\n".encode() for i in range(1000))
+
+    def setUp(self):
+        super().setUp()
+        self.client.post(
+            reverse("backups:backup-upload"),
+            {"file": SimpleUploadedFile("dump.sql", self.dump)},
+            HTTP_AUTHORIZATION=f"Api-Key {self.api_key}",
+        )
+        self.uploaded = Backup.objects.filter(college=self.college).latest("id")
+
+    def test_large_file_is_encrypted_in_segments(self):
+        with open(self.uploaded.file.path, "rb") as f:
+            self.assertTrue(f.read().startswith(encryption.MAGIC))
+        self.assertTrue(self.uploaded.tree_hash)
+
+        with NamedTemporaryFile() as out:
+            self.uploaded.decrypt_to(out.name)
+            self.assertEqual(out.read(), self.dump)
+
+    def test_reordered_segments_fail_the_tree_hash(self):
+        with open(self.uploaded.file.path, "rb") as f:
+            header = f.read(len(encryption.MAGIC) + encryption.HEADER.size)
+            tokens = list(encryption._read_tokens(f))
+        tokens[0], tokens[1] = tokens[1], tokens[0]
+        with open(self.uploaded.file.path, "wb") as f:
+            f.write(header)
+            for token in tokens:
+                f.write(encryption.LENGTH.pack(len(token)) + token)
+
+        with NamedTemporaryFile() as out, self.assertRaises(ValueError):
+            self.uploaded.decrypt_to(out.name)
+
+
+@override_settings(BACKUP_ARCHIVE_AFTER_DAYS=30, BACKUP_ARCHIVE_BATCH_SIZE=2)
+class BackupArchiveTests(QueryBudgetTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.old = list(Backup.objects.filter(college=self.college).order_by("id")[:3])
+        Backup.objects.filter(id__in=[b.id for b in self.old]).update(
+            uploaded_at=timezone.now() - timezone.timedelta(days=60)
+        )
+
+    def test_old_rows_move_to_the_archive_in_batches(self):
+        moved = archive_old_backups()
+
+        self.assertEqual(moved, 3)
+        self.assertFalse(Backup.objects.filter(id__in=[b.id for b in self.old]).exists())
+        archived = ArchivedBackup.objects.get(id=self.old[0].id)
+        self.assertEqual(archived.file.name, self.old[0].file.name)
+        self.assertEqual(archived.wrapped_key, self.old[0].wrapped_key)
+
+    def test_catalog_spans_both_tables(self):
+        archive_old_backups()
+        catalog = Backup.objects.catalog(college=self.college)
+
+        self.assertEqual(catalog.count(), 5)
+        uploaded = [b.uploaded_at for b in catalog]
+        self.assertEqual(uploaded, sorted(uploaded, reverse=True))
+        self.assertTrue(catalog.get(id=self.old[0].id).is_archived)
+
+    def test_archived_backup_still_downloads_by_id(self):
+        archive_old_backups()
+        archived = ArchivedBackup.objects.get(id=self.old[0].id)
+        ArchivedBackup.objects.filter(id=archived.id).update(is_encrypted=False)
+        os.makedirs(os.path.dirname(archived.file.path), exist_ok=True)
+        with open(archived.file.path, "wb") as fh:
+            fh.write(b"-- archived dump\n")
+        self.addCleanup(os.remove, archived.file.path)
+
+        self.login(self.staff)
+        response = self.client.get(reverse("backups:download_backup", args=[archived.id]))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b"-- archived dump\n")
+
+
+class ShardedStorageTests(QueryBudgetTestCase):
+    dump = b"CREATE TABLE t (id INT);\n"
+
+    def setUp(self):
+        super().setUp()
+        self.roots = {name: mkdtemp(prefix=f"checkmate-{name}-") for name in ("disk1", "disk2", "disk3")}
+        for root in self.roots.values():
+            self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+
+    def volumes(self, *names):
+        return override_settings(BACKUP_VOLUMES={name: self.roots[name] for name in names})
+
+    def upload(self):
+        self.client.post(
+            reverse("backups:backup-upload"),
+            {"file": SimpleUploadedFile("dump.sql", self.dump)},
+            HTTP_AUTHORIZATION=f"Api-Key {self.api_key}",
+        )
+        return Backup.objects.filter(college=self.college).latest("id")
+
+    def test_adding_a_volume_moves_few_colleges(self):
+        codes = [f"C{i:04d}" for i in range(1000)]
+        before = HashRing(["disk1", "disk2", "disk3"])
+        after = HashRing(["disk1", "disk2", "disk3", "disk4"])
+
+        moved = [code for code in codes if before.volume_for(code) != after.volume_for(code)]
+        self.assertLess(len(moved), 400)
+        self.assertTrue(all(after.volume_for(code) == "disk4" for code in moved))
+
+    def test_upload_lands_on_the_colleges_volume(self):
+        with self.volumes("disk1", "disk2"):
+            volume = backup_storage.volume_for_college(self.college.code)
+            backup = self.upload()
+
+            self.assertEqual(backup.volume, volume)
+            self.assertTrue(backup.file.name.startswith(f"{volume}/backups/{self.college.code}/"))
+            self.assertTrue(backup.file.path.startswith(self.roots[volume]))
+            with NamedTemporaryFile() as out:
+                backup.decrypt_to(out.name)
+                self.assertEqual(out.read(), self.dump)
+
+    def test_rebalance_moves_files_and_shared_rows(self):
+        backup = self.upload()  # no volumes yet: stored under MEDIA_ROOT
+        shared = Backup.objects.create(college=self.college, file=backup.file.name, checksum=backup.checksum)
+        old_name, old_path = backup.file.name, backup.file.path
+
+        with self.volumes("disk1", "disk2", "disk3"):
+            call_command("rebalance_backups", "--now", stdout=StringIO())
+            volume = backup_storage.volume_for_college(self.college.code)
+
+            for row in (backup, shared):
+                row.refresh_from_db()
+                self.assertEqual(row.volume, volume)
+                self.assertEqual(row.file.name, f"{volume}/{old_name}")
+            self.assertFalse(os.path.exists(old_path))
+            self.assertTrue(os.path.exists(backup.file.path))
+
+
+class BackupReplicationTests(QueryBudgetTestCase):
+    dump = b"CREATE TABLE t (id INT);\n"
+
+    def setUp(self):
+        super().setUp()
+        self.target = mkdtemp(prefix="checkmate-replica-")
+        self.addCleanup(shutil.rmtree, self.target, ignore_errors=True)
+        targets = override_settings(BACKUP_REPLICATION_TARGETS={"nas": f"file://{self.target}"})
+        targets.enable()
+        self.addCleanup(targets.disable)
+
+    def upload(self):
+        with mock.patch("backups.tasks.replicate_backup.delay") as delay, \
+                self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse("backups:backup-upload"),
+                {"file": SimpleUploadedFile("dump.sql", self.dump)},
+                HTTP_AUTHORIZATION=f"Api-Key {self.api_key}",
+            )
+        backup = Backup.objects.filter(college=self.college).latest("id")
+        delay.assert_called_once_with(backup.id)
+        return backup
+
+    def test_upload_is_queued_and_copied(self):
+        backup = self.upload()
+        self.assertEqual(backup.replication_state, ReplicationState.PENDING)
+
+        replicate_backup.apply(args=[backup.id])
+
+        backup.refresh_from_db()
+        self.assertEqual(backup.replication_state, ReplicationState.DONE)
+        self.assertEqual(backup.replication_status["nas"]["state"], ReplicationState.DONE)
+        with open(os.path.join(self.target, backup.file.name), "rb") as replica, open(backup.file.path, "rb") as local:
+            self.assertEqual(replica.read(), local.read())
+
+    def test_failing_target_is_recorded_and_given_up_after_retries(self):
+        backup = self.upload()
+        with open(os.path.join(self.target, "backups"), "w"):
+            pass  # a file where the target needs a directory
+
+        with override_settings(BACKUP_REPLICATION_MAX_RETRIES=0):
+            replicate_backup.apply(args=[backup.id])
+
+        backup.refresh_from_db()
+        self.assertEqual(backup.replication_state, ReplicationState.FAILED)
+        self.assertEqual(backup.replication_status["nas"]["attempts"], 1)
+        self.assertTrue(backup.replication_status["nas"]["error"])
+
+    def test_sweep_requeues_failed_backups(self):
+        Backup.objects.filter(id=self.backup.id).update(replication_state=ReplicationState.FAILED)
+        with mock.patch("backups.tasks.replicate_backup.delay") as delay:
+            self.assertEqual(replicate_pending_backups(), 1)
+        delay.assert_called_once_with(self.backup.id)
+
+    def test_throttle_spaces_reads_to_the_configured_rate(self):
+        throttle = Throttle(rate=1000)
+        with mock.patch("backups.replication.time.sleep") as sleep:
+            throttle.consume(500)
+            throttle.consume(500)
+        waits = [call.args[0] for call in sleep.call_args_list]
+        self.assertAlmostEqual(waits[0], 0.5, places=2)
+        self.assertAlmostEqual(waits[1], 1.0, places=2)
+
+
+@override_settings(BACKUP_PACK_AFTER_DAYS=30, BACKUP_CRYPTO_WORKERS=4, BACKUP_SEGMENT_SIZE=1024)
+class ColdPackTests(QueryBudgetTestCase):
+    dumps = [
+        b"".join(f"INSERT INTO t VALUES ({i}, 'day {day}');\n".encode() for i in range(500))
+        for day in range(2)
+    ]
+
+    def setUp(self):
+        super().setUp()
+        self.uploaded = []
+        for i, dump in enumerate(self.dumps):
+            self.client.post(
+                reverse("backups:backup-upload"),
+                {"file": SimpleUploadedFile(f"dump_{i}.sql", dump)},
+                HTTP_AUTHORIZATION=f"Api-Key {self.api_key}",
+            )
+            self.uploaded.append(Backup.objects.filter(college=self.college).latest("id"))
+        first = self.uploaded[0]
+        self.shared = Backup.objects.create(
+            college=self.college, file=first.file.name, checksum=first.checksum,
+            is_encrypted=True, wrapped_key=first.wrapped_key, key_id=first.key_id,
+        )
+        Backup.objects.filter(college=self.college).update(uploaded_at=timezone.now() - timezone.timedelta(days=60))
+        self.old_paths = [b.file.path for b in self.uploaded]
+
+    def decrypted(self, backup):
+        with NamedTemporaryFile() as out:
+            backup.decrypt_to(out.name)
+            return out.read()
+
+    def test_old_backups_are_packed_and_still_readable(self):
+        pack_old_backups()
+
+        rows = [Backup.objects.get(id=b.id) for b in (*self.uploaded, self.shared)]
+        self.assertEqual(len({row.file.name for row in rows}), 1)
+        self.assertTrue(rows[0].file.name.endswith(".pack"))
+        self.assertEqual((rows[2].pack_offset, rows[2].pack_length), (rows[0].pack_offset, rows[0].pack_length))
+        self.assertTrue(all(not os.path.exists(path) for path in self.old_paths))
+        self.assertLess(os.path.getsize(rows[0].file.path), sum(len(d) for d in self.dumps) / 2)
+        for row, dump in zip(rows, [*self.dumps, self.dumps[0]]):
+            self.assertEqual(self.decrypted(row), dump)
+
+    def test_download_seeks_into_the_pack(self):
+        pack_old_backups()
+        self.login(self.staff)
+
+        response = self.client.get(reverse("backups:download_backup", args=[self.uploaded[1].id]))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, self.dumps[1])
+        self.assertIn("dump_1.sql", response["Content-Disposition"])
+
+    def test_tampered_entry_is_rejected(self):
+        pack_old_backups()
+        row = Backup.objects.get(id=self.uploaded[1].id)
+        with open(row.file.path, "r+b") as f:
+            f.seek(row.pack_offset + row.pack_length - 10)
+            f.write(b"\x00" * 4)
+
+        with self.assertRaises(Exception):
+            self.decrypted(row)
+
+
+class BackupGarbageCollectionTests(QueryBudgetTestCase):
+    dump = b"CREATE TABLE t (id INT);\n"
+
+    def setUp(self):
+        super().setUp()
+        self.media = mkdtemp(prefix="checkmate-gc-media-")
+        self.disk = mkdtemp(prefix="checkmate-gc-disk1-")
+        for root in (self.media, self.disk):
+            self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=self.media)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        self.client.post(
+            reverse("backups:backup-upload"),
+            {"file": SimpleUploadedFile("dump.sql", self.dump)},
+            HTTP_AUTHORIZATION=f"Api-Key {self.api_key}",
+        )
+        self.kept = Backup.objects.filter(college=self.college).latest("id").file.path
+        self.age(self.kept)
+        self.stale_upload = self.make(self.media, "backups/temp/dump.sql")
+        self.fresh = self.make(self.media, f"backups/{self.college.code}/in_progress.sql", age=False)
+        self.decrypted = self.make(os.path.dirname(NamedTemporaryFile().name), f"{DECRYPT_PREFIX}test")
+
+    def age(self, path, days=3):
+        stamp = timezone.now().timestamp() - days * 24 * 60 * 60
+        os.utime(path, (stamp, stamp))
+
+    def make(self, root, name, age=True):
+        path = os.path.join(root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(b"x" * 100)
+        self.addCleanup(lambda: os.path.exists(path) and os.remove(path))
+        if age:
+            self.age(path)
+        return path
+
+    def test_dry_run_only_reports(self):
+        report = collect_garbage(dry_run=True)
+
+        self.assertEqual(report.orphans, [("backups/temp/dump.sql", 100)])
+        self.assertEqual(report.temp_files, 1)
+        self.assertTrue(os.path.exists(self.stale_upload))
+        self.assertTrue(os.path.exists(self.decrypted))
+
+    def test_orphans_are_quarantined_and_referenced_files_kept(self):
+        with override_settings(BACKUP_VOLUMES={"disk1": self.disk}):
+            orphan_on_volume = self.make(self.disk, f"backups/{self.college.code}/lost.sql.enc")
+            pack_tmp = self.make(self.disk, f"backups/{self.college.code}/packs/p.pack.tmp")
+
+            report = collect_garbage()
+
+        self.assertEqual(len(report.orphans), 3)
+        self.assertEqual(report.quarantined_bytes, 300)
+        self.assertEqual(report.reclaimed_bytes, 100)  # the decrypt temp file
+        for path in (self.stale_upload, orphan_on_volume, pack_tmp, self.decrypted):
+            self.assertFalse(os.path.exists(path))
+        for path in (self.kept, self.fresh):
+            self.assertTrue(os.path.exists(path))
+        today = timezone.localdate().isoformat()
+        self.assertTrue(os.path.exists(os.path.join(self.media, QUARANTINE_DIR, today, "backups/temp/dump.sql")))
+        self.assertTrue(os.path.exists(
+            os.path.join(self.disk, QUARANTINE_DIR, today, f"backups/{self.college.code}/lost.sql.enc")
+        ))
+
+    def test_delete_mode_and_expired_quarantine(self):
+        expired = self.make(self.media, f"{QUARANTINE_DIR}/2000-01-01/backups/temp/old.sql")
+
+        out = StringIO()
+        call_command("collect_backup_garbage", "--now", "--delete", stdout=out)
+
+        self.assertFalse(os.path.exists(self.stale_upload))
+        self.assertFalse(os.path.exists(expired))
+        self.assertTrue(os.path.exists(self.kept))
+        self.assertIn("Reclaimed 300 bytes", out.getvalue())
+
+
+class BackupPurgeTests(QueryBudgetTestCase):
+    dump = b"CREATE TABLE t (id INT);\n"
+
+    def setUp(self):
+        super().setUp()
+        self.media = mkdtemp(prefix="checkmate-purge-media-")
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=self.media)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.login(self.staff)
+
+    def upload(self):
+        response = self.client.post(
+            reverse("backups:backup-upload"),
+            {"file": SimpleUploadedFile("dump.sql", self.dump)},
+            HTTP_AUTHORIZATION=f"Api-Key {self.api_key}",
+        )
+        self.assertEqual(response.status_code, 201)
+        return Backup.objects.filter(college=self.college).latest("id")
+
+    def purge_after(self, request):
+        """Make `request`, check it queued the purge, then run the purge task here."""
+        purge_deleted_backups.delay.reset_mock()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = request()
+        purge_deleted_backups.delay.assert_called_once_with()
+        purge_deleted_backups()
+        return response
+
+    def admin_delete(self, backup):
+        return self.purge_after(
+            lambda: self.client.post(reverse("admin:backups_backup_delete", args=[backup.id]), {"post": "yes"})
+        )
+
+    def test_shared_file_is_removed_with_its_last_row(self):
+        backup = self.upload()
+        shared = Backup.objects.create(
+            college=self.college, file=backup.file.name, checksum=backup.checksum,
+            is_encrypted=True, wrapped_key=backup.wrapped_key, key_id=backup.key_id,
+        )
+        path = backup.file.path
+
+        self.admin_delete(backup)
+        self.assertFalse(Backup.objects.filter(id=backup.id).exists())
+        self.assertTrue(os.path.exists(path))
+
+        self.admin_delete(shared)
+        self.assertFalse(Backup.objects.filter(id=shared.id).exists())
+        self.assertFalse(os.path.exists(path))
+
+    def test_marked_college_is_hidden_and_its_key_revoked(self):
+        backup = self.upload()
+
+        request_college_purge(self.college)
+
+        self.assertEqual(self.client.get(reverse("backups:college_backup_list", args=[self.college.id])).status_code, 404)
+        with self.assertRaises(Backup.DoesNotExist):
+            Backup.objects.catalog().get(id=backup.id)
+        self.assertTrue(APIKey.objects.get(id=self.college.api_key_id).revoked)
+        self.assertNotEqual(self.client.post(
+            reverse("backups:backup-upload"),
+            {"file": SimpleUploadedFile("dump.sql", self.dump)},
+            HTTP_AUTHORIZATION=f"Api-Key {self.api_key}",
+        ).status_code, 201)
+
+    @override_settings(BACKUP_PURGE_BATCH_SIZE=2)
+    def test_deleting_a_college_purges_rows_files_and_directory(self):
+        backups = [self.upload() for _ in range(3)]
+        ArchivedBackup.objects.create(
+            id=10 ** 9, college=self.college, file=backups[0].file.name, uploaded_at=timezone.now(),
+        )
+        directory = os.path.dirname(backups[0].file.path)
+        api_key_id = self.college.api_key_id
+
+        response = self.purge_after(
+            lambda: self.client.post(reverse("admin:colleges_college_delete", args=[self.college.id]), {"post": "yes"})
+        )
+
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(College.objects.filter(id=self.college.id).exists())
+        self.assertFalse(Backup.objects.filter(college_id=self.college.id).exists())
+        self.assertFalse(ArchivedBackup.objects.filter(college_id=self.college.id).exists())
+        self.assertFalse(APIKey.objects.filter(id=api_key_id).exists())
+        self.assertFalse(os.path.exists(directory))
+
+
+class DumpManifestTests(QueryBudgetTestCase):
+    dump = (
+        b"-- MySQL dump 10.13\n"
+        b"DROP TABLE IF EXISTS `students`;\n"
+        b"CREATE TABLE `students` (\n  `id` int NOT NULL,\n  PRIMARY KEY (`id`)\n) ENGINE=InnoDB;\n"
+        b"LOCK TABLES `students` WRITE;\n"
+        b"INSERT INTO `students` VALUES (1,'a'),(2,'b'),(3,'c');\n"
+        b"INSERT INTO `students` VALUES (4,'d');\n"
+        b"UNLOCK TABLES;\n"
+        b"CREATE TABLE `marks` (\n  `id` int\n);\n"
+        b"-- Dump completed on 2026-10-19  1:00:00\n"
+    )
+
+    def upload(self, content, encoding="identity"):
+        response = self.client.post(
+            reverse("backups:backup-upload"),
+            {"file": SimpleUploadedFile("dump.sql", content), "content_encoding": encoding},
+            HTTP_AUTHORIZATION=f"Api-Key {self.api_key}",
+        )
+        self.assertEqual(response.status_code, 201)
+        return Backup.objects.filter(college=self.college).latest("id")
+
+    def test_same_manifest_whatever_the_chunking(self):
+        expected = None
+        for size in (1, 3, 7, 64, len(self.dump)):
+            manifest = DumpManifest()
+            for i in range(0, len(self.dump), size):
+                manifest.feed(self.dump[i:i + size])
+            result = manifest.finish()
+            expected = expected or result
+            self.assertEqual(result, expected)
+
+        students, marks = expected["tables"]
+        self.assertTrue(expected["complete"])
+        self.assertEqual((students["rows"], students["statements"], marks["rows"]), (4, 2, 0))
+
+    def test_one_row_per_line_dump(self):
+        manifest = DumpManifest()
+        manifest.feed(b"".join(b"INSERT INTO `t` VALUES (%d);\n" % i for i in range(1000)))
+        (table,) = manifest.finish()["tables"]
+        self.assertEqual((table["rows"], table["statements"], len(table["inserts"])), (1000, 1000, 1))
+
+    def test_gzip_upload_offsets_point_into_the_plain_dump(self):
+        backup = self.upload(gzip.compress(self.dump), "gzip")
+
+        with NamedTemporaryFile() as out:
+            backup.decrypt_to(out.name)
+            plain = gzip.decompress(out.read())
+        students = backup.manifest["tables"][0]
+        offset, length = students["create"]
+        self.assertTrue(plain[offset:offset + length].startswith(b"CREATE TABLE `students`"))
+        self.assertTrue(plain[offset:offset + length].endswith(b"ENGINE=InnoDB;\n"))
+        offset, length = students["inserts"][0]
+        self.assertEqual(plain[offset:offset + length].count(b"INSERT INTO"), 2)
+        self.assertEqual(backup.manifest["size"], len(self.dump))
+
+    def test_backfill_command_rebuilds_missing_manifests(self):
+        backup = self.upload(self.dump)
+        expected = backup.manifest
+        Backup.objects.filter(id=backup.id).update(manifest=None)
+
+        call_command("build_backup_manifests", stdout=StringIO())
+
+        backup.refresh_from_db()
+        self.assertEqual(backup.manifest, expected)
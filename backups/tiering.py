@@ -0,0 +1,183 @@
+"""
+Cold tier: old backups packed into large compressed, encrypted files.
+
+Backups older than BACKUP_PACK_AFTER_DAYS are packed per college into
+files of up to BACKUP_PACK_MAX_BYTES, written under
+"backups/<code>/packs/". They go on BACKUP_COLD_VOLUME when it is set,
+otherwise on the college's own volume.
+
+    MAGIC | entry | entry | ... | JSON index | index length (8 bytes)
+
+Each entry is one backup, decrypted, zlib-compressed (unless it was
+uploaded compressed) and encrypted again with the backup's own data key,
+in the segment format of utils/encryption.py. The row then points at the
+pack: `file` is the pack, and `pack_offset`/`pack_length` locate the entry,
+so a download seeks straight to it. The trailing index (entry offsets and
+original names) is only there so a pack can be read without the database.
+
+Backups that share one file (deduplicated uploads) share one entry.
+"""
+import json
+import logging
+import os
+import struct
+import uuid
+from tempfile import NamedTemporaryFile
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .cleanup import DECRYPT_PREFIX
+from .storage import backup_storage
+from .utils.encryption import encrypt_pack_entry, new_data_key
+
+logger = logging.getLogger(__name__)
+
+PACK_MAGIC = b"CMPACK\x01"
+FOOTER = struct.Struct(">Q")  # index length
+
+
+def pack_volume(college_code):
+    return settings.BACKUP_COLD_VOLUME or backup_storage.volume_for_college(college_code)
+
+
+class PackWriter:
+    """Builds one pack file for a college, then repoints the packed rows at it."""
+
+    def __init__(self, college):
+        self.volume = pack_volume(college.code)
+        stamp = timezone.now().strftime("%Y-%m-%d_%H-%M-%S")
+        self.name = backup_storage.join(
+            self.volume, os.path.join("backups", college.code, "packs", f"{stamp}_{uuid.uuid4().hex[:8]}.pack")
+        )
+        self.path = backup_storage.path(self.name)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._tmp = f"{self.path}.tmp"
+        self._f = open(self._tmp, "wb")
+        self._f.write(PACK_MAGIC)
+        self.entries = []
+
+    @property
+    def size(self):
+        return self._f.tell()
+
+    def add(self, row):
+        """Append the file of `row` as one entry."""
+        from .models import ContentEncoding
+
+        wrapped_key, key_id = (row.wrapped_key, row.key_id) if row.wrapped_key else new_data_key()
+        offset = self._f.tell()
+        try:
+            with NamedTemporaryFile(prefix=DECRYPT_PREFIX) as plain:
+                if row.is_encrypted:
+                    row.decrypt_to(plain.name)
+                    source = plain.name
+                else:
+                    source = row.file.path
+                with open(source, "rb") as src:
+                    length, tree_hash = encrypt_pack_entry(
+                        src, self._f,
+                        compress=row.content_encoding == ContentEncoding.IDENTITY,
+                        wrapped_key=wrapped_key, key_id=key_id,
+                    )
+        except Exception:
+            self._f.seek(offset)
+            self._f.truncate()
+            raise
+        self.entries.append({
+            "old_name": row.file.name,
+            "pack_offset": offset,
+            "pack_length": length,
+            "tree_hash": tree_hash,
+            "wrapped_key": wrapped_key,
+            "key_id": key_id,
+        })
+
+    def abort(self):
+        self._f.close()
+        os.remove(self._tmp)
+
+    def commit(self):
+        """Finish the file and repoint the rows; returns the number of files packed."""
+        from .models import ArchivedBackup, Backup
+
+        if not self.entries:
+            self.abort()
+            return 0
+        index = json.dumps([
+            {"name": e["old_name"], "offset": e["pack_offset"], "length": e["pack_length"]} for e in self.entries
+        ]).encode()
+        self._f.write(index)
+        self._f.write(FOOTER.pack(len(index)))
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        self._f.close()
+        os.replace(self._tmp, self.path)
+
+        with transaction.atomic():
+            for entry in self.entries:
+                for model in (Backup, ArchivedBackup):
+                    model.objects.filter(file=entry["old_name"]).update(
+                        file=self.name,
+                        volume=self.volume,
+                        original_name=os.path.basename(entry["old_name"]),
+                        is_encrypted=True,
+                        pack_offset=entry["pack_offset"],
+                        pack_length=entry["pack_length"],
+                        tree_hash=entry["tree_hash"],
+                        wrapped_key=entry["wrapped_key"],
+                        key_id=entry["key_id"],
+                    )
+        for entry in self.entries:
+            backup_storage.delete(entry["old_name"])
+        return len(self.entries)
+
+
+def unpacked_rows(college_id, cutoff):
+    """One row per stored file of the college uploaded before `cutoff` and not packed yet, oldest first."""
+    from .models import ArchivedBackup, Backup
+
+    files = {}
+    for model in (ArchivedBackup, Backup):
+        rows = (
+            model.objects.filter(
+                college_id=college_id, uploaded_at__lt=cutoff, pack_offset__isnull=True, pending_deletion=False,
+            )
+            .exclude(file="")
+            .order_by("uploaded_at")
+        )
+        for row in rows.iterator():
+            files.setdefault(row.file.name, row)
+    return list(files.values())
+
+
+def pack_college(college, cutoff):
+    """Pack the college's old backups; returns (files packed, bytes before, bytes after)."""
+    packed = before = after = 0
+    writer = None
+    try:
+        for row in unpacked_rows(college.id, cutoff):
+            if not backup_storage.exists(row.file.name):
+                logger.warning(f"Backup file {row.file.name} is missing; not packed")
+                continue
+            if writer is None:
+                writer = PackWriter(college)
+            try:
+                writer.add(row)
+            except Exception as e:
+                logger.error(f"Failed to pack backup {row.id} ({row.file.name}): {e}")
+                continue
+            before += backup_storage.size(row.file.name)
+            if writer.size >= settings.BACKUP_PACK_MAX_BYTES:
+                after += writer.size
+                packed += writer.commit()
+                writer = None
+        if writer is not None:
+            after += writer.size
+            packed += writer.commit()
+            writer = None
+    finally:
+        if writer is not None:
+            writer.abort()
+    return packed, before, after
@@ -1,11 +1,16 @@
 from django.urls import path
-from .views import BackupUploadAPIView, backup_list, download_backup, college_backup_list
+from .views import (
+    BackupUploadAPIView, BackupPrecheckAPIView, BackupScheduleAPIView, backup_list, download_backup, college_backup_list, upload_schedule,
+)
 
 app_name = "backups"
 
 urlpatterns = [
     path('upload/', BackupUploadAPIView.as_view(), name='backup-upload'),
+    path('precheck/', BackupPrecheckAPIView.as_view(), name='backup-precheck'),
+    path('schedule/', BackupScheduleAPIView.as_view(), name='backup-schedule'),
     path("", backup_list, name="backup_list"),
+    path("schedule/load/", upload_schedule, name="upload_schedule"),
     path("download/<int:backup_id>/", download_backup, name="download_backup"),
     path("colleges/<int:college_id>/", college_backup_list, name="college_backup_list"),
 
@@ -0,0 +1,147 @@
+# utils/compression.py
+"""
+Verification of pre-compressed uploads.
+
+Colleges may send their dump gzip- or zstd-compressed. The compressed bytes
+are stored (and encrypted) as they are; here the stream is decompressed once
+as it is read, only to prove it is intact and to hash and measure the plain
+content, so checksums stay comparable whatever encoding was used.
+
+Decompression never holds more than a bounded piece of output at a time,
+and `max_size` caps the decompressed content, so a small compressed upload
+cannot expand without limit (a "zip bomb").
+
+zstd needs the optional `zstandard` package; without it zstd uploads are
+rejected.
+"""
+import hashlib
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+IDENTITY = "identity"
+GZIP = "gzip"
+ZSTD = "zstd"
+
+# Largest piece of decompressed output produced at once.
+OUTPUT_CHUNK = 1024 * 1024
+# zstandard has no max_length: a 4-byte zstd block can expand to 128 KiB, so
+# input is fed in slices this small to keep each call's output near 4 MiB.
+ZSTD_INPUT_SLICE = 128
+
+
+class CorruptStreamError(ValueError):
+    pass
+
+
+class ContentTooLargeError(CorruptStreamError):
+    """The (decompressed) content is larger than the allowed maximum."""
+
+
+def supported_encodings():
+    return (IDENTITY, GZIP, ZSTD) if zstandard else (IDENTITY, GZIP)
+
+
+class _GzipReader:
+    """Decompresses concatenated gzip members, like `gzip -d` does."""
+
+    def __init__(self):
+        self._d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self._in_member = False
+
+    def feed(self, data):
+        """Yield the decompressed content of `data` in pieces of at most OUTPUT_CHUNK bytes."""
+        if not data:
+            return
+        self._in_member = True
+        while True:
+            out = self._d.decompress(data, OUTPUT_CHUNK)
+            if out:
+                yield out
+            if self._d.eof:
+                data = self._d.unused_data
+                self._d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                self._in_member = bool(data)
+                if not data:
+                    return
+                continue
+            data = self._d.unconsumed_tail
+            # A full piece may leave output pending even with no input left.
+            if not data and len(out) < OUTPUT_CHUNK:
+                return
+
+    def finish(self):
+        if self._in_member:
+            raise CorruptStreamError("Truncated gzip stream.")
+
+
+class _ZstdReader:
+    """Decompresses concatenated zstd frames, like `zstd -d` does."""
+
+    def __init__(self):
+        self._d = zstandard.ZstdDecompressor().decompressobj()
+        self._in_frame = False
+
+    def feed(self, data):
+        """Yield the decompressed content of `data` in pieces of bounded size."""
+        view = memoryview(data)
+        for start in range(0, len(view), ZSTD_INPUT_SLICE):
+            piece = view[start:start + ZSTD_INPUT_SLICE]
+            while piece:
+                self._in_frame = True
+                out = self._d.decompress(piece)
+                if out:
+                    yield out
+                if not self._d.eof:
+                    break
+                piece = self._d.unused_data
+                self._d = zstandard.ZstdDecompressor().decompressobj()
+                self._in_frame = False
+
+    def finish(self):
+        if self._in_frame:
+            raise CorruptStreamError("Truncated zstd stream.")
+
+
+def digest_stream(chunks, encoding=IDENTITY, sink=None, max_size=None):
+    """
+    Hash the decompressed content of `chunks`, also passing it to `sink` if given.
+    Returns (sha256 hex digest, decompressed size); raises CorruptStreamError,
+    or ContentTooLargeError once the content exceeds `max_size` bytes.
+    """
+    if encoding not in supported_encodings():
+        raise CorruptStreamError(f"Unsupported content encoding '{encoding}'.")
+
+    sha256 = hashlib.sha256()
+    size = 0
+
+    def take(data):
+        nonlocal size
+        size += len(data)
+        if max_size is not None and size > max_size:
+            raise ContentTooLargeError(f"Content is larger than the {max_size} byte limit.")
+        sha256.update(data)
+        if sink:
+            sink(data)
+
+    if encoding == IDENTITY:
+        for chunk in chunks:
+            take(chunk)
+        return sha256.hexdigest(), size
+
+    reader = _GzipReader() if encoding == GZIP else _ZstdReader()
+    try:
+        for chunk in chunks:
+            for data in reader.feed(chunk):
+                take(data)
+        reader.finish()
+    except (zlib.error, EOFError) as e:
+        raise CorruptStreamError(f"Invalid {encoding} stream: {e}")
+    except Exception as e:
+        if zstandard and isinstance(e, zstandard.ZstdError):
+            raise CorruptStreamError(f"Invalid {encoding} stream: {e}")
+        raise
+    return sha256.hexdigest(), size
@@ -1,21 +1,148 @@
 # utils/encryption.py
+"""
+Envelope encryption for backup files.
+
+Every backup is encrypted with its own random data key. The data key is
+stored on the Backup row, wrapped (encrypted) by a master key, together with
+the master key's id. Master keys come from BACKUP_MASTER_KEYS:
+
+    BACKUP_MASTER_KEYS="2024-06:<fernet key>,2023-01:<fernet key>"
+
+The first entry wraps new data keys; the others only unwrap. Rotating a
+master key therefore means rewrapping the small data keys
+(`manage.py rotate_backup_keys`), never rewriting the files.
+
+Without BACKUP_MASTER_KEYS, BACKUP_ENCRYPTION_KEY is used as the master key
+under the id "default". Files encrypted before envelope encryption (no
+wrapped key) are still decrypted with BACKUP_ENCRYPTION_KEY directly.
+
+Files of at least BACKUP_PARALLEL_THRESHOLD bytes are written in the
+segmented format instead of as one Fernet token, so that segments can be
+encrypted and decrypted on BACKUP_CRYPTO_WORKERS threads at once
+(`cryptography` releases the GIL):
+
+    MAGIC | flags (1 byte, reserved) | segment size (4 bytes)
+    then per segment: token length (4 bytes) | Fernet token
+
+Each plaintext segment is hashed as well, and the SHA-256 of the segment
+digests (a two-level hash tree) is returned so it can be checked on decrypt.
+
+Pack entries (see backups/tiering.py) use the same segments, optionally
+zlib-compressing each one before it is encrypted, behind a small header:
+
+    flags (1 byte, 0x01 = zlib) | plaintext size (8 bytes)
+    then per segment: token length (4 bytes) | Fernet token
+"""
+import hashlib
 import os
+import struct
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
 from cryptography.fernet import Fernet
 from django.conf import settings
+from monitoring.metrics import track_crypto
+
+MAGIC = b"CMSEG\x01"
+HEADER = struct.Struct(">cI")  # flags, segment size
+LENGTH = struct.Struct(">I")
+ENTRY_HEADER = struct.Struct(">cQ")  # flags, plaintext size
+ENTRY_ZLIB = 0x01
+
+DEFAULT_KEY_ID = "default"
 
 
 def get_cipher():
     key = os.getenv("BACKUP_ENCRYPTION_KEY")
     if not key:
         raise ValueError("Encryption key not found in environment variables.")
+    return _fernet(key)
+
+
+def master_keys():
+    """Ordered {key_id: key}; the first one is current."""
+    raw = os.getenv("BACKUP_MASTER_KEYS", "").strip()
+    if not raw:
+        key = os.getenv("BACKUP_ENCRYPTION_KEY")
+        if not key:
+            raise ValueError("No master key found: set BACKUP_MASTER_KEYS or BACKUP_ENCRYPTION_KEY.")
+        return {DEFAULT_KEY_ID: key}
+
+    keys = {}
+    for entry in raw.split(","):
+        key_id, sep, key = entry.strip().partition(":")
+        if not sep or not key_id or not key:
+            raise ValueError("BACKUP_MASTER_KEYS entries must look like '<key id>:<fernet key>'.")
+        keys[key_id] = key
+    return keys
+
+
+def current_key_id():
+    return next(iter(master_keys()))
+
+
+def master_cipher(key_id):
+    try:
+        return _fernet(master_keys()[key_id])
+    except KeyError:
+        raise ValueError(f"Master key '{key_id}' is not configured.")
+
+
+@lru_cache(maxsize=16)
+def _fernet(key):
     return Fernet(key)
 
 
-def encrypt_file(input_path, output_path=None):
-    cipher = get_cipher()
+@lru_cache(maxsize=1024)
+def _data_cipher(wrapped_key, master_key):
+    return Fernet(_fernet(master_key).decrypt(wrapped_key.encode()))
+
+
+def data_cipher(wrapped_key, key_id):
+    """Unwrapped cipher for one backup, cached in-process."""
+    try:
+        master_key = master_keys()[key_id]
+    except KeyError:
+        raise ValueError(f"Master key '{key_id}' is not configured.")
+    return _data_cipher(wrapped_key, master_key)
+
+
+def new_data_key():
+    """Return (wrapped_key, key_id) for a fresh data key wrapped by the current master key."""
+    key_id = current_key_id()
+    wrapped = master_cipher(key_id).encrypt(Fernet.generate_key())
+    return wrapped.decode(), key_id
+
+
+def rewrap(wrapped_key, key_id, new_key_id):
+    """Re-encrypt a wrapped data key under another master key."""
+    data_key = master_cipher(key_id).decrypt(wrapped_key.encode())
+    return master_cipher(new_key_id).encrypt(data_key).decode()
+
+
+def wrap_legacy_key(key_id):
+    """
+    BACKUP_ENCRYPTION_KEY wrapped by master key `key_id`, to serve as the data
+    key of files encrypted with it directly (before envelope encryption).
+    """
+    key = os.getenv("BACKUP_ENCRYPTION_KEY")
+    if not key:
+        raise ValueError("BACKUP_ENCRYPTION_KEY is needed for backups encrypted before envelope encryption.")
+    return master_cipher(key_id).encrypt(key.encode()).decode()
+
+
+def _cipher_for(wrapped_key, key_id):
+    return data_cipher(wrapped_key, key_id) if wrapped_key else get_cipher()
+
+
+def encrypt_file(input_path, output_path=None, wrapped_key=None, key_id=None):
+    cipher = _cipher_for(wrapped_key, key_id)
     with open(input_path, "rb") as f:
         data = f.read()
-    encrypted = cipher.encrypt(data)
+    with track_crypto("encrypt", len(data)):
+        encrypted = cipher.encrypt(data)
 
     # Write encrypted data
     if not output_path:
@@ -25,10 +152,162 @@ def encrypt_file(input_path, output_path=None):
     return output_path
 
 
-def decrypt_file(input_path, output_path):
-    cipher = get_cipher()
+def decrypt_file(input_path, output_path, wrapped_key=None, key_id=None, tree_hash=None):
+    cipher = _cipher_for(wrapped_key, key_id)
+    with open(input_path, "rb") as f:
+        segmented = f.read(len(MAGIC)) == MAGIC
+    if segmented:
+        return _decrypt_segmented(cipher, input_path, output_path, tree_hash)
+
     with open(input_path, "rb") as f:
         enc_data = f.read()
-    dec_data = cipher.decrypt(enc_data)
+    with track_crypto("decrypt", len(enc_data)):
+        dec_data = cipher.decrypt(enc_data)
     with open(output_path, "wb") as f:
         f.write(dec_data)
+
+
+def use_parallel(size):
+    return settings.BACKUP_CRYPTO_WORKERS > 1 and size >= settings.BACKUP_PARALLEL_THRESHOLD
+
+
+def encrypt_backup_file(input_path, wrapped_key=None, key_id=None):
+    """
+    Encrypt `input_path` to `<input_path>.enc`, in parallel segments for large files.
+    Returns (output path, tree hash or None).
+    """
+    if use_parallel(os.path.getsize(input_path)):
+        return encrypt_file_parallel(input_path, wrapped_key=wrapped_key, key_id=key_id)
+    return encrypt_file(input_path, wrapped_key=wrapped_key, key_id=key_id), None
+
+
+def _ordered_map(pool, fn, items):
+    """pool.map that keeps at most 2x workers segments in memory."""
+    window = settings.BACKUP_CRYPTO_WORKERS * 2
+    pending = deque()
+    for item in items:
+        pending.append(pool.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def _read_segments(f, size):
+    while True:
+        segment = f.read(size)
+        if not segment:
+            return
+        yield segment
+
+
+def _read_tokens(f, limit=None):
+    while limit is None or limit > 0:
+        prefix = f.read(LENGTH.size)
+        if not prefix:
+            return
+        if len(prefix) != LENGTH.size:
+            raise ValueError("Truncated segmented backup file.")
+        (length,) = LENGTH.unpack(prefix)
+        token = f.read(length)
+        if len(token) != length:
+            raise ValueError("Truncated segmented backup file.")
+        if limit is not None:
+            limit -= LENGTH.size + length
+        yield token
+
+
+def encrypt_file_parallel(input_path, output_path=None, wrapped_key=None, key_id=None):
+    cipher = _cipher_for(wrapped_key, key_id)
+    segment_size = settings.BACKUP_SEGMENT_SIZE
+    output_path = output_path or f"{input_path}.enc"
+
+    def seal(segment):
+        return hashlib.sha256(segment).digest(), cipher.encrypt(segment)
+
+    tree = hashlib.sha256()
+    with track_crypto("encrypt", os.path.getsize(input_path)), \
+            open(input_path, "rb") as src, open(output_path, "wb") as dst, \
+            ThreadPoolExecutor(max_workers=settings.BACKUP_CRYPTO_WORKERS) as pool:
+        dst.write(MAGIC + HEADER.pack(b"\x00", segment_size))
+        for digest, token in _ordered_map(pool, seal, _read_segments(src, segment_size)):
+            tree.update(digest)
+            dst.write(LENGTH.pack(len(token)))
+            dst.write(token)
+    return output_path, tree.hexdigest()
+
+
+def _decrypt_segmented(cipher, input_path, output_path, tree_hash=None):
+    def open_segment(token):
+        segment = cipher.decrypt(token)
+        return hashlib.sha256(segment).digest(), segment
+
+    tree = hashlib.sha256()
+    with track_crypto("decrypt", os.path.getsize(input_path)), \
+            open(input_path, "rb") as src, open(output_path, "wb") as dst, \
+            ThreadPoolExecutor(max_workers=max(1, settings.BACKUP_CRYPTO_WORKERS)) as pool:
+        src.read(len(MAGIC) + HEADER.size)
+        for digest, segment in _ordered_map(pool, open_segment, _read_tokens(src)):
+            tree.update(digest)
+            dst.write(segment)
+
+    if tree_hash and tree.hexdigest() != tree_hash:
+        raise ValueError("Backup integrity check failed: segment tree hash does not match.")
+
+
+def encrypt_pack_entry(src, dst, compress=True, wrapped_key=None, key_id=None):
+    """
+    Append plaintext file object `src` to `dst` as one pack entry.
+    Returns (entry length in bytes, tree hash).
+    """
+    cipher = _cipher_for(wrapped_key, key_id)
+    level = settings.BACKUP_PACK_COMPRESSION_LEVEL
+
+    def seal(segment):
+        data = zlib.compress(segment, level) if compress else segment
+        return hashlib.sha256(segment).digest(), len(segment), cipher.encrypt(data)
+
+    start = dst.tell()
+    flags = bytes([ENTRY_ZLIB if compress else 0])
+    dst.write(ENTRY_HEADER.pack(flags, 0))
+    tree = hashlib.sha256()
+    size = 0
+    with track_crypto("encrypt", os.fstat(src.fileno()).st_size), \
+            ThreadPoolExecutor(max_workers=max(1, settings.BACKUP_CRYPTO_WORKERS)) as pool:
+        for digest, length, token in _ordered_map(pool, seal, _read_segments(src, settings.BACKUP_SEGMENT_SIZE)):
+            tree.update(digest)
+            size += length
+            dst.write(LENGTH.pack(len(token)))
+            dst.write(token)
+    end = dst.tell()
+    dst.seek(start)
+    dst.write(ENTRY_HEADER.pack(flags, size))
+    dst.seek(end)
+    return end - start, tree.hexdigest()
+
+
+def decrypt_pack_entry(pack_path, offset, length, output_path, wrapped_key=None, key_id=None, tree_hash=None):
+    """Decrypt the entry at `offset` of a pack file to `output_path`."""
+    cipher = _cipher_for(wrapped_key, key_id)
+    with open(pack_path, "rb") as src:
+        src.seek(offset)
+        flags, size = ENTRY_HEADER.unpack(src.read(ENTRY_HEADER.size))
+        compressed = flags[0] & ENTRY_ZLIB
+
+        def open_segment(token):
+            data = cipher.decrypt(token)
+            segment = zlib.decompress(data) if compressed else data
+            return hashlib.sha256(segment).digest(), segment
+
+        tree = hashlib.sha256()
+        written = 0
+        with track_crypto("decrypt", length), open(output_path, "wb") as dst, \
+                ThreadPoolExecutor(max_workers=max(1, settings.BACKUP_CRYPTO_WORKERS)) as pool:
+            tokens = _read_tokens(src, limit=length - ENTRY_HEADER.size)
+            for digest, segment in _ordered_map(pool, open_segment, tokens):
+                tree.update(digest)
+                written += len(segment)
+                dst.write(segment)
+
+    if written != size or (tree_hash and tree.hexdigest() != tree_hash):
+        raise ValueError("Backup integrity check failed: pack entry does not match its index.")
@@ -0,0 +1,160 @@
+# utils/manifest.py
+"""
+Manifest of a mysqldump file, built while the upload is hashed.
+
+`DumpManifest.feed` is given the plain (decompressed) dump in chunks, the
+same chunks digest_stream hashes, so no extra pass over the data is made.
+Only line starts are inspected; long extended-INSERT lines are otherwise
+just scanned with bytes.count. The manifest lists, per table:
+
+    create      [offset, length] of its CREATE TABLE statement
+    inserts     [[offset, length], ...] of its runs of INSERT statements
+    statements  number of INSERT statements
+    rows        row estimate: tuples counted by their "),(" separators
+    data_bytes  bytes of INSERT statements
+
+Offsets are into the plain dump, i.e. what Backup.decrypt_to writes
+(decompressed when the upload was compressed). `complete` is set when the
+"-- Dump completed" trailer mysqldump writes last was seen.
+"""
+import re
+from functools import lru_cache
+
+HEAD_BYTES = 512
+SHORT_LINE = 4096
+STATEMENT = re.compile(
+    rb"(CREATE TABLE|INSERT(?: IGNORE)? INTO|REPLACE INTO)\s+(?:IF NOT EXISTS\s+)?`?([^`\s(]+)`?"
+)
+USE = re.compile(rb"USE\s+`?([^`;\s]+)`?")
+SEPARATOR = b"),("
+
+
+def _name(raw):
+    return raw.decode("utf-8", "replace")
+
+
+@lru_cache(maxsize=64)
+def _run_pattern(prefix):
+    """Consecutive complete one-line statements starting with `prefix`."""
+    return re.compile(rb"(?:" + re.escape(prefix) + rb"(?=[\s(])[^\n]*;\r?\n)+")
+
+
+class DumpManifest:
+    """Builds the manifest of a dump from its plain content, fed in order."""
+
+    def __init__(self):
+        self.size = 0
+        self.database = None
+        self.complete = False
+        self._tables = {}
+        self._statement = None  # [kind, table, start offset, separators, prefix]
+        self._run = None  # (pattern, table) matching lines like the last INSERT
+        self._new_line(0)
+
+    def _new_line(self, start):
+        self._line_start = start
+        self._head = b""
+        self._classified = False
+        self._separators = 0
+        self._tail = b""
+
+    def _table(self, raw):
+        key = (self.database, _name(raw))
+        if key not in self._tables:
+            self._tables[key] = {
+                "name": key[1], "database": key[0], "create": None, "inserts": [],
+                "statements": 0, "rows": 0, "data_bytes": 0,
+            }
+        return self._tables[key]
+
+    def _classify(self):
+        self._classified = True
+        if self._statement is not None:  # continuation of a multi-line statement
+            return
+        head = self._head
+        match = STATEMENT.match(head)
+        if match:
+            kind = "create" if match[1] == b"CREATE TABLE" else "insert"
+            self._statement = [kind, self._table(match[2]), self._line_start, 0, head[:match.end()]]
+        elif head.startswith(b"USE "):
+            match = USE.match(head)
+            if match:
+                self.database = _name(match[1])
+        elif head.startswith(b"-- Dump completed"):
+            self.complete = True
+
+    def _close_statement(self, end):
+        kind, table, start, separators, prefix = self._statement
+        self._statement = None
+        if kind == "create":
+            table["create"] = [start, end - start]
+            return
+        self._add_inserts(table, start, end - start, 1, separators)
+        self._run = (_run_pattern(prefix), table)
+
+    @staticmethod
+    def _add_inserts(table, start, length, statements, separators):
+        table["statements"] += statements
+        table["rows"] += separators + statements
+        table["data_bytes"] += length
+        runs = table["inserts"]
+        if runs and runs[-1][0] + runs[-1][1] == start:
+            runs[-1][1] += length
+        else:
+            runs.append([start, length])
+
+    def _take_run(self, data, pos):
+        """Consume a run of one-line INSERTs like the previous one in a single match; returns the new position."""
+        pattern, table = self._run
+        match = pattern.match(data, pos)
+        if not match:
+            return pos
+        end = match.end()
+        self._add_inserts(table, self.size, end - pos, data.count(b"\n", pos, end), data.count(SEPARATOR, pos, end))
+        self.size += end - pos
+        self._new_line(self.size)
+        return end
+
+    def _end_line(self):
+        if not self._classified:
+            self._classify()
+        if self._statement is not None:
+            self._statement[3] += self._separators
+            if self._tail.rstrip(b"\r\n").endswith(b";"):
+                self._close_statement(self.size)
+        self._new_line(self.size)
+
+    def feed(self, data):
+        pos, n = 0, len(data)
+        while pos < n:
+            newline = data.find(b"\n", pos)
+            # One-row-per-line dumps (--skip-extended-insert) would otherwise cost a loop per row.
+            if self._run and 0 <= newline - pos < SHORT_LINE and not self._head and self._statement is None:
+                run_end = self._take_run(data, pos)
+                if run_end != pos:
+                    pos = run_end
+                    continue
+            end = n if newline < 0 else newline + 1
+            if not self._classified:
+                self._head += data[pos:min(end, pos + HEAD_BYTES - len(self._head))]
+                if len(self._head) >= HEAD_BYTES:
+                    self._classify()
+            # Separators split across chunks are found in the old tail plus the new start.
+            self._separators += (self._tail[-2:] + data[pos:pos + 2]).count(SEPARATOR)
+            self._separators += data.count(SEPARATOR, pos, end)
+            self._tail = (self._tail + data[max(pos, end - 3):end])[-3:]
+            self.size += end - pos
+            if newline >= 0:
+                self._end_line()
+            pos = end
+
+    def finish(self):
+        """The manifest as a JSON-serialisable dict."""
+        if self._line_start < self.size:
+            self._end_line()
+        return {
+            "format": "mysqldump",
+            "size": self.size,
+            "complete": self.complete and self._statement is None,
+            "tables": list(self._tables.values()),
+        }
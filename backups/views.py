@@ -2,7 +2,7 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework_api_key.permissions import HasAPIKey
-from .serializers import BackupUploadSerializer
+from .serializers import BackupUploadSerializer, BackupPrecheckSerializer
 from colleges.models import College
 from rest_framework_api_key.models import APIKey
 from django.shortcuts import render, get_object_or_404
@@ -10,12 +10,18 @@ from django.contrib.auth.decorators import login_required
 from django.http import HttpResponse, Http404
 from django.conf import settings
 import os
+import time
 from .models import Backup
 from io import BytesIO
 import zipfile
 import logging
 from tempfile import NamedTemporaryFile
-from .utils.encryption import decrypt_file
+from .admission import admit_upload
+from .cleanup import DECRYPT_PREFIX
+from .idempotency import idempotent
+from . import scheduling
+from monitoring.metrics import DOWNLOADS, UPLOAD_BYTES, UPLOAD_LATENCY, UPLOAD_SKIPPED_BYTES
+from checkmate_central.db_routers import use_replica
 
 logger = logging.getLogger(__name__)
 
@@ -50,10 +56,13 @@ class BackupUploadAPIView(APIView):
     """
     Receives a MySQL backup file from an authenticated college.
     Requires header: Authorization: Api-Key <college_api_key>
+    Optional header: Idempotency-Key <unique per dump>, so retries are not stored twice.
     """
     permission_classes = [HasAPIKey]
 
+    @idempotent("upload")
     def post(self, request):
+        started = time.perf_counter()
         college = get_college_from_request(request)
         user_info = get_user_info(request)
 
@@ -61,9 +70,31 @@ class BackupUploadAPIView(APIView):
             logger.warning(f"{user_info} attempted unauthorized backup upload (invalid API key).")
             return Response({"error": "Invalid API key"}, status=403)
 
+        # Checked before request.data is touched, so a rejected client never
+        # gets its body read.
+        admission = admit_upload(college)
+        if not admission.admitted:
+            logger.warning(
+                f"Backup upload for {college.name} ({college.code}) rejected by admission control "
+                f"({admission.status_code}, retry after {admission.retry_after}s)"
+            )
+            UPLOAD_LATENCY.labels(college=college.code, status="rejected").observe(time.perf_counter() - started)
+            return Response(
+                {"error": "Upload capacity reached. Retry later.", "retry_after": admission.retry_after},
+                status=admission.status_code,
+                headers={"Retry-After": str(admission.retry_after)},
+            )
+        try:
+            return self.ingest(request, college, user_info, started)
+        finally:
+            admission.release()
+
+    def ingest(self, request, college, user_info, started):
         serializer = BackupUploadSerializer(data=request.data)
         if serializer.is_valid():
             backup = serializer.save(college=college)
+            UPLOAD_BYTES.labels(college=college.code).observe(backup.file_size or 0)
+            UPLOAD_LATENCY.labels(college=college.code, status="created").observe(time.perf_counter() - started)
             logger.info(
                 f"Backup uploaded successfully for {college.name} ({college.code}) "
                 f"by {user_info}. Size: {backup.file_size} bytes"
@@ -72,6 +103,8 @@ class BackupUploadAPIView(APIView):
                 "message": "Backup uploaded successfully.",
                 "college": college.code,
                 "file_size": backup.file_size,
+                "content_encoding": backup.content_encoding,
+                "content_size": backup.content_size,
                 "checksum": backup.checksum,
                 "uploaded_at": backup.uploaded_at,
             }, status=status.HTTP_201_CREATED)
@@ -80,10 +113,118 @@ class BackupUploadAPIView(APIView):
             f"Backup upload failed validation for {college.name} ({college.code}) by {user_info}. "
             f"Errors: {serializer.errors}"
         )
+        UPLOAD_LATENCY.labels(college=college.code, status="invalid").observe(time.perf_counter() - started)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class BackupPrecheckAPIView(APIView):
+    """
+    Lets a college skip uploading a dump the server already holds.
+    The client sends {"size", "sha256"} of the plain dump before the upload;
+    if identical content is stored for that college, a new Backup sharing the
+    existing file is recorded and the client is told to skip the body.
+    Requires header: Authorization: Api-Key <college_api_key>
+    """
+    permission_classes = [HasAPIKey]
+
+    @idempotent("precheck")
+    def post(self, request):
+        college = get_college_from_request(request)
+        if not college:
+            return Response({"error": "Invalid API key"}, status=403)
+
+        serializer = BackupPrecheckSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        data = serializer.validated_data
+        probe = Backup(college=college, checksum=data["sha256"], content_size=data["size"])
+        existing = probe.find_duplicate()
+        if existing is None:
+            return Response({"skip_upload": False}, status=status.HTTP_200_OK)
+
+        backup = Backup.objects.create(
+            college=college,
+            file=existing.file.name,
+            volume=existing.volume,
+            file_size=existing.file_size,
+            content_size=existing.content_size,
+            content_encoding=existing.content_encoding,
+            checksum=existing.checksum,
+            is_encrypted=existing.is_encrypted,
+            wrapped_key=existing.wrapped_key,
+            key_id=existing.key_id,
+            tree_hash=existing.tree_hash,
+            pack_offset=existing.pack_offset,
+            pack_length=existing.pack_length,
+            original_name=existing.original_name,
+            manifest=existing.manifest,
+            remarks=data.get("remarks") or f"Unchanged since backup #{existing.id}",
+        )
+        UPLOAD_SKIPPED_BYTES.labels(college=college.code).inc(backup.file_size or 0)
+        logger.info(
+            f"Unchanged backup for {college.name} ({college.code}) recorded without upload; "
+            f"shares the file of backup #{existing.id} ({existing.file_size} bytes)"
+        )
+        return Response({
+            "skip_upload": True,
+            "message": "Identical backup already stored; upload skipped.",
+            "college": college.code,
+            "file_size": backup.file_size,
+            "checksum": backup.checksum,
+            "uploaded_at": backup.uploaded_at,
+        }, status=status.HTTP_201_CREATED)
+
+
+class BackupScheduleAPIView(APIView):
+    """
+    Tells an authenticated college when to push its next backup.
+    Requires header: Authorization: Api-Key <college_api_key>
+    """
+    permission_classes = [HasAPIKey]
+
+    def get(self, request):
+        college = get_college_from_request(request)
+        if not college:
+            return Response({"error": "Invalid API key"}, status=403)
+
+        window = scheduling.next_window(college)
+        logger.info(f"Upload window {window.start:%Y-%m-%d %H:%M} assigned to {college.code}")
+        return Response({
+            "college": college.code,
+            "window_start": window.start,
+            "window_end": window.end,
+            "predicted_bytes": window.predicted_bytes,
+            "predicted_seconds": window.predicted_seconds,
+        })
+
+
 @login_required
+@use_replica
+def upload_schedule(request):
+    user_info = get_user_info(request)
+
+    if request.user.role != "STAFF":
+        logger.warning(f"Unauthorized access to upload schedule by {user_info}")
+        return HttpResponse("Unauthorized", status=403)
+
+    plan = scheduling.get_plan(scheduling.night_start_for())
+    peak = max(plan.usual_load + plan.planned_load + [1])
+    context = {
+        "plan": plan,
+        "curve": [
+            (start, planned, usual, planned * 100 // peak, usual * 100 // peak)
+            for start, planned, usual in plan.curve
+        ],
+        "assignments": sorted(plan.assignments.values(), key=lambda a: (a.start, a.code)),
+        "planned_peak": max(plan.planned_load),
+        "usual_peak": max(plan.usual_load),
+    }
+    return render(request, "backups/upload_schedule.html", context)
+
+
+@login_required
+@use_replica
 def backup_list(request):
     user_info = get_user_info(request)
 
@@ -91,22 +232,22 @@ def backup_list(request):
         logger.warning(f"Unauthorized access to backup list by {user_info}")
         return HttpResponse("Unauthorized", status=403)
 
-    colleges = College.objects.all()
-    college_last_backups = {
-        college.id: college.backups.order_by('-uploaded_at').first() for college in colleges
-    }
+    colleges = College.objects.filter(pending_deletion=False).annotate(
+        last_backup_time=Backup.objects.last_backup_time()
+    )
 
     logger.info(f"Backup list viewed by {user_info}")
-    context = {"colleges": colleges, "college_last_backups": college_last_backups}
+    context = {"colleges": colleges}
     return render(request, "backups/backup_list.html", context)
 
 
 @login_required
+@use_replica
 def college_backup_list(request, college_id):
     user_info = get_user_info(request)
 
-    college = get_object_or_404(College, id=college_id)
-    backups = Backup.objects.filter(college=college).order_by('-uploaded_at')
+    college = get_object_or_404(College, id=college_id, pending_deletion=False)
+    backups = Backup.objects.catalog(college=college)
 
     start_date = request.GET.get('start_date')
     end_date = request.GET.get('end_date')
@@ -135,10 +276,10 @@ def college_backup_list(request, college_id):
             for backup in backups:
                 if os.path.exists(backup.file.path):
                     if backup.is_encrypted:
-                        with NamedTemporaryFile(delete=False) as temp_file:
-                            decrypt_file(backup.file.path, temp_file.name)
+                        with NamedTemporaryFile(prefix=DECRYPT_PREFIX) as temp_file:
+                            backup.decrypt_to(temp_file.name)
                             temp_file.seek(0)
-                            relative_path = os.path.join(college.code, os.path.basename(backup.file.name).replace(".enc", ""))
+                            relative_path = os.path.join(college.code, backup.download_name)
                             zip_file.write(temp_file.name, relative_path)
                     else:
                         relative_path = os.path.join(college.code, os.path.basename(backup.file.name))
@@ -158,6 +299,7 @@ def college_backup_list(request, college_id):
             filename += f'_{end_date}'
         filename += '.zip'
 
+        DOWNLOADS.labels(college=college.code, kind="zip").inc()
         logger.info(
             f"Backups downloaded for {college.code} by {user_info} "
             f"({backups.count()} files)"
@@ -172,16 +314,21 @@ def college_backup_list(request, college_id):
         "backups": backups,
         "start_date": start_date,
         "end_date": end_date,
+        # file_size, not the file on disk: packed backups share one pack file.
         "total_size": sum(
-            b.file.size for b in backups if b.file and os.path.exists(b.file.path)
+            b.file_size or 0 for b in backups if b.file and os.path.exists(b.file.path)
         ),
     }
     return render(request, "backups/college_backup_list.html", context)
 
 @login_required
+@use_replica
 def download_backup(request, backup_id):
     user_info = get_user_info(request)
-    backup = get_object_or_404(Backup, id=backup_id)
+    try:
+        backup = Backup.objects.catalog().get(id=backup_id)
+    except Backup.DoesNotExist:
+        raise Http404
     file_path = backup.file.path
 
     if not os.path.exists(file_path):
@@ -189,13 +336,14 @@ def download_backup(request, backup_id):
         raise Http404
 
     logger.info(f"Backup downloaded by {user_info} ({backup.college.code}) - {file_path}")
+    DOWNLOADS.labels(college=backup.college.code, kind="single").inc()
 
     if backup.is_encrypted:
-        with NamedTemporaryFile(delete=False) as temp_file:
-            decrypt_file(file_path, temp_file.name)
+        with NamedTemporaryFile(prefix=DECRYPT_PREFIX) as temp_file:
+            backup.decrypt_to(temp_file.name)
             temp_file.seek(0)
             response = HttpResponse(temp_file.read(), content_type="application/octet-stream")
-        response['Content-Disposition'] = f'attachment; filename="{os.path.basename(file_path).replace(".enc", "")}"'
+        response['Content-Disposition'] = f'attachment; filename="{backup.download_name}"'
     else:
         with open(file_path, 'rb') as fh:
             response = HttpResponse(fh.read(), content_type="application/octet-stream")
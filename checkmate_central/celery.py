@@ -1,5 +1,6 @@
 # myproject/celery.py
 import os
+from fnmatch import fnmatch
 from celery import Celery
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'checkmate_central.settings')
@@ -7,3 +8,28 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'checkmate_central.settings')
 app = Celery('checkmate_central')
 app.config_from_object('django.conf:settings', namespace='CELERY')
 app.autodiscover_tasks()
+
+# Celery's Django fixup runs close_if_unusable_or_obsolete() on every
+# connection before and after each task. Workers therefore keep connections
+# for DATABASES CONN_MAX_AGE, and a connection broken by a MySQL restart is
+# health-checked and replaced. Leave CELERY_DB_REUSE_MAX unset: it would
+# override CONN_MAX_AGE.
+
+# Tasks on these queues are acknowledged only after they finish, so a worker
+# crash or deploy mid-run re-queues the job instead of losing it.
+ACKS_LATE_QUEUES = {'backups', 'replication', 'maintenance'}
+
+
+class QueueTaskDefaults:
+    """Task annotations applied per queue, based on CELERY_TASK_ROUTES."""
+
+    def annotate(self, task):
+        for pattern, route in (app.conf.task_routes or {}).items():
+            if fnmatch(task.name, pattern):
+                if route.get('queue') in ACKS_LATE_QUEUES:
+                    return {'acks_late': True, 'reject_on_worker_lost': True}
+                return None
+        return None
+
+
+app.conf.task_annotations = (QueueTaskDefaults(),)
@@ -0,0 +1,102 @@
+"""
+Primary/replica database routing.
+
+Writes always go to "default" (the MySQL primary). Reads go there too,
+except inside code marked with `use_replica`: read-heavy views such as the
+dashboards and backup lists, and export jobs. Their reads go to one of
+settings.REPLICA_DATABASES, so heavy reporting does not compete with the
+nightly upload ingest on the primary.
+
+Read-your-writes: replicas lag a little behind the primary, so
+- a `use_replica` block that writes reads from the primary for the rest of
+  the block;
+- after a browser request that changed something (any unsafe method),
+  `ReplicaPinMiddleware` sets a short-lived cookie. While it is present, that
+  user's requests read from the primary for REPLICA_STICKY_SECONDS.
+
+Without configured replicas, all of this is a no-op.
+"""
+import random
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.http import HttpRequest
+
+PIN_COOKIE = "db_primary"
+
+_reads = ContextVar("replica_reads", default=None)
+
+
+class _ReplicaReads:
+    def __init__(self, alias):
+        self.alias = alias
+        self.pinned = False
+
+
+def is_pinned(request):
+    return PIN_COOKIE in request.COOKIES
+
+
+def use_replica(func):
+    """Run `func`'s reads on a replica. For views, honours the read-your-writes cookie."""
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        request = next((a for a in args if isinstance(a, HttpRequest)), None)
+        if not settings.REPLICA_DATABASES or (request is not None and is_pinned(request)):
+            return func(*args, **kwargs)
+
+        token = _reads.set(_ReplicaReads(random.choice(settings.REPLICA_DATABASES)))
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _reads.reset(token)
+
+    return wrapper
+
+
+class PrimaryReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        reads = _reads.get()
+        if reads is None or reads.pinned:
+            return None
+        return reads.alias
+
+    def db_for_write(self, model, **hints):
+        reads = _reads.get()
+        if reads is not None:
+            reads.pinned = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaPinMiddleware:
+    """Pin a user's reads to the primary for a while after they change something."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if (
+            settings.REPLICA_DATABASES
+            and request.method not in ("GET", "HEAD", "OPTIONS", "TRACE")
+            and response.status_code < 400
+        ):
+            response.set_cookie(
+                PIN_COOKIE, "1",
+                max_age=settings.REPLICA_STICKY_SECONDS,
+                secure=request.is_secure(),
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
@@ -0,0 +1,280 @@
+"""
+Non-blocking logging handlers.
+
+The handlers used in settings.LOGGING only put records on an in-memory queue;
+a listener thread per handler drains the queue in batches, writes them with a
+single flush, and rotates the files so `logs/` stays bounded. Request threads
+never touch the disk.
+
+Every gunicorn worker and Celery prefork child has its own listener on the
+same files. Each batch is appended with one O_APPEND write, so lines of
+different processes never interleave. Rollover happens under an exclusive
+lock on "<file>.lock" and is re-checked there, and a process whose file was
+rotated by another one reopens it (like WatchedFileHandler) instead of
+rotating again.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+import weakref
+from datetime import datetime, timezone
+
+try:
+    import fcntl
+except ImportError:  # not on Windows; rotation is then unlocked
+    fcntl = None
+
+BATCH_SIZE = 500
+QUEUE_SIZE = 10000
+
+_active_handlers = weakref.WeakSet()
+# File objects inherited across fork(); kept alive so their buffers (and any
+# lock the parent's listener held) are never flushed or touched in the child.
+_inherited_streams = []
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, for log shippers."""
+
+    def format(self, record):
+        payload = {
+            "timestamp": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "process": record.process,
+            "thread": record.threadName,
+        }
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False)
+
+
+class BatchWriteMixin:
+    """Write many records with one append, rotating safely when several processes share the file."""
+
+    def emit_batch(self, records):
+        lines = []
+        for record in records:
+            try:
+                lines.append(self.format(record) + self.terminator)
+            except Exception:
+                self.handleError(record)
+        if not lines:
+            return
+        data = "".join(lines).encode(self.encoding or "utf-8")
+        self.acquire()
+        try:
+            if self._rotated_elsewhere():
+                self._reopen()
+            if self.rollover_due(len(data)):
+                self._locked_rollover()
+            if self.stream is None:
+                self.stream = self._open()
+            fd = self.stream.fileno()
+            view = memoryview(data)
+            while view:
+                view = view[os.write(fd, view):]
+        except Exception:
+            self.handleError(records[-1])
+        finally:
+            self.release()
+
+    def _rotated_elsewhere(self):
+        """True when the file at baseFilename is no longer the one this process has open."""
+        if self.stream is None:
+            return False
+        try:
+            on_disk = os.stat(self.baseFilename)
+        except FileNotFoundError:
+            return True
+        opened = os.fstat(self.stream.fileno())
+        return (on_disk.st_dev, on_disk.st_ino) != (opened.st_dev, opened.st_ino)
+
+    def _reopen(self):
+        if self.stream is not None:
+            self.stream.close()
+        self.stream = self._open()
+
+    def _locked_rollover(self):
+        with open(f"{self.baseFilename}.lock", "a") as lock:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                if self._rotated_elsewhere():
+                    # Another process rotated while we waited; write to its new file.
+                    self._reopen()
+                    self.rolled_over_elsewhere()
+                else:
+                    self.doRollover()
+            finally:
+                if fcntl:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+class BatchRotatingFileHandler(BatchWriteMixin, logging.handlers.RotatingFileHandler):
+
+    def rollover_due(self, size):
+        if self.maxBytes <= 0 or not os.path.isfile(self.baseFilename):
+            return False
+        if self.stream is None:
+            self.stream = self._open()
+        return os.fstat(self.stream.fileno()).st_size + size >= self.maxBytes
+
+    def rolled_over_elsewhere(self):
+        pass
+
+
+class BatchTimedRotatingFileHandler(BatchWriteMixin, logging.handlers.TimedRotatingFileHandler):
+
+    def rollover_due(self, size):
+        return time.time() >= self.rolloverAt
+
+    def rolled_over_elsewhere(self):
+        self.rolloverAt = self.computeRollover(int(time.time()))
+
+
+class BatchStreamHandler(logging.StreamHandler):
+
+    def emit_batch(self, records):
+        self.acquire()
+        try:
+            for record in records:
+                try:
+                    self.stream.write(self.format(record) + self.terminator)
+                except Exception:
+                    self.handleError(record)
+            self.flush()
+        finally:
+            self.release()
+
+
+class BatchingQueueListener(logging.handlers.QueueListener):
+    """
+    QueueListener that hands the target handler up to BATCH_SIZE records at a
+    time, and calls `on_drained` whenever it has emptied the queue.
+    """
+
+    def __init__(self, queue, *handlers, on_drained=None):
+        super().__init__(queue, *handlers)
+        self.on_drained = on_drained
+
+    def _monitor(self):
+        q = self.queue
+        while True:
+            record = q.get()
+            if record is self._sentinel:
+                break
+            batch = [record]
+            stop = False
+            while len(batch) < BATCH_SIZE:
+                try:
+                    record = q.get_nowait()
+                except queue.Empty:
+                    break
+                if record is self._sentinel:
+                    stop = True
+                    break
+                batch.append(record)
+            for handler in self.handlers:
+                handler.emit_batch([r for r in batch if r.levelno >= handler.level])
+            if self.on_drained is not None and q.empty():
+                self.on_drained()
+            if stop:
+                break
+
+
+class QueuedHandler(logging.handlers.QueueHandler):
+    """
+    Formats on the calling thread (cheap) and enqueues; the listener thread does
+    the I/O. When the queue is full, records are dropped rather than blocking;
+    once the queue has drained, a warning with the number dropped is written.
+    """
+
+    def __init__(self, target):
+        super().__init__(queue.Queue(QUEUE_SIZE))
+        self.target = target
+        self.dropped = 0
+        self.reported_dropped = 0
+        self._start_listener()
+        _active_handlers.add(self)
+
+    def _start_listener(self):
+        self.listener = BatchingQueueListener(self.queue, self.target, on_drained=self.report_dropped)
+        self.listener.start()
+
+    def report_dropped(self):
+        """Write one "N log records dropped" warning for the drops since the last one."""
+        # `dropped` only ever grows, so callers incrementing it never race a reset.
+        count = self.dropped - self.reported_dropped
+        if count <= 0:
+            return
+        self.reported_dropped += count
+        record = logging.LogRecord(
+            __name__, logging.WARNING, __file__, 0,
+            f"{count} log records dropped: the logging queue was full", None, None,
+        )
+        if record.levelno >= self.target.level:
+            self.target.emit_batch([self.prepare(record)])
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def after_fork(self):
+        """Threads do not survive fork(); give the child its own queue, stream and listener."""
+        if isinstance(self.target, logging.FileHandler) and self.target.stream is not None:
+            _inherited_streams.append(self.target.stream)
+            self.target.stream = None  # reopened lazily on the next write
+        self.queue = queue.Queue(QUEUE_SIZE)
+        self._start_listener()
+
+    def close(self):
+        listener, self.listener = self.listener, None
+        if listener is not None and listener._thread is not None:
+            listener.stop()
+        self.report_dropped()
+        self.target.close()
+        super().close()
+
+
+class QueuedRotatingFileHandler(QueuedHandler):
+    """
+    Queued file handler with rotation by size (`max_bytes`) or, if `when` is
+    given, by time (e.g. "midnight"). Keeps `backup_count` old files.
+    """
+
+    def __init__(self, filename, max_bytes=50 * 1024 * 1024, backup_count=10, when=None, encoding="utf-8"):
+        if when:
+            target = BatchTimedRotatingFileHandler(filename, when=when, backupCount=backup_count, encoding=encoding)
+        else:
+            target = BatchRotatingFileHandler(filename, maxBytes=max_bytes, backupCount=backup_count, encoding=encoding)
+        super().__init__(target)
+
+
+class QueuedConsoleHandler(QueuedHandler):
+
+    def __init__(self, stream=None):
+        super().__init__(BatchStreamHandler(stream or sys.stderr))
+
+
+def _restart_after_fork():
+    for handler in list(_active_handlers):
+        handler.after_fork()
+
+
+def _stop_all():
+    for handler in list(_active_handlers):
+        handler.close()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_after_fork)
+atexit.register(_stop_all)
@@ -0,0 +1,95 @@
+"""
+Reusable SMTP delivery for Celery workers.
+
+Django's send_mail() opens a new SMTP + STARTTLS session for every message.
+Workers instead keep one connection per process, check it with NOOP when it
+has been idle, and reconnect on failure, so a batch of messages costs a
+single handshake and a dropped session does not resend what was delivered.
+"""
+import logging
+import smtplib
+import threading
+import time
+
+from celery.signals import worker_process_shutdown
+from django.core import mail
+from django.core.mail.backends.smtp import EmailBackend as SMTPBackend
+
+logger = logging.getLogger(__name__)
+
+# Check an idle connection with NOOP before reuse; SMTP servers drop idle
+# sessions after a few minutes.
+HEALTH_CHECK_AFTER = 30
+
+_connection = None
+_last_used = 0.0
+_lock = threading.Lock()
+
+
+def _is_healthy(connection):
+    try:
+        return connection.connection.noop()[0] == 250
+    except (smtplib.SMTPException, OSError):
+        return False
+
+
+def get_connection():
+    """Return this process's open mail connection, reconnecting if it went stale."""
+    global _connection
+    if _connection is None:
+        _connection = mail.get_connection(fail_silently=False)
+
+    if isinstance(_connection, SMTPBackend):
+        idle = time.monotonic() - _last_used
+        if _connection.connection is not None and idle > HEALTH_CHECK_AFTER and not _is_healthy(_connection):
+            logger.info("Pooled SMTP connection went stale, reconnecting")
+            close_connection()
+            _connection = mail.get_connection(fail_silently=False)
+        if _connection.connection is None:
+            _connection.open()
+    return _connection
+
+
+def close_connection():
+    global _connection
+    if _connection is not None:
+        try:
+            _connection.close()
+        except Exception:
+            pass
+        _connection = None
+
+
+@worker_process_shutdown.connect
+def close_on_worker_shutdown(**kwargs):
+    close_connection()
+
+
+def _disconnected(error):
+    # smtplib raises SMTPSenderRefused when the server answers MAIL FROM with
+    # 421 (e.g. a per-session message limit) and closes the connection itself.
+    if isinstance(error, smtplib.SMTPResponseException) and error.smtp_code == 421:
+        return True
+    return isinstance(error, (smtplib.SMTPServerDisconnected, OSError))
+
+
+def send_messages(messages):
+    """
+    Send `messages` over the pooled connection in one SMTP session.
+    Messages go out one at a time so that, when the server hangs up
+    mid-batch, only the ones it has not accepted are sent again.
+    """
+    global _last_used
+    sent = 0
+    with _lock:
+        for message in messages:
+            try:
+                sent += get_connection().send_messages([message])
+            except Exception as e:
+                if not _disconnected(e):
+                    raise
+                # The server hung up between the health check and this message; retry it once.
+                close_connection()
+                sent += get_connection().send_messages([message])
+        _last_used = time.monotonic()
+    return sent
@@ -0,0 +1,119 @@
+import asyncio
+import os
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        "Run a local SMTP stand-in that accepts every message and writes it to disk. "
+        "Point the app at it with EMAIL_HOST=localhost EMAIL_PORT=1025 EMAIL_USE_TLS=False."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=1025)
+        parser.add_argument("--outdir", default="sent_mail", help="Directory for received .eml files")
+        parser.add_argument(
+            "--drop-after", type=int, default=0,
+            help="Answer 421 and hang up once a connection has delivered this many messages",
+        )
+
+    def handle(self, *args, **options):
+        self.setup(options["outdir"], options["drop_after"])
+        try:
+            asyncio.run(self.serve(options["host"], options["port"]))
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(f"Received {self.messages} messages over {self.connections} connections.")
+
+    def setup(self, outdir, drop_after=0):
+        self.outdir = outdir
+        os.makedirs(self.outdir, exist_ok=True)
+        self.drop_after = drop_after
+        self.connections = 0
+        self.messages = 0
+
+    async def start(self, host, port):
+        return await asyncio.start_server(self.handle_client, host, port)
+
+    async def serve(self, host, port):
+        server = await self.start(host, port)
+        self.stdout.write(self.style.SUCCESS(f"📬 SMTP sink listening on {host}:{port}, writing to {self.outdir}/"))
+        async with server:
+            await server.serve_forever()
+
+    async def handle_client(self, reader, writer):
+        self.connections += 1
+        connection_id = self.connections
+        received = 0
+        mail_from, recipients = None, []
+
+        def reply(line):
+            writer.write(f"{line}\r\n".encode())
+
+        reply("220 checkmate-smtp-sink ESMTP")
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            command = line.decode(errors="replace").strip()
+            verb = command[:4].upper()
+
+            if verb == "EHLO":
+                reply("250-checkmate-smtp-sink")
+                reply("250-8BITMIME")
+                reply("250 PIPELINING")
+            elif verb == "HELO":
+                reply("250 checkmate-smtp-sink")
+            elif verb == "MAIL" and self.drop_after and received >= self.drop_after:
+                reply("421 Too many messages, closing connection")
+                await writer.drain()
+                break
+            elif verb == "MAIL":
+                mail_from, recipients = command[10:].strip(), []
+                reply("250 OK")
+            elif verb == "RCPT":
+                recipients.append(command[8:].strip())
+                reply("250 OK")
+            elif verb == "DATA":
+                reply("354 End data with <CR><LF>.<CR><LF>")
+                await writer.drain()
+                body = await self.read_data(reader)
+                self.save(connection_id, mail_from, recipients, body)
+                received += 1
+                reply("250 OK: queued")
+            elif verb == "RSET":
+                mail_from, recipients = None, []
+                reply("250 OK")
+            elif verb == "NOOP":
+                reply("250 OK")
+            elif verb == "QUIT":
+                reply("221 Bye")
+                await writer.drain()
+                break
+            else:
+                reply("502 Command not implemented")
+            await writer.drain()
+
+        writer.close()
+        self.stdout.write(f"Connection #{connection_id} closed after {received} message(s).")
+
+    async def read_data(self, reader):
+        lines = []
+        while True:
+            line = await reader.readline()
+            if not line or line in (b".\r\n", b".\n"):
+                break
+            # Undo SMTP dot-stuffing
+            lines.append(line[1:] if line.startswith(b"..") else line)
+        return b"".join(lines)
+
+    def save(self, connection_id, mail_from, recipients, body):
+        self.messages += 1
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        path = os.path.join(self.outdir, f"{stamp}_{self.messages}.eml")
+        with open(path, "wb") as fh:
+            fh.write(body)
+        self.stdout.write(f"[conn #{connection_id}] {mail_from} -> {', '.join(recipients)} ({len(body)} bytes)")
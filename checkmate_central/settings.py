@@ -14,6 +14,8 @@ from pathlib import Path
 import os
 from dotenv import load_dotenv
 from pymysql import install_as_MySQLdb
+from celery.schedules import crontab
+from kombu import Exchange, Queue
 
 load_dotenv()
 install_as_MySQLdb()
@@ -52,14 +54,18 @@ INSTALLED_APPS = [
     'colleges',
     'backups',
     'users', # Renamed from superadmins
+    'monitoring',
+    'checkmate_central',
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'checkmate_central.db_routers.ReplicaPinMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'users.middleware.CachedAuthenticationMiddleware',
+    'monitoring.middleware.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -95,9 +101,37 @@ DATABASES = {
         'PASSWORD': os.getenv('DB_PASSWORD'),
         'HOST': os.getenv('DB_HOST'),
         'PORT': os.getenv('DB_PORT'),
+        # Keep each gunicorn/Celery worker's connection open across requests and
+        # tasks instead of reconnecting every time. Keep this below MySQL's
+        # wait_timeout. Health checks ping a reused connection before its first
+        # query, so one dropped by a MySQL restart is replaced rather than failing.
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 300)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'connect_timeout': int(os.getenv('DB_CONNECT_TIMEOUT', 5)),
+        },
     }
 }
 
+# Read replicas: DB_REPLICA_HOSTS="replica1.internal,replica2.internal:3307".
+# Views and jobs marked with checkmate_central.db_routers.use_replica read from
+# them; everything else uses the primary. Point one at the primary's host to
+# try the routing locally.
+for _i, _host in enumerate(filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(',')), start=1):
+    _host, _, _port = _host.strip().partition(':')
+    DATABASES[f'replica_{_i}'] = {
+        **DATABASES['default'],
+        'HOST': _host,
+        'PORT': _port or DATABASES['default']['PORT'],
+        'USER': os.getenv('DB_REPLICA_USER', DATABASES['default']['USER']),
+        'PASSWORD': os.getenv('DB_REPLICA_PASSWORD', DATABASES['default']['PASSWORD']),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+REPLICA_DATABASES = [alias for alias in DATABASES if alias != 'default']
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', 15))  # read-your-writes after a change
+DATABASE_ROUTERS = ['checkmate_central.db_routers.PrimaryReplicaRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -147,9 +181,10 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 AUTH_USER_MODEL = "users.User"
 
 EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
-EMAIL_HOST = "smtp.gmail.com"
-EMAIL_PORT = 587
-EMAIL_USE_TLS = True
+EMAIL_HOST = os.getenv('EMAIL_HOST', "smtp.gmail.com")
+EMAIL_PORT = int(os.getenv('EMAIL_PORT', 587))
+EMAIL_USE_TLS = os.getenv('EMAIL_USE_TLS', "True") == "True"
+EMAIL_TIMEOUT = 30
 
 EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD')
@@ -158,6 +193,25 @@ DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
 LOG_DIR = BASE_DIR / "logs"
 LOG_DIR.mkdir(exist_ok=True)
 
+# Handlers below are queued: request threads only enqueue records, a listener
+# thread per handler writes them in batches (see checkmate_central/log_handlers.py).
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')  # "text" or "json"
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', 50 * 1024 * 1024))
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', 10))
+LOG_ROTATE_WHEN = os.getenv('LOG_ROTATE_WHEN') or None  # e.g. "midnight"; size-based when unset
+
+
+def _log_file(name):
+    return {
+        '()': 'checkmate_central.log_handlers.QueuedRotatingFileHandler',
+        'filename': LOG_DIR / name,
+        'max_bytes': LOG_MAX_BYTES,
+        'backup_count': LOG_BACKUP_COUNT,
+        'when': LOG_ROTATE_WHEN,
+        'formatter': 'json' if LOG_FORMAT == 'json' else 'verbose',
+    }
+
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -171,35 +225,22 @@ LOGGING = {
             'format': '{levelname}: {message}',
             'style': '{',
         },
+        'json': {
+            '()': 'checkmate_central.log_handlers.JsonFormatter',
+        },
     },
 
     'handlers': {
         'console': {
-            'class': 'logging.StreamHandler',
-            'formatter': 'simple',
+            '()': 'checkmate_central.log_handlers.QueuedConsoleHandler',
+            'formatter': 'json' if LOG_FORMAT == 'json' else 'simple',
         },
         # File handlers per app
-        'users_file': {
-            'class': 'logging.FileHandler',
-            'filename': LOG_DIR / 'users.log',
-            'formatter': 'verbose',
-        },
-        'colleges_file': {
-            'class': 'logging.FileHandler',
-            'filename': LOG_DIR / 'colleges.log',
-            'formatter': 'verbose',
-        },
-        'backups_file': {
-            'class': 'logging.FileHandler',
-            'filename': LOG_DIR / 'backups.log',
-            'formatter': 'verbose',
-        },
+        'users_file': _log_file('users.log'),
+        'colleges_file': _log_file('colleges.log'),
+        'backups_file': _log_file('backups.log'),
         # Optional global Django log
-        'django_file': {
-            'class': 'logging.FileHandler',
-            'filename': LOG_DIR / 'django.log',
-            'formatter': 'verbose',
-        },
+        'django_file': _log_file('django.log'),
     },
 
     'loggers': {
@@ -226,13 +267,180 @@ LOGGING = {
     },
 }
 
-CELERY_BROKER_URL = os.getenv('REDIS_URL')
-CELERY_RESULT_BACKEND = os.getenv('REDIS_URL')
+REDIS_URL = os.getenv('REDIS_URL')
+
+# Cache
+# Sessions are read from Redis and written through to MySQL (cached_db), and
+# request.user is served from a cached snapshot (users/auth_cache.py).
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'checkmate',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+# Login OTPs live in Redis (TTL'd hashes, no DB writes) whenever Redis is configured.
+OTP_BACKEND = os.getenv('OTP_BACKEND', 'redis' if REDIS_URL else 'database')
+
+# Upload admission control (backups/admission.py). Needs Redis; 0 disables it.
+UPLOAD_MAX_CONCURRENT = int(os.getenv('UPLOAD_MAX_CONCURRENT', 4))
+UPLOAD_SLOT_TTL = int(os.getenv('UPLOAD_SLOT_TTL', 2 * 60 * 60))
+UPLOAD_BUCKET_SIZE = int(os.getenv('UPLOAD_BUCKET_SIZE', 3))
+UPLOAD_BUCKET_REFILL = int(os.getenv('UPLOAD_BUCKET_REFILL', 20 * 60))  # seconds per token
+UPLOAD_RETRY_AFTER = int(os.getenv('UPLOAD_RETRY_AFTER', 30))  # base for the jittered 503 Retry-After
+
+# Backup encryption (backups/utils/encryption.py): files at least this large are
+# encrypted in BACKUP_SEGMENT_SIZE segments on BACKUP_CRYPTO_WORKERS threads.
+BACKUP_CRYPTO_WORKERS = int(os.getenv('BACKUP_CRYPTO_WORKERS', os.cpu_count() or 1))
+BACKUP_PARALLEL_THRESHOLD = int(os.getenv('BACKUP_PARALLEL_THRESHOLD', 64 * 1024 * 1024))
+BACKUP_SEGMENT_SIZE = int(os.getenv('BACKUP_SEGMENT_SIZE', 8 * 1024 * 1024))
+# Read size for checksum loops; large reads let hashlib drop the GIL for longer.
+BACKUP_HASH_CHUNK_SIZE = int(os.getenv('BACKUP_HASH_CHUNK_SIZE', 1024 * 1024))
+# Largest decompressed dump accepted; rejects compressed uploads that expand without limit.
+BACKUP_MAX_CONTENT_SIZE = int(os.getenv('BACKUP_MAX_CONTENT_SIZE', 8 * 1024 * 1024 * 1024))
+
+# Extra disks for backup files, "name:/mount/path,...". Colleges are spread
+# over them by consistent hashing (backups/storage.py). When unset, files
+# stay under MEDIA_ROOT.
+BACKUP_VOLUMES = dict(
+    entry.strip().split(':', 1) for entry in os.getenv('BACKUP_VOLUMES', '').split(',') if entry.strip()
+)
+BACKUP_VOLUME_VNODES = int(os.getenv('BACKUP_VOLUME_VNODES', 64))
+BACKUP_REBALANCE_WORKERS = int(os.getenv('BACKUP_REBALANCE_WORKERS', 4))
+
+# Secondary copies of every backup, "name=url,...", with file:///path or
+# s3://bucket/prefix targets (backups/replication.py).
+BACKUP_REPLICATION_TARGETS = dict(
+    entry.strip().split('=', 1) for entry in os.getenv('BACKUP_REPLICATION_TARGETS', '').split(',') if entry.strip()
+)
+BACKUP_REPLICATION_BANDWIDTH = int(os.getenv('BACKUP_REPLICATION_BANDWIDTH', 0))  # bytes/s per worker, 0 = unlimited
+BACKUP_REPLICATION_S3_ENDPOINT = os.getenv('BACKUP_REPLICATION_S3_ENDPOINT')  # S3-compatible services
+BACKUP_REPLICATION_S3_CONCURRENCY = int(os.getenv('BACKUP_REPLICATION_S3_CONCURRENCY', 4))  # parts in flight
+BACKUP_REPLICATION_MAX_RETRIES = int(os.getenv('BACKUP_REPLICATION_MAX_RETRIES', 8))
+BACKUP_REPLICATION_RETRY_BACKOFF = int(os.getenv('BACKUP_REPLICATION_RETRY_BACKOFF', 60))  # seconds, doubles per retry
+BACKUP_REPLICATION_RETRY_BACKOFF_MAX = int(os.getenv('BACKUP_REPLICATION_RETRY_BACKOFF_MAX', 60 * 60))
+BACKUP_REPLICATION_STALE_MINUTES = int(os.getenv('BACKUP_REPLICATION_STALE_MINUTES', 6 * 60))
+BACKUP_REPLICATION_SWEEP_BATCH = int(os.getenv('BACKUP_REPLICATION_SWEEP_BATCH', 500))
+
+# Backups older than this are packed into compressed, encrypted per-college
+# pack files (backups.tasks.pack_old_backups, run nightly by celery beat),
+# on BACKUP_COLD_VOLUME when set (a BACKUP_VOLUMES name), else the college's volume.
+BACKUP_PACK_AFTER_DAYS = int(os.getenv('BACKUP_PACK_AFTER_DAYS', 30))
+BACKUP_PACK_MAX_BYTES = int(os.getenv('BACKUP_PACK_MAX_BYTES', 4 * 1024 * 1024 * 1024))
+BACKUP_PACK_MAX_SECONDS = int(os.getenv('BACKUP_PACK_MAX_SECONDS', 2 * 60 * 60))
+BACKUP_PACK_COMPRESSION_LEVEL = int(os.getenv('BACKUP_PACK_COMPRESSION_LEVEL', 6))
+BACKUP_COLD_VOLUME = os.getenv('BACKUP_COLD_VOLUME', '')
+
+# Backups older than this move from the hot table to the archive table
+# (backups.tasks.archive_old_backups, run nightly by celery beat).
+BACKUP_ARCHIVE_AFTER_DAYS = int(os.getenv('BACKUP_ARCHIVE_AFTER_DAYS', 90))
+BACKUP_ARCHIVE_BATCH_SIZE = int(os.getenv('BACKUP_ARCHIVE_BATCH_SIZE', 1000))
+BACKUP_ARCHIVE_MAX_SECONDS = int(os.getenv('BACKUP_ARCHIVE_MAX_SECONDS', 15 * 60))
+
+# Garbage collection of backup files no row refers to (backups/cleanup.py,
+# backups.tasks.collect_backup_garbage, run daily by celery beat). Orphans are
+# quarantined for BACKUP_GC_QUARANTINE_DAYS unless BACKUP_GC_DELETE is set.
+BACKUP_GC_GRACE_HOURS = int(os.getenv('BACKUP_GC_GRACE_HOURS', 24))
+BACKUP_GC_QUARANTINE_DAYS = int(os.getenv('BACKUP_GC_QUARANTINE_DAYS', 7))
+BACKUP_GC_DELETE = os.getenv('BACKUP_GC_DELETE', 'False') == 'True'
+BACKUP_GC_WORKERS = int(os.getenv('BACKUP_GC_WORKERS', 8))
+BACKUP_GC_BATCH_SIZE = int(os.getenv('BACKUP_GC_BATCH_SIZE', 500))
+
+# Background deletion of colleges and backups marked for deletion
+# (backups/purge.py, backups.tasks.purge_deleted_backups).
+BACKUP_PURGE_BATCH_SIZE = int(os.getenv('BACKUP_PURGE_BATCH_SIZE', 500))
+BACKUP_PURGE_WORKERS = int(os.getenv('BACKUP_PURGE_WORKERS', 8))
+BACKUP_PURGE_MAX_SECONDS = int(os.getenv('BACKUP_PURGE_MAX_SECONDS', 15 * 60))
+
+# Idempotency-Key replay window for the backup API (backups/idempotency.py).
+IDEMPOTENCY_TTL = int(os.getenv('IDEMPOTENCY_TTL', 24 * 60 * 60))
+IDEMPOTENCY_LOCK_TTL = int(os.getenv('IDEMPOTENCY_LOCK_TTL', 2 * 60 * 60))  # longest an upload may run
+
+# Nightly upload scheduling (backups/scheduling.py).
+UPLOAD_WINDOW_START_HOUR = int(os.getenv('UPLOAD_WINDOW_START_HOUR', 0))  # local time
+UPLOAD_WINDOW_HOURS = int(os.getenv('UPLOAD_WINDOW_HOURS', 6))
+UPLOAD_SLOT_MINUTES = int(os.getenv('UPLOAD_SLOT_MINUTES', 10))
+UPLOAD_EXPECTED_THROUGHPUT = int(os.getenv('UPLOAD_EXPECTED_THROUGHPUT', 5 * 1024 * 1024))  # bytes/s per upload
+UPLOAD_DEFAULT_BYTES = int(os.getenv('UPLOAD_DEFAULT_BYTES', 200 * 1024 * 1024))  # colleges without history
+UPLOAD_HISTORY_DAYS = int(os.getenv('UPLOAD_HISTORY_DAYS', 30))
+
+CELERY_BROKER_URL = REDIS_URL
+CELERY_RESULT_BACKEND = REDIS_URL
 CELERY_TIMEZONE = TIME_ZONE
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 
+# Queues, each served by its own worker (see docker-compose.yaml):
+#   mail_interactive - OTPs and one-off activation mails a user is waiting on
+#   mail_bulk        - onboarding waves and other mass mail
+#   backups          - heavy backup processing (long-running, acks late)
+#   maintenance      - periodic housekeeping
+# A long backup job can then never sit in front of a login OTP.
+CELERY_TASK_QUEUES = tuple(
+    Queue(name, Exchange(name), routing_key=name)
+    for name in ('mail_interactive', 'mail_bulk', 'backups', 'replication', 'maintenance')
+)
+CELERY_TASK_DEFAULT_QUEUE = 'maintenance'
+CELERY_TASK_ROUTES = {
+    'users.tasks.send_login_otp': {'queue': 'mail_interactive', 'priority': 0},
+    'colleges.tasks.send_activation_email': {'queue': 'mail_interactive', 'priority': 3},
+    'colleges.tasks.send_activation_emails': {'queue': 'mail_bulk'},
+    'backups.tasks.archive_old_backups': {'queue': 'maintenance'},
+    'backups.tasks.rebalance_backup_volumes': {'queue': 'maintenance'},
+    'backups.tasks.pack_old_backups': {'queue': 'maintenance'},
+    'backups.tasks.collect_backup_garbage': {'queue': 'maintenance'},
+    'backups.tasks.purge_deleted_backups': {'queue': 'maintenance'},
+    'backups.tasks.replicate_backup': {'queue': 'replication'},
+    'backups.tasks.replicate_pending_backups': {'queue': 'maintenance'},
+    'backups.tasks.*': {'queue': 'backups'},
+    'monitoring.tasks.*': {'queue': 'maintenance'},
+}
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    # Redis emulates priorities with per-priority lists; 0 is served first.
+    'priority_steps': list(range(10)),
+    'sep': ':',
+    'queue_order_strategy': 'priority',
+    # Must outlive the longest acks_late task or Redis redelivers it mid-run.
+    'visibility_timeout': 6 * 60 * 60,
+}
+# Workers reserve one task at a time unless started with --prefetch-multiplier.
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+
+# Periodic tasks, run by the celery-beat service.
+CELERY_BEAT_SCHEDULE = {
+    'archive-old-backups': {
+        'task': 'backups.tasks.archive_old_backups',
+        'schedule': crontab(hour=12, minute=0),  # midday, clear of the nightly upload window
+    },
+    'pack-old-backups': {
+        'task': 'backups.tasks.pack_old_backups',
+        'schedule': crontab(hour=13, minute=0),
+    },
+    'collect-backup-garbage': {
+        'task': 'backups.tasks.collect_backup_garbage',
+        'schedule': crontab(hour=14, minute=0),
+    },
+    'purge-deleted-backups': {
+        'task': 'backups.tasks.purge_deleted_backups',
+        'schedule': crontab(minute=45),
+    },
+    'replicate-pending-backups': {
+        'task': 'backups.tasks.replicate_pending_backups',
+        'schedule': crontab(minute=30),
+    },
+}
+
 CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
 CRISPY_TEMPLATE_PACK = "bootstrap5"
 
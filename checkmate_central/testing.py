@@ -0,0 +1,211 @@
+"""
+Shared fixtures for the query budget tests in each app's tests.py.
+
+Every view is exercised twice: once against a small data set and again after
+the data set has grown. The number of SQL queries must match a fixed budget
+both times, so an N+1 pattern fails loudly instead of landing silently.
+
+`start_smtp_sink` runs the smtp_sink command for tests of real SMTP delivery
+and `received_mail` parses what it wrote.
+"""
+import asyncio
+import email
+import glob
+import io
+import os
+import shutil
+import tempfile
+import threading
+from unittest import mock
+
+from cryptography.fernet import Fernet
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework_api_key.models import APIKey
+
+from backups.models import Backup
+from colleges.models import College
+from checkmate_central import mail
+from checkmate_central.management.commands import smtp_sink
+from users.auth_cache import cache_user
+from users.models import CreatePasswordRequest, LoginOTP, User
+
+TEST_MEDIA_ROOT = tempfile.mkdtemp(prefix="checkmate-test-media-")
+
+
+@override_settings(
+    MEDIA_ROOT=TEST_MEDIA_ROOT,
+    SECURE_SSL_REDIRECT=False,
+    SESSION_COOKIE_SECURE=False,
+    CSRF_COOKIE_SECURE=False,
+    OTP_BACKEND="database",
+    # Budgets count queries on the primary; replica routing is tested on its own.
+    REPLICA_DATABASES=[],
+)
+class QueryBudgetTestCase(TestCase):
+    USERS_PER_COLLEGE = 3
+    BACKUPS_PER_COLLEGE = 5
+    GROWTH = 10
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls._env = mock.patch.dict(os.environ, {"BACKUP_ENCRYPTION_KEY": Fernet.generate_key().decode()})
+        cls._env.start()
+        # Never talk to a real Celery broker from the test suite.
+        cls._tasks = [
+            mock.patch("users.tasks.send_login_otp.delay"),
+            mock.patch("colleges.tasks.send_activation_email.delay"),
+            mock.patch("colleges.tasks.send_activation_emails.delay"),
+            mock.patch("backups.tasks.purge_deleted_backups.delay"),
+        ]
+        cls._task_mocks = [patcher.start() for patcher in cls._tasks]
+
+    @classmethod
+    def tearDownClass(cls):
+        for patcher in cls._tasks:
+            patcher.stop()
+        cls._env.stop()
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(
+            email="staff@example.com",
+            password="staff-pass",
+            role=User.Role.STAFF,
+            is_staff=True,
+            is_superuser=True,
+        )
+        cls.college, cls.api_key = cls.make_college(0)
+        cls.college_user = cls.college.users.first()
+        cls.backup = cls.college.backups.first()
+
+    @classmethod
+    def make_college(cls, index):
+        """Create a college with an API key, users and backup rows; return (college, raw_key)."""
+        api_key, key = APIKey.objects.create_key(name=f"C{index:04d}-key")
+        college = College.objects.create(name=f"College {index}", code=f"C{index:04d}", api_key=api_key)
+        users = User.objects.bulk_create([
+            User(
+                email=f"user{n}@c{index:04d}.example.com",
+                role=User.Role.COLLEGE,
+                college=college,
+                password="!",
+            )
+            for n in range(cls.USERS_PER_COLLEGE)
+        ])
+        CreatePasswordRequest.objects.bulk_create([
+            CreatePasswordRequest(user=user, college=college) for user in users
+        ])
+        LoginOTP.objects.create(user=users[0], otp="123456", expires_at=timezone.now())
+        now = timezone.now()
+        Backup.objects.bulk_create([
+            Backup(
+                college=college,
+                file=f"backups/{college.code}/dump_{n}.sql.enc",
+                file_size=1024 * (n + 1),
+                checksum=f"{index:032d}{n:032d}",
+                is_encrypted=True,
+                uploaded_at=now - timezone.timedelta(days=n),
+            )
+            for n in range(cls.BACKUPS_PER_COLLEGE)
+        ])
+        return college, key
+
+    def grow(self):
+        """Add GROWTH more colleges with their users and backups."""
+        start = College.objects.count()
+        for index in range(start, start + self.GROWTH):
+            self.make_college(index)
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        for task_mock in self._task_mocks:
+            task_mock.reset_mock()
+
+    def login(self, user):
+        """Log in and warm the session/user caches, as on a typical repeat request."""
+        self.client.force_login(user)
+        cache_user(User.objects.get(pk=user.pk))
+
+    def assertQueryBudget(self, budget, request, repeatable=True):
+        """
+        Run `request()` before and after growing the fixtures and assert both
+        runs issue exactly `budget` queries. Non-repeatable requests (e.g.
+        creating a unique record) only run once, against the grown fixtures.
+        """
+        runs = []
+        if repeatable:
+            runs.append(self._count_queries(request))
+        self.grow()
+        runs.append(self._count_queries(request))
+
+        for count, queries in runs:
+            self.assertEqual(
+                count,
+                budget,
+                f"Expected {budget} queries, got {count}:\n"
+                + "\n".join(f"  {q['sql']}" for q in queries),
+            )
+
+    def _count_queries(self, request):
+        with CaptureQueriesContext(connection) as ctx:
+            response = request()
+        self.assertLess(response.status_code, 500)
+        return len(ctx.captured_queries), ctx.captured_queries
+
+
+def start_smtp_sink(testcase, drop_after=0):
+    """
+    Run an SMTP sink on a free local port for the rest of `testcase` and point
+    the mail settings at it; returns the sink command, whose `messages` and
+    `connections` count what it received and whose `outdir` holds the .eml files.
+    """
+    sink = smtp_sink.Command(stdout=io.StringIO())
+    sink.setup(tempfile.mkdtemp(prefix="checkmate-test-mail-"), drop_after)
+    testcase.addCleanup(shutil.rmtree, sink.outdir, ignore_errors=True)
+
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(sink.start("127.0.0.1", 0))
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+
+    def stop():
+        mail.close_connection()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        server.close()
+        loop.run_until_complete(server.wait_closed())
+        loop.close()
+
+    testcase.addCleanup(stop)
+
+    settings = override_settings(
+        EMAIL_BACKEND="django.core.mail.backends.smtp.EmailBackend",
+        EMAIL_HOST="127.0.0.1",
+        EMAIL_PORT=server.sockets[0].getsockname()[1],
+        EMAIL_USE_TLS=False,
+        EMAIL_USE_SSL=False,
+        EMAIL_HOST_USER="",
+        EMAIL_HOST_PASSWORD="",
+        DEFAULT_FROM_EMAIL="checkmate@example.com",
+    )
+    settings.enable()
+    testcase.addCleanup(settings.disable)
+    # Drop a pooled connection to another backend left by earlier tests.
+    mail.close_connection()
+    return sink
+
+
+def received_mail(sink):
+    """The messages `sink` received, parsed."""
+    messages = []
+    for path in glob.glob(os.path.join(sink.outdir, "*.eml")):
+        with open(path, "rb") as fh:
+            messages.append(email.message_from_binary_file(fh))
+    return messages
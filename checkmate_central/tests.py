@@ -0,0 +1,242 @@
+import glob
+import logging
+import os
+import queue
+import shutil
+import tempfile
+import time
+from unittest import skipUnless
+
+from django.conf import settings
+from django.core.mail import EmailMessage
+from django.db import connections
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from checkmate_central.testing import QueryBudgetTestCase, received_mail, start_smtp_sink
+
+from . import log_handlers, mail
+from .db_routers import PIN_COOKIE, PrimaryReplicaRouter, ReplicaPinMiddleware, use_replica
+
+
+@override_settings(REPLICA_DATABASES=["replica_1"])
+class ReplicaRouterTests(SimpleTestCase):
+
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+        self.factory = RequestFactory()
+
+    def test_reads_use_the_primary_outside_marked_code(self):
+        self.assertIsNone(self.router.db_for_read(None))
+        self.assertEqual(self.router.db_for_write(None), "default")
+
+    def test_marked_code_reads_from_a_replica(self):
+        self.assertEqual(use_replica(lambda: self.router.db_for_read(None))(), "replica_1")
+        self.assertIsNone(self.router.db_for_read(None))
+
+    def test_reads_after_a_write_in_the_same_block_use_the_primary(self):
+        @use_replica
+        def job():
+            before = self.router.db_for_read(None)
+            self.router.db_for_write(None)
+            return before, self.router.db_for_read(None)
+
+        self.assertEqual(job(), ("replica_1", None))
+
+    def test_pinned_request_reads_from_the_primary(self):
+        view = use_replica(lambda request: self.router.db_for_read(None))
+        request = self.factory.get("/")
+        self.assertEqual(view(request), "replica_1")
+
+        request.COOKIES[PIN_COOKIE] = "1"
+        self.assertIsNone(view(request))
+
+    def test_middleware_pins_after_successful_changes_only(self):
+        def respond(status):
+            return ReplicaPinMiddleware(lambda request: HttpResponse(status=status))
+
+        self.assertIn(PIN_COOKIE, respond(302)(self.factory.post("/")).cookies)
+        self.assertNotIn(PIN_COOKIE, respond(200)(self.factory.get("/")).cookies)
+        self.assertNotIn(PIN_COOKIE, respond(400)(self.factory.post("/")).cookies)
+        with override_settings(REPLICA_DATABASES=[]):
+            self.assertNotIn(PIN_COOKIE, respond(302)(self.factory.post("/")).cookies)
+
+
+REPLICAS = settings.REPLICA_DATABASES
+
+
+@skipUnless(REPLICAS, "set DB_REPLICA_HOSTS to run against a second database")
+class ReplicaRoutingTests(QueryBudgetTestCase):
+    databases = {"default", *REPLICAS}
+
+    def setUp(self):
+        super().setUp()
+        self.login(self.staff)
+        self.replica = connections[REPLICAS[0]]
+
+    def dashboard_queries_on_replica(self):
+        with override_settings(REPLICA_DATABASES=[self.replica.alias]), \
+                CaptureQueriesContext(self.replica) as replica_queries:
+            self.client.get(reverse("users:staff_dashboard"))
+        return replica_queries.captured_queries
+
+    def test_dashboard_reads_from_the_replica(self):
+        self.assertTrue(self.dashboard_queries_on_replica())
+
+    def test_pinned_user_reads_from_the_primary(self):
+        self.client.cookies[PIN_COOKIE] = "1"
+        self.assertFalse(self.dashboard_queries_on_replica())
+
+
+def log_record(message):
+    return logging.LogRecord("tests", logging.INFO, __file__, 0, message, None, None)
+
+
+class RecordingHandler(logging.Handler):
+
+    def __init__(self):
+        super().__init__()
+        self.batches = []
+
+    def emit_batch(self, records):
+        self.batches.append([record.getMessage() for record in records])
+
+
+class QueuedLogHandlerTests(SimpleTestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix="checkmate-logs-")
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+        self.path = os.path.join(self.dir, "app.log")
+
+    def file_handler(self, **kwargs):
+        handler = log_handlers.QueuedRotatingFileHandler(self.path, **kwargs)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        self.addCleanup(handler.close)
+        return handler
+
+    def logged_lines(self):
+        lines = []
+        for name in glob.glob(f"{self.path}*"):
+            if not name.endswith(".lock"):
+                with open(name) as f:
+                    lines.extend(f.read().splitlines())
+        return lines
+
+    def test_listener_hands_over_records_in_batches(self):
+        q = queue.Queue()
+        for i in range(1200):
+            q.put(log_record(f"line {i}"))
+        target = RecordingHandler()
+        listener = log_handlers.BatchingQueueListener(q, target)
+        q.put(listener._sentinel)
+
+        listener._monitor()
+
+        self.assertEqual([len(batch) for batch in target.batches], [500, 500, 200])
+        self.assertEqual(target.batches[2][-1], "line 1199")
+
+    def test_close_flushes_queued_records(self):
+        handler = self.file_handler()
+        for i in range(2000):
+            handler.handle(log_record(f"line {i}"))
+
+        handler.close()
+
+        self.assertEqual(self.logged_lines(), [f"line {i}" for i in range(2000)])
+
+    def test_dropped_records_are_reported_once_the_queue_drains(self):
+        handler = self.file_handler()
+        handler.listener.stop()  # nothing drains the queue until it is restarted
+        for i in range(log_handlers.QUEUE_SIZE + 25):
+            handler.handle(log_record(f"line {i}"))
+        self.assertEqual(handler.dropped, 25)
+
+        handler._start_listener()
+        deadline = time.monotonic() + 10
+        while handler.reported_dropped < 25 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(handler.reported_dropped, 25)
+        handler.close()
+
+        lines = self.logged_lines()
+        self.assertEqual(lines.count("25 log records dropped: the logging queue was full"), 1)
+        self.assertEqual(len(lines), log_handlers.QUEUE_SIZE + 1)
+
+    def fork(self, work):
+        pid = os.fork()
+        if pid == 0:  # pragma: no cover - child
+            try:
+                work()
+            finally:
+                os._exit(0)
+        return pid
+
+    def test_child_gets_its_own_queue_and_listener_after_fork(self):
+        handler = self.file_handler()
+        handler.handle(log_record("parent"))
+        parent_queue, parent_listener = handler.queue, handler.listener
+
+        def child():
+            if handler.queue is not parent_queue and handler.listener is not parent_listener:
+                handler.handle(log_record("child"))
+            handler.close()
+
+        os.waitpid(self.fork(child), 0)
+        handler.close()
+
+        self.assertEqual(sorted(self.logged_lines()), ["child", "parent"])
+
+    def test_processes_sharing_a_file_lose_no_lines_on_rotation(self):
+        handler = self.file_handler(max_bytes=20 * 1024, backup_count=1000)
+
+        def child(n):
+            def work():
+                for i in range(3000):
+                    handler.handle(log_record(f"process {n} line {i:04d} " + "x" * 40))
+                handler.close()
+            return work
+
+        for pid in [self.fork(child(n)) for n in range(4)]:
+            os.waitpid(pid, 0)
+
+        lines = self.logged_lines()
+        self.assertEqual(len(lines), 12000)
+        self.assertEqual(len(set(lines)), 12000)
+        self.assertTrue(all(line.endswith("x" * 40) for line in lines))
+        self.assertGreater(len(glob.glob(f"{self.path}.*")), 10)
+
+
+class PooledMailTests(SimpleTestCase):
+
+    def batch(self, count):
+        return [
+            EmailMessage(f"Message {n}", "Body", "checkmate@example.com", [f"user{n}@example.com"])
+            for n in range(count)
+        ]
+
+    def test_batch_is_sent_over_one_connection(self):
+        sink = start_smtp_sink(self)
+
+        self.assertEqual(mail.send_messages(self.batch(5)), 5)
+
+        self.assertEqual(sink.connections, 1)
+        self.assertEqual(sorted(m["Subject"] for m in received_mail(sink)), [f"Message {n}" for n in range(5)])
+
+    def test_connection_is_reused_across_batches(self):
+        sink = start_smtp_sink(self)
+
+        mail.send_messages(self.batch(2))
+        mail.send_messages(self.batch(2))
+
+        self.assertEqual((sink.connections, sink.messages), (1, 4))
+
+    def test_dropped_session_resends_only_undelivered_messages(self):
+        # The sink hangs up after every second message, as servers with a per-session limit do.
+        sink = start_smtp_sink(self, drop_after=2)
+
+        self.assertEqual(mail.send_messages(self.batch(5)), 5)
+
+        self.assertEqual(sink.connections, 3)
+        self.assertEqual(sorted(m["Subject"] for m in received_mail(sink)), [f"Message {n}" for n in range(5)])
@@ -25,6 +25,7 @@ urlpatterns = [
     path('api/backups/', include('backups.urls')),
     path('users/', include('users.urls')),
     path('colleges/', include('colleges.urls')),
+    path('', include('monitoring.urls')),
 ]
 
 handler404 = 'users.views.landing_page'
@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.utils.html import format_html
 from rest_framework_api_key.models import APIKey
+from backups.purge import request_college_purge
 from .models import College
 
 @admin.register(College)
@@ -11,10 +12,12 @@ class CollegeAdmin(admin.ModelAdmin):
         "api_key_display",
         "created_at",
         "updated_at",
+        "pending_deletion",
     )
     search_fields = ("name", "code", "api_key__name")
-    readonly_fields = ("created_at", "updated_at")
-    list_filter = ("created_at",)
+    readonly_fields = ("created_at", "updated_at", "pending_deletion")
+    list_filter = ("created_at", "pending_deletion")
+    list_select_related = ("api_key",)
 
     fieldsets = (
         ("College Details", {
@@ -25,7 +28,7 @@ class CollegeAdmin(admin.ModelAdmin):
             "description": "Each college has a unique API key for authentication with external services."
         }),
         ("Timestamps", {
-            "fields": ("created_at", "updated_at"),
+            "fields": ("created_at", "updated_at", "pending_deletion"),
         }),
     )
 
@@ -46,3 +49,18 @@ class CollegeAdmin(admin.ModelAdmin):
             # Optionally display the generated key in admin logs
             self.message_user(request, f"API Key generated for {obj.name}: {key}", level="info")
         super().save_model(request, obj, form, change)
+
+    def get_deleted_objects(self, objs, request):
+        """Skip collecting every backup for the confirmation page; they are purged in the background."""
+        objs = list(objs)
+        return [str(obj) for obj in objs], {"colleges": len(objs)}, set(), []
+
+    def delete_model(self, request, obj):
+        """Mark the college; backups.tasks.purge_deleted_backups removes it with its backups and files."""
+        request_college_purge(obj)
+        self.message_user(request, f"{obj.name} and its backups will be deleted in the background.", level="info")
+
+    def delete_queryset(self, request, queryset):
+        for college in queryset:
+            request_college_purge(college)
+        self.message_user(request, "The selected colleges will be deleted in the background.", level="info")
@@ -58,4 +58,21 @@ class CreateCollegeUserPasswordForm(forms.Form):
         if password1 and password2 and password1 != password2:
             self.add_error("password2", "The two password fields didn't match.")
 
-        return cleaned_data
\ No newline at end of file
+        return cleaned_data
+
+class BulkImportForm(forms.Form):
+    file = forms.FileField(
+        help_text="CSV (college_name, college_code, email, first_name, last_name) or a JSON list of colleges."
+    )
+    max_upload_size = 5 * 1024 * 1024
+
+    def clean_file(self):
+        upload = self.cleaned_data["file"]
+        if upload.size > self.max_upload_size:
+            raise forms.ValidationError("The import file must be smaller than 5 MB.")
+        try:
+            self.text = upload.read().decode("utf-8-sig")
+        except UnicodeDecodeError:
+            raise forms.ValidationError("The import file must be UTF-8 encoded.")
+        self.format = "json" if upload.name.lower().endswith(".json") else "csv"
+        return upload
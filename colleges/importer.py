@@ -0,0 +1,297 @@
+"""
+Bulk onboarding of colleges and their users from CSV or JSON.
+
+CSV: one row per user with the columns
+    college_name, college_code, email, first_name, last_name
+(a row with an empty email registers the college only).
+
+JSON: a list of colleges
+    [{"name": ..., "code": ..., "users": [{"email": ..., "first_name": ..., "last_name": ...}]}]
+
+Everything is validated before anything is written; the rows are then created
+with bulk_create in chunks inside one transaction, and activation emails are
+queued in batches once that transaction commits.
+"""
+import csv
+import io
+import json
+import logging
+from dataclasses import dataclass, field
+
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from rest_framework_api_key.crypto import concatenate
+from rest_framework_api_key.models import APIKey
+
+from colleges.models import College
+from colleges.tasks import send_activation_emails
+from users.models import User, CreatePasswordRequest
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 500
+EMAIL_BATCH_SIZE = 50
+CSV_COLUMNS = ("college_name", "college_code", "email", "first_name", "last_name")
+
+
+class ImportValidationError(Exception):
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__(f"{len(errors)} error(s) in import file")
+
+
+@dataclass
+class CollegeRow:
+    name: str
+    code: str
+    line: int
+    users: list = field(default_factory=list)
+    errors: list = field(default_factory=list)  # found while parsing, reported by validate()
+
+
+@dataclass
+class UserRow:
+    email: str
+    first_name: str
+    last_name: str
+    line: int
+
+
+@dataclass
+class ImportResult:
+    keys: list  # [(college, raw_key)], only ever held in memory
+    user_count: int
+
+
+def _clean(value):
+    return (value or "").strip()
+
+
+def parse_csv(text):
+    reader = csv.DictReader(io.StringIO(text))
+    missing = set(CSV_COLUMNS[:2]) - set(reader.fieldnames or ())
+    if missing:
+        raise ImportValidationError([f"Missing column(s): {', '.join(sorted(missing))}"])
+
+    colleges = {}
+    for line, row in enumerate(reader, start=2):
+        code = _clean(row.get("college_code")).upper()
+        name = _clean(row.get("college_name"))
+        college = colleges.get(code)
+        if college is None:
+            college = colleges[code] = CollegeRow(name=name, code=code, line=line)
+        elif name and name != college.name:
+            college.errors.append(f"Line {line}: college '{code}' is named both '{college.name}' and '{name}'")
+        email = _clean(row.get("email"))
+        if email:
+            college.users.append(UserRow(
+                email=email,
+                first_name=_clean(row.get("first_name")),
+                last_name=_clean(row.get("last_name")),
+                line=line,
+            ))
+    return list(colleges.values())
+
+
+def _json_text(obj, key, where, errors):
+    """obj[key] stripped; a missing/null value is empty, anything but a string is an error."""
+    value = obj.get(key)
+    if value is None:
+        return ""
+    if not isinstance(value, str):
+        errors.append(f"{where}: '{key}' must be a string")
+        return ""
+    return value.strip()
+
+
+def parse_json(text):
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise ImportValidationError([f"Invalid JSON: {e}"])
+    if not isinstance(data, list):
+        raise ImportValidationError(["Expected a JSON list of colleges"])
+
+    colleges, errors = [], []
+    for index, item in enumerate(data, start=1):
+        where = f"Entry {index}"
+        if not isinstance(item, dict):
+            errors.append(f"{where}: expected an object")
+            continue
+        college = CollegeRow(
+            name=_json_text(item, "name", where, errors),
+            code=_json_text(item, "code", where, errors).upper(),
+            line=index,
+        )
+        users = item.get("users") or []
+        if not isinstance(users, list):
+            errors.append(f"{where}: 'users' must be a list")
+            users = []
+        for number, user in enumerate(users, start=1):
+            user_where = f"{where}, user {number}"
+            if not isinstance(user, dict):
+                errors.append(f"{user_where}: expected an object")
+                continue
+            college.users.append(UserRow(
+                email=_json_text(user, "email", user_where, errors),
+                first_name=_json_text(user, "first_name", user_where, errors),
+                last_name=_json_text(user, "last_name", user_where, errors),
+                line=index,
+            ))
+        colleges.append(college)
+
+    if errors:
+        raise ImportValidationError(errors)
+    return colleges
+
+
+def parse(text, fmt):
+    if fmt == "json":
+        return parse_json(text)
+    return parse_csv(text)
+
+
+def validate(colleges):
+    """Check the whole file against itself and the database; raises ImportValidationError."""
+    errors = []
+    name_field = College._meta.get_field("name")
+    code_field = College._meta.get_field("code")
+    first_name_field = User._meta.get_field("first_name")
+    last_name_field = User._meta.get_field("last_name")
+
+    seen_names, seen_codes, seen_emails = set(), set(), set()
+    for college in colleges:
+        where = f"Line {college.line}"
+        if not college.name or not college.code:
+            errors.append(f"{where}: college name and code are required")
+        if len(college.name) > name_field.max_length or len(college.code) > code_field.max_length:
+            errors.append(f"{where}: college name or code is too long")
+        if college.name in seen_names:
+            errors.append(f"{where}: duplicate college name '{college.name}'")
+        if college.code in seen_codes:
+            errors.append(f"{where}: duplicate college code '{college.code}'")
+        seen_names.add(college.name)
+        seen_codes.add(college.code)
+        errors.extend(college.errors)
+
+        for user in college.users:
+            if len(user.first_name) > first_name_field.max_length:
+                errors.append(f"Line {user.line}: first name is longer than {first_name_field.max_length} characters")
+            if len(user.last_name) > last_name_field.max_length:
+                errors.append(f"Line {user.line}: last name is longer than {last_name_field.max_length} characters")
+            try:
+                validate_email(user.email)
+            except ValidationError:
+                errors.append(f"Line {user.line}: invalid email '{user.email}'")
+                continue
+            email = User.objects.normalize_email(user.email)
+            if email.lower() in seen_emails:
+                errors.append(f"Line {user.line}: duplicate email '{email}'")
+            seen_emails.add(email.lower())
+            user.email = email
+
+    if not colleges:
+        errors.append("The file contains no colleges")
+
+    for name in College.objects.filter(name__in=seen_names).values_list("name", flat=True):
+        errors.append(f"A college named '{name}' already exists")
+    for code in College.objects.filter(code__in=seen_codes).values_list("code", flat=True):
+        errors.append(f"A college with code '{code}' already exists")
+    emails = [user.email for college in colleges for user in college.users]
+    for chunk_start in range(0, len(emails), CHUNK_SIZE):
+        existing = User.objects.filter(email__in=emails[chunk_start:chunk_start + CHUNK_SIZE])
+        for email in existing.values_list("email", flat=True):
+            errors.append(f"A user with email '{email}' already exists")
+
+    if errors:
+        raise ImportValidationError(errors)
+
+
+def _generate_keys(colleges):
+    keys, objs = {}, []
+    for college in colleges:
+        key, prefix, hashed_key = APIKey.objects.key_generator.generate()
+        objs.append(APIKey(
+            id=concatenate(prefix, hashed_key),
+            prefix=prefix,
+            hashed_key=hashed_key,
+            name=f"{college.code}-key"[:50],
+        ))
+        keys[college.code] = key
+    return objs, keys
+
+
+def run_import(colleges, build_password_link):
+    """
+    Create everything in `colleges` (already validated). `build_password_link`
+    maps a CreatePasswordRequest uuid to the absolute URL mailed to the user.
+    """
+    api_keys, raw_keys = _generate_keys(colleges)
+
+    with transaction.atomic():
+        APIKey.objects.bulk_create(api_keys, batch_size=CHUNK_SIZE)
+        College.objects.bulk_create(
+            [College(name=c.name, code=c.code, api_key=k) for c, k in zip(colleges, api_keys)],
+            batch_size=CHUNK_SIZE,
+        )
+        # MySQL does not return primary keys from bulk inserts, so read them back.
+        created = {}
+        codes = [c.code for c in colleges]
+        for chunk_start in range(0, len(codes), CHUNK_SIZE):
+            for college in College.objects.filter(code__in=codes[chunk_start:chunk_start + CHUNK_SIZE]):
+                created[college.code] = college
+
+        users = []
+        for row in colleges:
+            for user_row in row.users:
+                user = User(
+                    email=user_row.email,
+                    first_name=user_row.first_name,
+                    last_name=user_row.last_name,
+                    role=User.Role.COLLEGE,
+                    college=created[row.code],
+                    is_active=False,  # Inactive until password is set
+                )
+                user.set_unusable_password()
+                users.append(user)
+        User.objects.bulk_create(users, batch_size=CHUNK_SIZE)
+
+        emails = [user.email for user in users]
+        user_ids = {}
+        for chunk_start in range(0, len(emails), CHUNK_SIZE):
+            chunk = User.objects.filter(email__in=emails[chunk_start:chunk_start + CHUNK_SIZE])
+            user_ids.update(chunk.values_list("email", "id"))
+
+        requests = [
+            CreatePasswordRequest(user_id=user_ids[user.email], college=user.college)
+            for user in users
+        ]
+        CreatePasswordRequest.objects.bulk_create(requests, batch_size=CHUNK_SIZE)
+
+        activations = [[r.user_id, build_password_link(r.uuid)] for r in requests]
+        transaction.on_commit(lambda: queue_activation_emails(activations))
+
+    logger.info(f"Bulk import created {len(created)} colleges and {len(users)} users")
+    return ImportResult(
+        keys=[(created[c.code], raw_keys[c.code]) for c in colleges],
+        user_count=len(users),
+    )
+
+
+def queue_activation_emails(activations):
+    for start in range(0, len(activations), EMAIL_BATCH_SIZE):
+        batch = activations[start:start + EMAIL_BATCH_SIZE]
+        try:
+            send_activation_emails.delay(batch)
+        except Exception as e:
+            logger.error(f"Failed to queue {len(batch)} activation emails: {str(e)}")
+
+
+def keys_as_csv(keys):
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(["college_code", "college_name", "api_key"])
+    for college, key in keys:
+        writer.writerow([college.code, college.name, key])
+    return out.getvalue()
@@ -0,0 +1,71 @@
+import os
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from colleges import importer
+
+
+class Command(BaseCommand):
+    help = "Bulk register colleges and their users from a CSV or JSON file"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV or JSON file to import")
+        parser.add_argument("--format", choices=["csv", "json"], help="Defaults to the file extension")
+        parser.add_argument(
+            "--base-url",
+            required=True,
+            help="Public site URL used in activation links, e.g. https://central.example.com",
+        )
+        parser.add_argument(
+            "--keys-out",
+            help="Write the generated API keys to this new file (mode 0600) instead of stdout",
+        )
+        parser.add_argument("--dry-run", action="store_true", help="Validate only")
+
+    def handle(self, *args, **options):
+        path = Path(options["path"])
+        fmt = options["format"] or ("json" if path.suffix.lower() == ".json" else "csv")
+        keys_out = options["keys_out"]
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f"📘 Importing colleges from {path}"))
+        try:
+            text = path.read_text(encoding="utf-8-sig")
+        except OSError as e:
+            raise CommandError(f"❌ Cannot read {path}: {e}")
+
+        if keys_out and os.path.exists(keys_out):
+            raise CommandError(f"❌ {keys_out} already exists; refusing to overwrite it.")
+
+        try:
+            colleges = importer.parse(text, fmt)
+            importer.validate(colleges)
+        except importer.ImportValidationError as e:
+            for error in e.errors:
+                self.stderr.write(self.style.ERROR(f"   {error}"))
+            raise CommandError(f"❌ {e}. Nothing was imported.")
+
+        user_count = sum(len(c.users) for c in colleges)
+        if options["dry_run"]:
+            self.stdout.write(self.style.SUCCESS(f"✅ {len(colleges)} colleges and {user_count} users are valid."))
+            return
+
+        base_url = options["base_url"].rstrip("/")
+        result = importer.run_import(
+            colleges,
+            lambda uuid: base_url + reverse("colleges:create_college_user_password", args=[uuid]),
+        )
+        keys_csv = importer.keys_as_csv(result.keys)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Imported {len(result.keys)} colleges and {result.user_count} users; activation emails queued."
+        ))
+        if keys_out:
+            fd = os.open(keys_out, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+                f.write(keys_csv)
+            self.stdout.write(self.style.SUCCESS(f"   API keys written to {keys_out}"))
+        else:
+            self.stdout.write(keys_csv)
+        self.stdout.write(self.style.WARNING("⚠️  Make sure to store these API keys securely — they will not be shown again."))
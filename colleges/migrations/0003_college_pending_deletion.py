@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 19:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('colleges', '0002_college_updated_at_alter_college_code_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='college',
+            name='pending_deletion',
+            field=models.BooleanField(db_index=True, default=False, editable=False, help_text='Hidden and waiting for backups.tasks.purge_deleted_backups'),
+        ),
+    ]
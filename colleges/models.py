@@ -11,6 +11,10 @@ class College(models.Model):
         blank=True,
         related_name="college"
     )
+    pending_deletion = models.BooleanField(
+        default=False, db_index=True, editable=False,
+        help_text="Hidden and waiting for backups.tasks.purge_deleted_backups",
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
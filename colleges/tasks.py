@@ -2,15 +2,10 @@ from celery import shared_task
 from django.core.mail import EmailMultiAlternatives
 from django.template.loader import render_to_string
 from django.conf import settings
+from checkmate_central.mail import send_messages
 
-@shared_task
-def send_activation_email(user_id, college_id, password_link):
-    from users.models import User
-    from colleges.models import College
-
-    user = User.objects.get(id=user_id)
-    college = College.objects.get(id=college_id)
 
+def build_activation_email(user, college, password_link):
     subject = f"Set Your Password for {college.name} Portal Access"
     from_email = settings.DEFAULT_FROM_EMAIL
     to_email = [user.email]
@@ -23,9 +18,38 @@ def send_activation_email(user_id, college_id, password_link):
         "support_email": "checkmate.central@gmail.com",
     }
 
-    text_content = render_to_string("colleges/user_activation_link.html", context)
+    # Rendered once; the template loader keeps the compiled template cached.
     html_content = render_to_string("colleges/user_activation_link.html", context)
+    text_content = (
+        f"Hello {user.fullname or user.email},\n\n"
+        f"Set your password for {college.name} on {context['site_name']}:\n"
+        f"{password_link}\n\n"
+        f"Need help? Contact {context['support_email']}."
+    )
 
     msg = EmailMultiAlternatives(subject, text_content, from_email, to_email)
     msg.attach_alternative(html_content, "text/html")
-    msg.send()
\ No newline at end of file
+    return msg
+
+
+@shared_task(acks_late=False, ignore_result=True)
+def send_activation_email(user_id, college_id, password_link):
+    from users.models import User
+    from colleges.models import College
+
+    user = User.objects.get(id=user_id)
+    college = College.objects.get(id=college_id)
+    send_messages([build_activation_email(user, college, password_link)])
+
+
+@shared_task(acks_late=False, ignore_result=True)
+def send_activation_emails(activations):
+    """
+    Send a batch of activation emails over one SMTP session.
+    `activations` is a list of [user_id, password_link] pairs.
+    """
+    from users.models import User
+
+    links = {user_id: link for user_id, link in activations}
+    users = User.objects.select_related("college").filter(id__in=links)
+    send_messages([build_activation_email(user, user.college, links[user.id]) for user in users])
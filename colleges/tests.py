@@ -1,3 +1,225 @@
-from django.test import TestCase
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.urls import reverse
+from checkmate_central.testing import QueryBudgetTestCase, received_mail, start_smtp_sink
+from colleges import importer
+from colleges.models import College
+from colleges.tasks import send_activation_emails
+from users.models import CreatePasswordRequest, User
 
-# Create your tests here.
+
+def import_csv(colleges=3, users_per_college=2, prefix="BULK"):
+    lines = ["college_name,college_code,email,first_name,last_name"]
+    for c in range(colleges):
+        for u in range(users_per_college):
+            lines.append(f"{prefix} College {c},{prefix}{c:03d},{prefix.lower()}{c}.{u}@example.com,User,{u}")
+    return "\n".join(lines) + "\n"
+
+
+class CollegeViewQueryBudgetTests(QueryBudgetTestCase):
+
+    def test_college_dashboard(self):
+        self.login(self.college_user)
+        self.assertQueryBudget(4, lambda: self.client.get(reverse("colleges:college_dashboard")))
+
+    def test_register_college_form(self):
+        self.login(self.staff)
+        self.assertQueryBudget(0, lambda: self.client.get(reverse("colleges:register_college")))
+
+    def test_register_college_submit(self):
+        self.login(self.staff)
+        self.assertQueryBudget(6, lambda: self.client.post(reverse("colleges:register_college"), {
+            "name": "New College",
+            "code": "NEW001",
+        }), repeatable=False)
+
+    def test_bulk_import_form(self):
+        self.login(self.staff)
+        self.assertQueryBudget(0, lambda: self.client.get(reverse("colleges:bulk_import")))
+
+    def test_bulk_import_submit(self):
+        self.login(self.staff)
+        upload = SimpleUploadedFile("colleges.csv", import_csv(colleges=20).encode())
+        self.assertQueryBudget(11, lambda: self.client.post(reverse("colleges:bulk_import"), {"file": upload}),
+                               repeatable=False)
+
+    def test_manage_college(self):
+        self.login(self.staff)
+        self.assertQueryBudget(2, lambda: self.client.get(reverse("colleges:manage_college", args=[self.college.id])))
+
+    def test_show_api_key(self):
+        self.login(self.staff)
+        self.assertQueryBudget(2, lambda: self.client.get(reverse("colleges:reset_api_key", args=[self.college.id])))
+
+    def test_reset_api_key(self):
+        self.login(self.staff)
+        self.assertQueryBudget(8, lambda: self.client.post(reverse("colleges:reset_api_key", args=[self.college.id])))
+
+    def test_register_college_user_form(self):
+        self.login(self.staff)
+        self.assertQueryBudget(1, lambda: self.client.get(
+            reverse("colleges:register_college_user", args=[self.college.id])
+        ))
+
+    def test_register_college_user_submit(self):
+        self.login(self.staff)
+        self.assertQueryBudget(7, lambda: self.client.post(
+            reverse("colleges:register_college_user", args=[self.college.id]),
+            {"email": "new.user@example.com", "first_name": "New", "last_name": "User"},
+        ), repeatable=False)
+
+    def test_create_password_form(self):
+        password_request = CreatePasswordRequest.objects.filter(user=self.college_user).first()
+        self.assertQueryBudget(2, lambda: self.client.get(
+            reverse("colleges:create_college_user_password", args=[password_request.uuid])
+        ))
+
+    def test_create_password_submit(self):
+        password_request = CreatePasswordRequest.objects.filter(user=self.college_user).first()
+        self.assertQueryBudget(6, lambda: self.client.post(
+            reverse("colleges:create_college_user_password", args=[password_request.uuid]),
+            {"password1": "a-Strong-pass-123", "password2": "a-Strong-pass-123"},
+        ), repeatable=False)
+
+    def test_edit_college_user_form(self):
+        self.login(self.staff)
+        self.assertQueryBudget(2, lambda: self.client.get(
+            reverse("colleges:edit_college_user", args=[self.college.id, self.college_user.id])
+        ))
+
+    def test_edit_college_user_submit(self):
+        self.login(self.staff)
+        self.assertQueryBudget(3, lambda: self.client.post(
+            reverse("colleges:edit_college_user", args=[self.college.id, self.college_user.id]),
+            {"first_name": "Edited", "last_name": "User"},
+        ))
+
+    def test_delete_college_user_form(self):
+        self.login(self.staff)
+        self.assertQueryBudget(2, lambda: self.client.get(
+            reverse("colleges:delete_college_user", args=[self.college.id, self.college_user.id])
+        ))
+
+    def test_delete_college_user_submit(self):
+        self.login(self.staff)
+        self.assertQueryBudget(10, lambda: self.client.post(
+            reverse("colleges:delete_college_user", args=[self.college.id, self.college_user.id])
+        ), repeatable=False)
+
+    def test_trigger_password_reset(self):
+        self.login(self.staff)
+        self.assertQueryBudget(4, lambda: self.client.get(
+            reverse("colleges:trigger_password_reset", args=[self.college_user.id])
+        ))
+
+
+class CollegeAdminQueryBudgetTests(QueryBudgetTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.login(self.staff)
+
+    def test_college_changelist(self):
+        self.assertQueryBudget(3, lambda: self.client.get(reverse("admin:colleges_college_changelist")))
+
+    def test_api_key_changelist(self):
+        self.assertQueryBudget(3, lambda: self.client.get(
+            reverse("admin:rest_framework_api_key_apikey_changelist")
+        ))
+
+
+class BulkImportTests(QueryBudgetTestCase):
+
+    def link(self, uuid):
+        return f"https://central.example.com/{uuid}/"
+
+    def test_import_creates_colleges_users_and_keys(self):
+        colleges = importer.parse(import_csv(colleges=3, users_per_college=2), "csv")
+        importer.validate(colleges)
+        with self.captureOnCommitCallbacks(execute=True):
+            result = importer.run_import(colleges, self.link)
+
+        self.assertEqual(len(result.keys), 3)
+        self.assertEqual(result.user_count, 6)
+        for college, key in result.keys:
+            self.assertTrue(college.api_key.is_valid(key))
+            self.assertEqual(college.users.filter(role=User.Role.COLLEGE, is_active=False).count(), 2)
+        self.assertEqual(CreatePasswordRequest.objects.filter(college__code__startswith="BULK").count(), 6)
+        send_activation_emails.delay.assert_called_once()
+
+    def test_activation_emails_are_delivered_once(self):
+        colleges = importer.parse(import_csv(colleges=3, users_per_college=2), "csv")
+        with self.captureOnCommitCallbacks(execute=True):
+            importer.run_import(colleges, self.link)
+        (activations,), _ = send_activation_emails.delay.call_args
+        sink = start_smtp_sink(self, drop_after=4)
+
+        send_activation_emails(activations)
+
+        received = {m["To"]: m.get_payload(0).get_payload(decode=True).decode() for m in received_mail(sink)}
+        self.assertEqual(sink.messages, 6)
+        users = User.objects.filter(college__code__startswith="BULK")
+        self.assertEqual(sorted(received), sorted(user.email for user in users))
+        for user_id, link in activations:
+            self.assertIn(link, received[users.get(id=user_id).email])
+
+    def test_validation_rejects_the_whole_file(self):
+        text = import_csv(colleges=2) + f"Another,OTHER1,{self.college_user.email},A,B\n"
+        with self.assertRaises(importer.ImportValidationError) as ctx:
+            importer.validate(importer.parse(text, "csv"))
+        self.assertTrue(any(self.college_user.email in error for error in ctx.exception.errors))
+        self.assertFalse(College.objects.filter(code__startswith="BULK").exists())
+
+    def test_csv_errors_are_all_reported_together(self):
+        text = (
+            import_csv(colleges=2)
+            + "Renamed College,BULK000,renamed@example.com,A,B\n"
+            + f"Another Name,BULK001,long@example.com,{'x' * 151},B\n"
+            + f"Other,OTHER1,other@example.com,A,{'y' * 151}\n"
+            + f"Other,OTHER1,{self.college_user.email},A,B\n"
+        )
+        with self.assertRaises(importer.ImportValidationError) as ctx:
+            importer.validate(importer.parse(text, "csv"))
+
+        self.assertEqual(ctx.exception.errors, [
+            "Line 6: college 'BULK000' is named both 'BULK College 0' and 'Renamed College'",
+            "Line 7: college 'BULK001' is named both 'BULK College 1' and 'Another Name'",
+            "Line 7: first name is longer than 150 characters",
+            "Line 8: last name is longer than 150 characters",
+            f"A user with email '{self.college_user.email}' already exists",
+        ])
+        self.assertFalse(College.objects.filter(code__startswith="BULK").exists())
+
+    def test_json_format(self):
+        text = '[{"name": "Json College", "code": "json1", "users": [{"email": "j@example.com"}]}]'
+        colleges = importer.parse(text, "json")
+        importer.validate(colleges)
+        importer.run_import(colleges, self.link)
+        self.assertTrue(User.objects.filter(email="j@example.com", college__code="JSON1").exists())
+
+    def test_json_type_errors_are_reported(self):
+        text = (
+            '[{"name": "Json College", "code": "json1", "users": [{"email": "j@example.com"}]},'
+            ' "not an object", {"name": 5, "code": "json3", "users": ["x@example.com", {"email": ["y@example.com"]}]},'
+            ' {"name": "Other", "code": "json4", "users": {"email": "z@example.com"}}]'
+        )
+        with self.assertRaises(importer.ImportValidationError) as ctx:
+            importer.parse(text, "json")
+
+        self.assertEqual(ctx.exception.errors, [
+            "Entry 2: expected an object",
+            "Entry 3: 'name' must be a string",
+            "Entry 3, user 1: expected an object",
+            "Entry 3, user 2: 'email' must be a string",
+            "Entry 4: 'users' must be a list",
+        ])
+
+    def test_bad_json_is_shown_on_the_form(self):
+        self.login(self.staff)
+        response = self.client.post(reverse("colleges:bulk_import"), {
+            "file": SimpleUploadedFile("colleges.json", b'[{"name": "Json College", "code": 1, "users": [7]}]'),
+        })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Entry 1: &#x27;code&#x27; must be a string")
+        self.assertContains(response, "Entry 1, user 1: expected an object")
+        self.assertFalse(College.objects.filter(name="Json College").exists())
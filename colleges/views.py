@@ -2,13 +2,17 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from users.models import User, CreatePasswordRequest
 from colleges.models import College
+from backups.models import Backup
 from rest_framework_api_key.models import APIKey
 from django.contrib import messages
-from .forms import RegisterCollegeForm, RegisterCollegeUserForm, CreateCollegeUserPasswordForm
+from .forms import RegisterCollegeForm, RegisterCollegeUserForm, CreateCollegeUserPasswordForm, BulkImportForm
+from . import importer
+from django.views.decorators.cache import never_cache
 import logging
 from django.db import transaction
 from colleges.tasks import send_activation_email
 from django.urls import reverse
+from checkmate_central.db_routers import use_replica
 
 logger = logging.getLogger(__name__)
 
@@ -28,6 +32,7 @@ def get_user_role(request):
             return User.Role.COLLEGE
 
 @login_required
+@use_replica
 def college_dashboard(request):
     user_info = get_user_info(request)
     college = request.user.college  # assuming user is a college user
@@ -35,7 +40,7 @@ def college_dashboard(request):
     logger.info(f"Dashboard viewed by {user_info} for {college.name} ({college.code})")
 
     users = college.users.all()
-    backups = college.backups.all().order_by('-uploaded_at')
+    backups = Backup.objects.catalog(college=college)
 
     return render(request, 'colleges/dashboard.html', {
         'college': college,
@@ -67,6 +72,46 @@ def register_college(request):
 
     return render(request, "colleges/register_college.html", {"form": form})
 
+@never_cache
+@login_required
+def bulk_import(request):
+    user_info = get_user_info(request)
+
+    if get_user_role(request) != User.Role.STAFF:
+        logger.warning(f"Unauthorized bulk import attempt by {user_info}")
+        return redirect("colleges:college_dashboard")
+
+    if request.method == "POST":
+        form = BulkImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            try:
+                colleges = importer.parse(form.text, form.format)
+                importer.validate(colleges)
+            except importer.ImportValidationError as e:
+                logger.warning(f"Rejected bulk import by {user_info}: {e}")
+                return render(request, "colleges/bulk_import.html", {"form": form, "import_errors": e.errors})
+
+            result = importer.run_import(
+                colleges,
+                lambda uuid: request.build_absolute_uri(
+                    reverse("colleges:create_college_user_password", args=[uuid])
+                ),
+            )
+            logger.info(
+                f"Bulk import of {len(result.keys)} colleges and {result.user_count} users by {user_info}"
+            )
+            # The raw keys exist only in this response; they are not stored anywhere.
+            return render(request, "colleges/bulk_import_result.html", {
+                "result": result,
+                "keys_csv": importer.keys_as_csv(result.keys),
+            })
+        else:
+            logger.warning(f"Invalid bulk import attempt by {user_info}: {form.errors.as_text()}")
+    else:
+        form = BulkImportForm()
+
+    return render(request, "colleges/bulk_import.html", {"form": form})
+
 @login_required
 def register_college_user(request, college_id):
     user_info = get_user_info(request)
@@ -0,0 +1,21 @@
+# gunicorn.conf.py - picked up automatically by `gunicorn` from the working directory.
+import os
+
+
+def child_exit(server, worker):
+    """Drop a dead worker's live gauges from the Prometheus multiprocess directory."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
+
+
+def post_fork(server, worker):
+    """Never share a database connection opened in the master (with --preload) between workers."""
+    from django.apps import apps
+
+    if apps.ready:
+        from django.db import connections
+
+        for conn in connections.all(initialized_only=True):
+            conn.close()
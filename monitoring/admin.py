@@ -0,0 +1,65 @@
+from django.contrib import admin
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html
+from .models import ProfileReport
+
+
+@admin.register(ProfileReport)
+class ProfileReportAdmin(admin.ModelAdmin):
+    list_display = (
+        "target",
+        "kind",
+        "duration_display",
+        "query_count",
+        "requested_by",
+        "created_at",
+        "download_link",
+    )
+    list_filter = ("kind", "created_at")
+    search_fields = ("target", "requested_by__email")
+    list_select_related = ("requested_by",)
+    readonly_fields = (
+        "kind",
+        "target",
+        "requested_by",
+        "created_at",
+        "duration_ms",
+        "query_count",
+        "query_time_ms",
+        "report",
+        "sql",
+    )
+
+    def duration_display(self, obj):
+        return f"{obj.duration_ms:.0f} ms"
+    duration_display.short_description = "Duration"
+
+    def download_link(self, obj):
+        url = reverse("admin:monitoring_profilereport_download", args=[obj.pk])
+        return format_html('<a href="{}">Download</a>', url)
+    download_link.short_description = "Report"
+
+    def get_urls(self):
+        urls = [
+            path(
+                "<int:report_id>/download/",
+                self.admin_site.admin_view(self.download_view),
+                name="monitoring_profilereport_download",
+            ),
+        ]
+        return urls + super().get_urls()
+
+    def download_view(self, request, report_id):
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        report = get_object_or_404(ProfileReport, pk=report_id)
+        response = HttpResponse(report.as_text(), content_type="text/plain; charset=utf-8")
+        response["Content-Disposition"] = f'attachment; filename="profile_{report.pk}.txt"'
+        return response
+
+    def has_add_permission(self, request):
+        # Reports are only created by the profiler
+        return False
@@ -0,0 +1,63 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.signals import request_finished, request_started
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure per-request database latency with a new connection per request "
+        "(CONN_MAX_AGE=0) against a persistent, health-checked connection"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200)
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS)
+        parser.add_argument("--query", default="SELECT 1", help="Query each simulated request runs")
+
+    def handle(self, *args, **options):
+        if options["requests"] < 1:
+            raise CommandError("❌ --requests must be at least 1.")
+        conn = connections[options["database"]]
+        configured = conn.settings_dict["CONN_MAX_AGE"]
+
+        results = {}
+        try:
+            for label, max_age in (("fresh connection", 0), ("persistent", None)):
+                results[label] = self.measure(conn, max_age, options["requests"], options["query"])
+        finally:
+            conn.close()
+            conn.settings_dict["CONN_MAX_AGE"] = configured
+
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"📘 {options['requests']} requests against '{options['database']}' ({conn.vendor})"
+        ))
+        for label, timings in results.items():
+            self.stdout.write(
+                f"   {label:<17} mean {statistics.fmean(timings):7.2f} ms   "
+                f"p50 {self.percentile(timings, 50):7.2f} ms   p95 {self.percentile(timings, 95):7.2f} ms"
+            )
+        saved = statistics.fmean(results["fresh connection"]) - statistics.fmean(results["persistent"])
+        self.stdout.write(self.style.SUCCESS(f"✅ Persistent connections save {saved:.2f} ms per request."))
+
+    def measure(self, conn, max_age, count, query):
+        """Run `count` simulated requests, firing the request signals Django uses to close or keep connections."""
+        conn.close()
+        conn.settings_dict["CONN_MAX_AGE"] = max_age
+        timings = []
+        for _ in range(count):
+            started = time.perf_counter()
+            request_started.send(sender=self.__class__)
+            with conn.cursor() as cursor:
+                cursor.execute(query)
+                cursor.fetchall()
+            request_finished.send(sender=self.__class__)
+            timings.append((time.perf_counter() - started) * 1000)
+        return timings
+
+    @staticmethod
+    def percentile(values, pct):
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+from users.models import User
+from monitoring.profiling import TOKEN_MAX_AGE, issue_token
+
+
+class Command(BaseCommand):
+    help = "Issue a short-lived signed token for profiling a single request via the X-Profile header"
+
+    def add_arguments(self, parser):
+        parser.add_argument("email", help="Email of the staff user the profile is requested by")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(email=options["email"], role=User.Role.STAFF, is_active=True)
+        except User.DoesNotExist:
+            raise CommandError(f"❌ No active staff user with email '{options['email']}'.")
+
+        token = issue_token(user.id)
+        self.stdout.write(self.style.SUCCESS(f"✅ Profile token (valid {TOKEN_MAX_AGE // 60} minutes):"))
+        self.stdout.write(token)
+        self.stdout.write("")
+        self.stdout.write(f"   Send it as:  X-Profile: {token}")
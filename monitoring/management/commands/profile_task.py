@@ -0,0 +1,41 @@
+import json
+
+from celery import current_app
+from django.core.management.base import BaseCommand, CommandError
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = "Queue one run of a Celery task with profiling enabled; the report appears in the admin"
+
+    def add_arguments(self, parser):
+        parser.add_argument("task", help="Registered task name, e.g. users.tasks.send_login_otp")
+        # Django keeps options["args"] for its own positional arguments.
+        parser.add_argument("--args", dest="task_args", default="[]", help="JSON list of positional arguments")
+        parser.add_argument("--kwargs", dest="task_kwargs", default="{}", help="JSON object of keyword arguments")
+        parser.add_argument("--email", help="Staff user to record as the requester")
+
+    def handle(self, *args, **options):
+        current_app.loader.import_default_modules()
+        task = current_app.tasks.get(options["task"])
+        if task is None:
+            raise CommandError(f"❌ Unknown task '{options['task']}'.")
+
+        try:
+            task_args = json.loads(options["task_args"])
+            task_kwargs = json.loads(options["task_kwargs"])
+        except json.JSONDecodeError as e:
+            raise CommandError(f"❌ Invalid JSON arguments: {e}")
+
+        requested_by = None
+        if options["email"]:
+            requested_by = User.objects.filter(email=options["email"], role=User.Role.STAFF).values_list("id", flat=True).first()
+            if requested_by is None:
+                raise CommandError(f"❌ No staff user with email '{options['email']}'.")
+
+        result = task.apply_async(
+            args=task_args,
+            kwargs=task_kwargs,
+            headers={"profile": True, "profile_requested_by": requested_by},
+        )
+        self.stdout.write(self.style.SUCCESS(f"✅ Queued profiled run of {task.name} (task id {result.id})."))
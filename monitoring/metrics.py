@@ -0,0 +1,125 @@
+"""
+Prometheus metrics shared by the web and Celery processes.
+
+When PROMETHEUS_MULTIPROC_DIR is set (gunicorn with several workers, Celery
+prefork pools) every process writes its samples to that directory and the
+/metrics endpoint aggregates them. Without it, metrics live in the default
+in-process registry, which is fine for runserver and single-worker setups.
+"""
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+)
+
+# Buckets sized for database dumps: a few KB up to tens of GB.
+SIZE_BUCKETS = (
+    2 ** 10, 2 ** 14, 2 ** 17, 2 ** 20, 2 ** 22, 2 ** 24,
+    2 ** 26, 2 ** 28, 2 ** 30, 2 ** 32, 2 ** 34, float("inf"),
+)
+# Uploads and crypto on multi-GB files take minutes, not milliseconds.
+SLOW_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, float("inf"))
+
+UPLOAD_BYTES = Histogram(
+    "checkmate_backup_upload_bytes",
+    "Size of accepted backup uploads.",
+    ["college"],
+    buckets=SIZE_BUCKETS,
+)
+UPLOAD_LATENCY = Histogram(
+    "checkmate_backup_upload_seconds",
+    "Time spent handling a backup upload request.",
+    ["college", "status"],
+    buckets=SLOW_BUCKETS,
+)
+UPLOAD_SKIPPED_BYTES = Counter(
+    "checkmate_backup_upload_skipped_bytes_total",
+    "Bytes not uploaded because the precheck found identical content.",
+    ["college"],
+)
+UPLOAD_ADMISSIONS = Counter(
+    "checkmate_backup_upload_admissions_total",
+    "Upload admission decisions (admitted, busy, throttled, error).",
+    ["result"],
+)
+CRYPTO_BYTES = Counter(
+    "checkmate_backup_crypto_bytes_total",
+    "Bytes processed by backup encryption and decryption.",
+    ["operation"],
+)
+CRYPTO_SECONDS = Histogram(
+    "checkmate_backup_crypto_seconds",
+    "Time spent encrypting or decrypting a backup file.",
+    ["operation"],
+    buckets=SLOW_BUCKETS,
+)
+REPLICATIONS = Counter(
+    "checkmate_backup_replications_total",
+    "Backup replication attempts per target (copied, present, failed).",
+    ["target", "result"],
+)
+REPLICATION_BYTES = Counter(
+    "checkmate_backup_replication_bytes_total",
+    "Bytes copied to replication targets.",
+    ["target"],
+)
+GC_BYTES = Counter(
+    "checkmate_backup_gc_bytes_total",
+    "Bytes of orphaned backup files handled by garbage collection (temp, quarantined, deleted, purged).",
+    ["action"],
+)
+DOWNLOADS = Counter(
+    "checkmate_backup_downloads_total",
+    "Backup downloads served.",
+    ["college", "kind"],
+)
+AUTH_CACHE_LOOKUPS = Counter(
+    "checkmate_auth_cache_lookups_total",
+    "Authentication cache lookups.",
+    ["cache", "result"],
+)
+CELERY_TASK_SECONDS = Histogram(
+    "checkmate_celery_task_seconds",
+    "Celery task run time.",
+    ["task", "state"],
+    buckets=SLOW_BUCKETS,
+)
+CELERY_QUEUE_WAIT = Histogram(
+    "checkmate_celery_queue_wait_seconds",
+    "Time between a task being published and a worker starting it.",
+    ["task"],
+    buckets=SLOW_BUCKETS,
+)
+
+
+@contextmanager
+def track_crypto(operation, size):
+    """Record throughput for one encrypt/decrypt call of `size` bytes."""
+    start = time.perf_counter()
+    yield
+    CRYPTO_SECONDS.labels(operation=operation).observe(time.perf_counter() - start)
+    CRYPTO_BYTES.labels(operation=operation).inc(size)
+
+
+def get_registry():
+    """Return a registry aggregating every process, or the in-process one."""
+    if not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        return REGISTRY
+
+    from prometheus_client import multiprocess
+
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def render_latest():
+    """Return (payload, content_type) for the /metrics response."""
+    return generate_latest(get_registry()), CONTENT_TYPE_LATEST
@@ -0,0 +1,47 @@
+import logging
+
+from .models import ProfileReport
+from .profiling import Profile, verify_token
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "X-Profile"
+PROFILE_QUERY_FLAG = "_profile"
+
+
+class ProfilingMiddleware:
+    """
+    Profiles a single request when asked to, otherwise passes straight through.
+
+    Trigger with either:
+    - an `X-Profile: <signed token>` header (see `manage.py issue_profile_token`), or
+    - a `?_profile=1` query flag from a logged-in staff session.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = request.headers.get(PROFILE_HEADER)
+        if token is None and PROFILE_QUERY_FLAG not in request.GET:
+            return self.get_response(request)
+
+        user_id = self._authorized_user_id(request, token)
+        if user_id is None:
+            return self.get_response(request)
+
+        logger.info(f"Profiling {request.method} {request.path} for user {user_id}")
+        with Profile(ProfileReport.Kind.REQUEST, f"{request.method} {request.get_full_path()}", user_id):
+            return self.get_response(request)
+
+    def _authorized_user_id(self, request, token):
+        if token:
+            user_id = verify_token(token)
+            if user_id is None:
+                logger.warning(f"Rejected invalid profile token on {request.path}")
+            return user_id
+
+        user = getattr(request, "user", None)
+        if user and user.is_authenticated and user.role == "STAFF":
+            return user.id
+        return None
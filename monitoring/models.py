@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.db import models
+
+
+class ProfileReport(models.Model):
+    """
+    A cProfile report plus the SQL executed, captured on demand for a single
+    request or Celery task run.
+    """
+    class Kind(models.TextChoices):
+        REQUEST = "REQUEST", "Request"
+        TASK = "TASK", "Celery Task"
+
+    kind = models.CharField(max_length=20, choices=Kind.choices)
+    target = models.CharField(max_length=512, help_text="Request path or task name")
+    requested_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="profile_reports",
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    duration_ms = models.FloatField()
+    query_count = models.PositiveIntegerField(default=0)
+    query_time_ms = models.FloatField(default=0)
+    report = models.TextField()
+    sql = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.target} ({self.duration_ms:.0f} ms)"
+
+    def as_text(self):
+        """Full downloadable report: profile output followed by the SQL log."""
+        return (
+            f"{self.get_kind_display()}: {self.target}\n"
+            f"Captured: {self.created_at:%Y-%m-%d %H:%M:%S %Z}\n"
+            f"Duration: {self.duration_ms:.1f} ms\n"
+            f"Queries: {self.query_count} ({self.query_time_ms:.1f} ms)\n\n"
+            f"{self.report}\n\n"
+            f"===== SQL =====\n{self.sql}\n"
+        )
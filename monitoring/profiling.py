@@ -0,0 +1,107 @@
+"""
+On-demand profiling of a single request or Celery task run.
+
+Nothing here runs unless a profile is explicitly requested, so requests and
+tasks pay only for a header/flag lookup.
+"""
+import cProfile
+import io
+import pstats
+import time
+from contextlib import ExitStack
+
+from django.core import signing
+from django.db import connections
+
+TOKEN_SALT = "monitoring.profile"
+TOKEN_MAX_AGE = 15 * 60
+REPORT_LINES = 60
+
+
+def issue_token(user_id):
+    """Signed token for the X-Profile header; valid for TOKEN_MAX_AGE seconds."""
+    return signing.TimestampSigner(salt=TOKEN_SALT).sign(str(user_id))
+
+
+def verify_token(token):
+    """
+    Return the user id the token was issued for, or None if invalid/expired.
+
+    The user must still be an active staff member: a token stays signed for
+    TOKEN_MAX_AGE even if its owner is demoted or deactivated meanwhile.
+    """
+    from users.models import User
+
+    try:
+        user_id = int(signing.TimestampSigner(salt=TOKEN_SALT).unsign(token, max_age=TOKEN_MAX_AGE))
+    except (signing.BadSignature, ValueError):
+        return None
+    if not User.objects.filter(pk=user_id, role=User.Role.STAFF, is_active=True).exists():
+        return None
+    return user_id
+
+
+class QueryRecorder:
+    """execute_wrapper that records every SQL statement and its duration."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((context["connection"].alias, time.perf_counter() - start, sql, params))
+
+    @property
+    def total_time(self):
+        return sum(q[1] for q in self.queries)
+
+    def as_text(self):
+        return "\n".join(
+            f"[{alias}] {duration * 1000:.2f} ms: {sql} {params!r}"
+            for alias, duration, sql, params in self.queries
+        )
+
+
+class Profile:
+    """Context manager capturing cProfile stats and SQL, then saving a ProfileReport."""
+
+    def __init__(self, kind, target, requested_by_id=None):
+        self.kind = kind
+        self.target = target
+        self.requested_by_id = requested_by_id
+        self.recorder = QueryRecorder()
+        self.profiler = cProfile.Profile()
+        self._stack = ExitStack()
+
+    def __enter__(self):
+        for alias in connections:
+            self._stack.enter_context(connections[alias].execute_wrapper(self.recorder))
+        self._started = time.perf_counter()
+        self.profiler.enable()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.profiler.disable()
+        duration = time.perf_counter() - self._started
+        self._stack.close()
+        self.save(duration)
+        return False
+
+    def save(self, duration):
+        from .models import ProfileReport
+
+        stream = io.StringIO()
+        pstats.Stats(self.profiler, stream=stream).sort_stats("cumulative").print_stats(REPORT_LINES)
+        return ProfileReport.objects.create(
+            kind=self.kind,
+            target=self.target[:512],
+            requested_by_id=self.requested_by_id,
+            duration_ms=duration * 1000,
+            query_count=len(self.recorder.queries),
+            query_time_ms=self.recorder.total_time * 1000,
+            report=stream.getvalue(),
+            sql=self.recorder.as_text(),
+        )
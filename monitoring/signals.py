@@ -0,0 +1,71 @@
+import os
+import time
+
+from celery.signals import (
+    before_task_publish,
+    task_postrun,
+    task_prerun,
+    worker_process_shutdown,
+    worker_ready,
+)
+
+from .metrics import CELERY_QUEUE_WAIT, CELERY_TASK_SECONDS, get_registry
+
+_task_started = {}
+_task_profiles = {}
+
+
+@before_task_publish.connect
+def stamp_publish_time(headers=None, **kwargs):
+    """Record when the task was published so the worker can compute queue wait."""
+    if headers is not None:
+        headers.setdefault("published_at", time.time())
+
+
+@task_prerun.connect
+def start_task_timer(task_id=None, task=None, **kwargs):
+    _task_started[task_id] = time.perf_counter()
+    published_at = getattr(task.request, "published_at", None)
+    if published_at:
+        CELERY_QUEUE_WAIT.labels(task=task.name).observe(max(time.time() - float(published_at), 0))
+
+    # Only runs sent via `manage.py profile_task` carry this header.
+    if getattr(task.request, "profile", None):
+        from .models import ProfileReport
+        from .profiling import Profile
+
+        profile = Profile(ProfileReport.Kind.TASK, task.name, getattr(task.request, "profile_requested_by", None))
+        _task_profiles[task_id] = profile.__enter__()
+
+
+@task_postrun.connect
+def stop_task_timer(task_id=None, task=None, state=None, **kwargs):
+    profile = _task_profiles.pop(task_id, None)
+    if profile is not None:
+        profile.__exit__(None, None, None)
+
+    started = _task_started.pop(task_id, None)
+    if started is not None:
+        CELERY_TASK_SECONDS.labels(task=task.name, state=state or "UNKNOWN").observe(
+            time.perf_counter() - started
+        )
+
+
+@worker_ready.connect
+def start_worker_exporter(**kwargs):
+    """Expose the pool's aggregated metrics on CELERY_METRICS_PORT for Prometheus."""
+    port = os.getenv("CELERY_METRICS_PORT")
+    if not port:
+        return
+
+    from prometheus_client import start_http_server
+
+    start_http_server(int(port), registry=get_registry())
+
+
+@worker_process_shutdown.connect
+def mark_worker_dead(pid=None, **kwargs):
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(pid or os.getpid())
@@ -0,0 +1,277 @@
+import os
+import time
+from io import StringIO
+from unittest import mock
+
+from django.core import signing
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import SimpleTestCase
+from django.urls import reverse
+from prometheus_client import CONTENT_TYPE_LATEST
+from prometheus_client.parser import text_string_to_metric_families
+from checkmate_central.testing import QueryBudgetTestCase
+from colleges.tasks import send_activation_emails
+from users.models import User
+from . import signals
+from .middleware import PROFILE_HEADER
+from .models import ProfileReport
+from .profiling import TOKEN_MAX_AGE, issue_token, verify_token
+
+
+class MonitoringQueryBudgetTests(QueryBudgetTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.login(self.staff)
+
+    def test_metrics(self):
+        self.assertQueryBudget(0, lambda: self.client.get(reverse("monitoring:metrics")))
+
+    def test_profile_report_changelist(self):
+        self.client.get(reverse("users:staff_dashboard"), {"_profile": "1"})
+        self.assertQueryBudget(3, lambda: self.client.get(reverse("admin:monitoring_profilereport_changelist")))
+
+
+class MetricsEndpointTests(QueryBudgetTestCase):
+    METRICS = [
+        "checkmate_backup_upload_bytes", "checkmate_backup_upload_seconds", "checkmate_backup_upload_skipped_bytes",
+        "checkmate_backup_upload_admissions", "checkmate_backup_crypto_bytes", "checkmate_backup_crypto_seconds",
+        "checkmate_backup_replications", "checkmate_backup_replication_bytes", "checkmate_backup_gc_bytes",
+        "checkmate_backup_downloads", "checkmate_auth_cache_lookups", "checkmate_celery_task_seconds",
+        "checkmate_celery_queue_wait_seconds",
+    ]
+
+    def scrape(self, **headers):
+        return self.client.get(reverse("monitoring:metrics"), headers=headers)
+
+    def samples(self):
+        """{(name, sorted labels): value} of the current scrape, as a staff user."""
+        self.login(self.staff)
+        response = self.scrape()
+        self.assertEqual(response.status_code, 200)
+        self.client.logout()
+        return {
+            (sample.name, tuple(sorted(sample.labels.items()))): sample.value
+            for family in text_string_to_metric_families(response.content.decode())
+            for sample in family.samples
+        }
+
+    def test_staff_session_sees_every_metric(self):
+        self.login(self.staff)
+        response = self.scrape()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], CONTENT_TYPE_LATEST)
+        families = {family.name for family in text_string_to_metric_families(response.content.decode())}
+        self.assertLessEqual(set(self.METRICS), families)
+
+    def test_other_users_are_refused(self):
+        self.assertEqual(self.scrape().status_code, 403)
+        self.login(self.college_user)
+        self.assertEqual(self.scrape().status_code, 403)
+
+    def test_scrape_token(self):
+        self.assertEqual(self.scrape(Authorization="Bearer secret").status_code, 403)
+        with mock.patch.dict(os.environ, {"METRICS_TOKEN": "secret"}):
+            self.assertEqual(self.scrape(Authorization="Bearer secret").status_code, 200)
+            self.assertEqual(self.scrape(Authorization="Bearer wrong").status_code, 403)
+            self.login(self.staff)
+            self.assertEqual(self.scrape(Authorization="Bearer wrong").status_code, 403)
+
+    def test_upload_is_counted(self):
+        count = ("checkmate_backup_upload_bytes_count", (("college", self.college.code),))
+        latency = (
+            "checkmate_backup_upload_seconds_count", (("college", self.college.code), ("status", "created")),
+        )
+        before = self.samples()
+
+        self.client.post(
+            reverse("backups:backup-upload"),
+            {"file": SimpleUploadedFile("dump.sql", b"CREATE TABLE t (id INT);\n")},
+            HTTP_AUTHORIZATION=f"Api-Key {self.api_key}",
+        )
+
+        after = self.samples()
+        self.assertEqual(after[count], before.get(count, 0) + 1)
+        self.assertEqual(after[latency], before.get(latency, 0) + 1)
+
+    def test_auth_cache_lookups_are_counted(self):
+        hits = ("checkmate_auth_cache_lookups_total", (("cache", "user"), ("result", "hit")))
+        before = self.samples()
+
+        self.login(self.staff)
+        self.client.get(reverse("users:staff_dashboard"))
+
+        # The dashboard and the scrape itself each look the user up once.
+        self.assertEqual(self.samples()[hits], before.get(hits, 0) + 2)
+
+    def test_celery_tasks_are_timed(self):
+        task = send_activation_emails.name
+        runs = ("checkmate_celery_task_seconds_count", (("state", "SUCCESS"), ("task", task)))
+        waits = ("checkmate_celery_queue_wait_seconds_count", (("task", task),))
+        before = self.samples()
+
+        send_activation_emails.push_request(id="task-1", published_at=time.time() - 5)
+        try:
+            signals.start_task_timer(task_id="task-1", task=send_activation_emails)
+            signals.stop_task_timer(task_id="task-1", task=send_activation_emails, state="SUCCESS")
+        finally:
+            send_activation_emails.pop_request()
+
+        after = self.samples()
+        self.assertEqual(after[runs], before.get(runs, 0) + 1)
+        self.assertEqual(after[waits], before.get(waits, 0) + 1)
+
+
+class ProfilingMiddlewareTests(QueryBudgetTestCase):
+
+    def get(self, token=None, **params):
+        headers = {PROFILE_HEADER: token} if token is not None else {}
+        response = self.client.get(reverse("users:staff_dashboard"), params, headers=headers)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_valid_token_produces_a_report(self):
+        self.login(self.staff)
+        self.get(issue_token(self.staff.id))
+
+        report = ProfileReport.objects.get()
+        self.assertEqual(report.kind, ProfileReport.Kind.REQUEST)
+        self.assertEqual(report.target, f"GET {reverse('users:staff_dashboard')}")
+        self.assertEqual(report.requested_by, self.staff)
+        self.assertIn("function calls", report.report)
+        self.assertGreater(report.query_count, 0)
+        self.assertIn("SELECT", report.sql)
+
+    def test_token_is_enough_without_a_staff_session(self):
+        self.client.get(reverse("landing_page"), headers={PROFILE_HEADER: issue_token(self.staff.id)})
+
+        self.assertEqual(ProfileReport.objects.get().requested_by, self.staff)
+
+    def test_token_of_a_demoted_user_is_ignored(self):
+        token = issue_token(self.staff.id)
+        self.staff.role = User.Role.COLLEGE
+        self.staff.save(update_fields=["role"])
+
+        self.client.get(reverse("landing_page"), headers={PROFILE_HEADER: token})
+
+        self.assertFalse(ProfileReport.objects.exists())
+
+    def test_bad_token_is_ignored(self):
+        self.login(self.staff)
+        self.get(issue_token(self.staff.id) + "x")
+        self.get("garbage")
+
+        self.assertFalse(ProfileReport.objects.exists())
+
+    def test_expired_token_is_ignored(self):
+        self.login(self.staff)
+        token = issue_token(self.staff.id)
+        later = time.time() + TOKEN_MAX_AGE + 1
+        with mock.patch("django.core.signing.time", mock.Mock(time=lambda: later)):
+            self.get(token)
+
+        self.assertFalse(ProfileReport.objects.exists())
+
+    def test_untriggered_request_is_not_profiled(self):
+        self.login(self.staff)
+        self.get()
+
+        self.assertFalse(ProfileReport.objects.exists())
+
+    def test_query_flag_needs_a_staff_session(self):
+        self.login(self.college_user)
+        self.client.get(reverse("colleges:college_dashboard"), {"_profile": "1"})
+        self.assertFalse(ProfileReport.objects.exists())
+
+        self.login(self.staff)
+        self.get(_profile="1")
+        self.assertEqual(ProfileReport.objects.get().requested_by, self.staff)
+
+
+class ProfileTokenTests(QueryBudgetTestCase):
+
+    def test_round_trip(self):
+        self.assertEqual(verify_token(issue_token(self.staff.id)), self.staff.id)
+
+    def test_rejects_tokens_of_users_who_are_no_longer_active_staff(self):
+        token = issue_token(self.staff.id)
+        self.staff.role = User.Role.COLLEGE
+        self.staff.save(update_fields=["role"])
+        self.assertIsNone(verify_token(token))
+
+        self.staff.role = User.Role.STAFF
+        self.staff.is_active = False
+        self.staff.save(update_fields=["role", "is_active"])
+        self.assertIsNone(verify_token(token))
+
+        self.assertIsNone(verify_token(issue_token(self.college_user.id)))
+        self.assertIsNone(verify_token(issue_token(10 ** 9)))
+
+    def test_rejects_tokens_signed_for_something_else(self):
+        self.assertIsNone(verify_token(signing.TimestampSigner().sign("42")))
+        self.assertIsNone(verify_token(issue_token("not-a-user-id")))
+        self.assertIsNone(verify_token(""))
+
+
+class ProfileTaskTests(QueryBudgetTestCase):
+
+    def run_task(self, **headers):
+        """Run send_activation_emails through the worker signals with the given request headers."""
+        send_activation_emails.push_request(id="task-1", **headers)
+        try:
+            signals.start_task_timer(task_id="task-1", task=send_activation_emails)
+            send_activation_emails.run([[self.college_user.id, "https://central.example.com/set/"]])
+            signals.stop_task_timer(task_id="task-1", task=send_activation_emails, state="SUCCESS")
+        finally:
+            send_activation_emails.pop_request()
+
+    def test_command_queues_a_profiled_run(self):
+        out = StringIO()
+        with mock.patch.object(send_activation_emails, "apply_async", return_value=mock.Mock(id="task-1")) as apply:
+            call_command(
+                "profile_task", send_activation_emails.name, "--args", "[[]]", "--email", self.staff.email, stdout=out,
+            )
+
+        apply.assert_called_once_with(
+            args=[[]], kwargs={}, headers={"profile": True, "profile_requested_by": self.staff.id},
+        )
+        self.assertIn("task-1", out.getvalue())
+
+    def test_command_rejects_bad_input(self):
+        for args in (
+            ["no.such.task"],
+            [send_activation_emails.name, "--args", "[oops"],
+            [send_activation_emails.name, "--email", self.college_user.email],
+        ):
+            with self.subTest(args=args), self.assertRaises(CommandError):
+                call_command("profile_task", *args, stdout=StringIO())
+
+    def test_profiled_run_produces_a_report(self):
+        self.run_task(profile=True, profile_requested_by=self.staff.id)
+
+        report = ProfileReport.objects.get()
+        self.assertEqual(report.kind, ProfileReport.Kind.TASK)
+        self.assertEqual(report.target, send_activation_emails.name)
+        self.assertEqual(report.requested_by, self.staff)
+        self.assertGreater(report.query_count, 0)
+
+    def test_plain_run_is_not_profiled(self):
+        self.run_task()
+
+        self.assertFalse(ProfileReport.objects.exists())
+
+
+class BenchmarkDbConnectionsCommandTests(SimpleTestCase):
+    databases = {"default"}
+
+    def test_reports_both_modes_and_restores_settings(self):
+        configured = connection.settings_dict["CONN_MAX_AGE"]
+        out = StringIO()
+        call_command("benchmark_db_connections", requests=5, stdout=out)
+
+        self.assertIn("fresh connection", out.getvalue())
+        self.assertIn("persistent", out.getvalue())
+        self.assertEqual(connection.settings_dict["CONN_MAX_AGE"], configured)
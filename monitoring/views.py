@@ -0,0 +1,29 @@
+import hmac
+import logging
+import os
+
+from django.http import HttpResponse
+
+from .metrics import render_latest
+
+logger = logging.getLogger(__name__)
+
+
+def _has_metrics_access(request):
+    """Allow Prometheus with the scrape token, or a logged-in staff user."""
+    token = os.getenv("METRICS_TOKEN")
+    auth_header = request.headers.get("Authorization", "")
+    if token and auth_header.startswith("Bearer "):
+        return hmac.compare_digest(auth_header.split(" ", 1)[1], token)
+
+    user = getattr(request, "user", None)
+    return bool(user and user.is_authenticated and user.role == "STAFF")
+
+
+def metrics(request):
+    if not _has_metrics_access(request):
+        logger.warning(f"Unauthorized metrics scrape from {request.META.get('REMOTE_ADDR')}")
+        return HttpResponse("Unauthorized", status=403)
+
+    payload, content_type = render_latest()
+    return HttpResponse(payload, content_type=content_type)
@@ -87,6 +87,7 @@ class CreatePasswordRequestAdmin(admin.ModelAdmin):
     )
     list_filter = ("is_complete", "college", "created_at")
     search_fields = ("user__email", "college__code", "uuid")
+    list_select_related = ("user", "college")
     readonly_fields = ("uuid", "created_at", "is_complete")
 
     def is_expired_display(self, obj):
@@ -111,6 +112,7 @@ class LoginOTPAdmin(admin.ModelAdmin):
     )
     list_filter = ("created_at", "expires_at")
     search_fields = ("user__email", "otp")
+    list_select_related = ("user",)
     readonly_fields = ("created_at", "expires_at", "resend_attempts", "last_resend_at")
 
     def otp_masked(self, obj):
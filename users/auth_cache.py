@@ -0,0 +1,75 @@
+"""
+Cached `request.user`.
+
+Authenticated requests normally load the session row, the User row and then
+`user.college`. With the cached_db session engine the session comes from
+Redis; this module does the same for the user: a pickled snapshot of the User
+with its College attached, invalidated whenever either model changes.
+
+Signals cover save() and delete(). Code that changes a User or College with
+QuerySet.update() must call invalidate_user() / invalidate_college() itself.
+"""
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, get_user
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.crypto import constant_time_compare
+from monitoring.metrics import AUTH_CACHE_LOOKUPS
+
+USER_CACHE_TTL = 15 * 60
+
+
+def user_cache_key(user_id):
+    return f"auth:user:{user_id}"
+
+
+def cache_user(user):
+    """Store a snapshot of `user` with its college already loaded."""
+    if user.college_id:
+        user.college  # noqa: B018 - populate the relation cache before pickling
+    cache.set(user_cache_key(user.pk), user, USER_CACHE_TTL)
+
+
+def get_cached_user(request):
+    """Drop-in for django.contrib.auth.get_user() that serves the user from cache."""
+    user_id = request.session.get(SESSION_KEY)
+    backend_path = request.session.get(BACKEND_SESSION_KEY)
+    if user_id is None or backend_path not in settings.AUTHENTICATION_BACKENDS:
+        return get_user(request)
+
+    user = cache.get(user_cache_key(user_id))
+    session_hash = request.session.get(HASH_SESSION_KEY)
+    if user is not None and session_hash and constant_time_compare(session_hash, user.get_session_auth_hash()):
+        AUTH_CACHE_LOOKUPS.labels(cache="user", result="hit").inc()
+        user.backend = backend_path
+        return user
+
+    # Miss, or a hash mismatch that get_user() must handle (fallback keys, flushing the session).
+    AUTH_CACHE_LOOKUPS.labels(cache="user", result="miss").inc()
+    user = get_user(request)
+    if user.is_authenticated:
+        cache_user(user)
+    return user
+
+
+def invalidate_user(user_id):
+    cache.delete(user_cache_key(user_id))
+
+
+@receiver([post_save, post_delete], sender=settings.AUTH_USER_MODEL)
+def invalidate_user_on_change(sender, instance, **kwargs):
+    invalidate_user(instance.pk)
+
+
+def invalidate_college(college_id):
+    """Drop the snapshots of every user of the college."""
+    from .models import User
+
+    user_ids = User.objects.filter(college_id=college_id).values_list("id", flat=True)
+    cache.delete_many([user_cache_key(user_id) for user_id in user_ids])
+
+
+@receiver([post_save, post_delete], sender="colleges.College")
+def invalidate_college_users(sender, instance, **kwargs):
+    invalidate_college(instance.pk)
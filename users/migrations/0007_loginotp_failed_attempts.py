@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 20:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_createpasswordrequest_uuid'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loginotp',
+            name='failed_attempts',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -127,6 +127,7 @@ class LoginOTP(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     expires_at = models.DateTimeField()
     resend_attempts = models.PositiveIntegerField(default=0)
+    failed_attempts = models.PositiveIntegerField(default=0)
     last_resend_at = models.DateTimeField(null=True, blank=True)
 
     def is_valid(self):
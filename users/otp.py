@@ -0,0 +1,204 @@
+"""
+Login OTP storage.
+
+`RedisOTPStore` keeps the code, its expiry and the resend/failed-attempt
+counters in one Redis hash per user. The hash expires on its own, so the login
+flow does no database writes and leaves nothing to clean up.
+`DatabaseOTPStore` keeps the original `LoginOTP` table behaviour for
+deployments without Redis.
+
+Both stores count failed verifications (MAX_FAILED_ATTEMPTS, then the OTP is
+dropped) and resends (MAX_RESENDS) the same way; `remaining` reports both.
+"""
+import logging
+import secrets
+import time
+
+from django.conf import settings
+from django.db.models import F
+
+from .tasks import send_login_otp
+
+logger = logging.getLogger(__name__)
+
+OTP_VALIDITY = 5 * 60
+RESEND_COOLDOWN = 60
+MAX_RESENDS = 5
+MAX_FAILED_ATTEMPTS = 5
+# How long a half-finished login (password accepted, OTP pending) is kept.
+OTP_SESSION_TTL = 15 * 60
+
+OK = "ok"
+INVALID = "invalid"
+EXPIRED = "expired"
+MISSING = "missing"
+LOCKED = "locked"
+DENIED = "denied"
+
+
+def generate_code():
+    return f"{secrets.randbelow(900000) + 100000}"
+
+
+def deliver_otp(email, otp_code):
+    if settings.DEBUG:
+        print(f"[DEBUG] OTP for {email}: {otp_code}")
+
+    try:
+        send_login_otp.delay(email, otp_code)
+    except Exception as e:
+        logger.warning(f"Failed to send OTP email via Celery: {e}")
+
+
+class DatabaseOTPStore:
+    """OTPs stored in the LoginOTP table."""
+
+    def issue(self, user):
+        from .models import LoginOTP
+
+        LoginOTP.generate_for_user(user)
+
+    def remaining(self, user_id):
+        """Return (failed verifications left, resends left), or None without an OTP."""
+        from .models import LoginOTP
+
+        otp_obj = LoginOTP.objects.filter(user_id=user_id).last()
+        if not otp_obj:
+            return None
+        return MAX_FAILED_ATTEMPTS - otp_obj.failed_attempts, MAX_RESENDS - otp_obj.resend_attempts
+
+    def verify(self, user_id, code):
+        """Return (status, failed verifications left)."""
+        from .models import LoginOTP
+
+        try:
+            otp_obj = LoginOTP.objects.filter(user_id=user_id).latest("created_at")
+        except LoginOTP.DoesNotExist:
+            return MISSING, 0
+
+        if otp_obj.otp != code:
+            LoginOTP.objects.filter(id=otp_obj.id).update(failed_attempts=F("failed_attempts") + 1)
+            failed = otp_obj.failed_attempts + 1
+            if failed >= MAX_FAILED_ATTEMPTS:
+                otp_obj.delete()
+                return LOCKED, 0
+            return INVALID, MAX_FAILED_ATTEMPTS - failed
+        otp_obj.delete()  # consume OTP
+        return (OK if otp_obj.is_valid() else EXPIRED), 0
+
+    def resend(self, user_id):
+        """Return (status, error_message)."""
+        from .models import LoginOTP
+
+        otp_obj = LoginOTP.objects.select_related("user").filter(user_id=user_id).last()
+        if not otp_obj:
+            return MISSING, ""
+
+        can_resend, error_message = otp_obj.can_resend()
+        if not can_resend:
+            return DENIED, error_message
+
+        LoginOTP.generate_for_user(otp_obj.user, is_resend=True)
+        return OK, ""
+
+
+class RedisOTPStore:
+    """OTPs stored in a Redis hash per user with TTLs and atomic counters."""
+
+    # Compare-and-consume in one round trip; counts failures atomically and
+    # drops the OTP once MAX_FAILED_ATTEMPTS is reached.
+    VERIFY_SCRIPT = """
+    local code = redis.call('HGET', KEYS[1], 'code')
+    if not code then return {'missing', 0} end
+    if code == ARGV[1] then
+        local expires_at = tonumber(redis.call('HGET', KEYS[1], 'expires_at'))
+        redis.call('DEL', KEYS[1])
+        if tonumber(ARGV[2]) > expires_at then return {'expired', 0} end
+        return {'ok', 0}
+    end
+    local failed = redis.call('HINCRBY', KEYS[1], 'failed', 1)
+    if failed >= tonumber(ARGV[3]) then
+        redis.call('DEL', KEYS[1])
+        return {'locked', 0}
+    end
+    return {'invalid', tonumber(ARGV[3]) - failed}
+    """
+
+    # Checks the resend limit and cooldown and swaps in the new code atomically.
+    RESEND_SCRIPT = """
+    local email = redis.call('HGET', KEYS[1], 'email')
+    if not email then return {'missing', ''} end
+    local resends = tonumber(redis.call('HGET', KEYS[1], 'resends') or '0')
+    if resends >= tonumber(ARGV[4]) then
+        return {'denied', 'You have reached the maximum number of resend attempts.'}
+    end
+    local last_resend = tonumber(redis.call('HGET', KEYS[1], 'last_resend') or '0')
+    if tonumber(ARGV[2]) < last_resend + tonumber(ARGV[5]) then
+        return {'denied', 'Please wait before requesting another OTP.'}
+    end
+    redis.call('HSET', KEYS[1], 'code', ARGV[1], 'expires_at', ARGV[3], 'last_resend', ARGV[2])
+    redis.call('HINCRBY', KEYS[1], 'resends', 1)
+    redis.call('EXPIRE', KEYS[1], ARGV[6])
+    return {'ok', email}
+    """
+
+    def __init__(self, client=None):
+        from checkmate_central.redis_client import get_redis
+
+        self.redis = client or get_redis()
+        self._verify = self.redis.register_script(self.VERIFY_SCRIPT)
+        self._resend = self.redis.register_script(self.RESEND_SCRIPT)
+
+    @staticmethod
+    def key(user_id):
+        return f"otp:login:{user_id}"
+
+    def issue(self, user):
+        otp_code = generate_code()
+        key = self.key(user.id)
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.delete(key)
+        pipe.hset(key, mapping={
+            "code": otp_code,
+            "email": user.email,
+            "expires_at": time.time() + OTP_VALIDITY,
+            "failed": 0,
+            "resends": 0,
+        })
+        pipe.expire(key, OTP_SESSION_TTL)
+        pipe.execute()
+        deliver_otp(user.email, otp_code)
+
+    def remaining(self, user_id):
+        """Return (failed verifications left, resends left), or None without an OTP."""
+        code, failed, resends = self.redis.hmget(self.key(user_id), "code", "failed", "resends")
+        if code is None:
+            return None
+        return MAX_FAILED_ATTEMPTS - int(failed or 0), MAX_RESENDS - int(resends or 0)
+
+    def verify(self, user_id, code):
+        """Return (status, failed verifications left)."""
+        status, remaining = self._verify(
+            keys=[self.key(user_id)],
+            args=[code or "", time.time(), MAX_FAILED_ATTEMPTS],
+        )
+        return status, int(remaining)
+
+    def resend(self, user_id):
+        otp_code = generate_code()
+        now = time.time()
+        status, detail = self._resend(
+            keys=[self.key(user_id)],
+            args=[otp_code, now, now + OTP_VALIDITY, MAX_RESENDS, RESEND_COOLDOWN, OTP_SESSION_TTL],
+        )
+        if status != OK:
+            return status, detail
+        deliver_otp(detail, otp_code)
+        return OK, ""
+
+
+def get_otp_store():
+    """Return the configured OTP store (settings.OTP_BACKEND: "redis" or "database")."""
+    if settings.OTP_BACKEND == "redis":
+        return RedisOTPStore()
+    return DatabaseOTPStore()
@@ -1,10 +1,11 @@
 # users/tasks.py
 from celery import shared_task
-from django.core.mail import send_mail
+from django.core.mail import EmailMessage
+from checkmate_central.mail import send_messages
 import os
 
-@shared_task
+@shared_task(acks_late=False, ignore_result=True)
 def send_login_otp(email, otp):
     subject = 'Your Login OTP'
     message = f'Your OTP is {otp}'
-    send_mail(subject=subject, message=message, from_email=os.getenv('EMAIL_HOST_USER'), recipient_list=[email])
+    send_messages([EmailMessage(subject=subject, body=message, from_email=os.getenv('EMAIL_HOST_USER'), to=[email])])
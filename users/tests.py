@@ -1,3 +1,277 @@
-from django.test import TestCase
+from unittest import mock, skipIf
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import SimpleTestCase
+from django.urls import reverse
+from backups.purge import request_college_purge
+from checkmate_central.testing import QueryBudgetTestCase
+from .auth_cache import user_cache_key
+from .models import LoginOTP, User
+from . import otp
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+# Issued codes are 100000-999999.
+WRONG_CODE = "000000"
+
+
+class UserViewQueryBudgetTests(QueryBudgetTestCase):
+
+    def test_landing_page(self):
+        self.login(self.staff)
+        self.assertQueryBudget(0, lambda: self.client.get(reverse("landing_page")))
+
+    def test_login_form(self):
+        self.assertQueryBudget(0, lambda: self.client.get(reverse("users:login")))
+
+    def test_login_submit(self):
+        # Fresh client each run: a login always starts without a session.
+        self.assertQueryBudget(7, lambda: self.client_class().post(reverse("users:login"), {
+            "email": "staff@example.com",
+            "password": "staff-pass",
+        }))
+
+    def _start_otp_session(self):
+        LoginOTP.generate_for_user(self.staff)
+        session = self.client.session
+        session["otp_user_id"] = self.staff.id
+        session.save()
+
+    def test_otp_verify_form(self):
+        self._start_otp_session()
+        self.assertQueryBudget(1, lambda: self.client.get(reverse("users:otp_verify")))
+
+    def test_otp_verify_wrong_code(self):
+        self._start_otp_session()
+        # Read the OTP, count the failure, read the counts left for the page.
+        self.assertQueryBudget(3, lambda: self.client.post(reverse("users:otp_verify"), {"otp": "000000"}))
+
+    def test_otp_verify_success(self):
+        self._start_otp_session()
+        otp = LoginOTP.objects.get(user=self.staff).otp
+        self.assertQueryBudget(
+            13,
+            lambda: self.client.post(reverse("users:otp_verify"), {"otp": otp}),
+            repeatable=False,
+        )
+
+    def test_resend_otp(self):
+        self._start_otp_session()
+        self.assertQueryBudget(3, lambda: self.client.get(reverse("users:resend_otp")), repeatable=False)
+
+    def test_staff_dashboard(self):
+        self.login(self.staff)
+        self.assertQueryBudget(4, lambda: self.client.get(reverse("users:staff_dashboard")))
+
+    def test_logout(self):
+        self.login(self.staff)
+        self.assertQueryBudget(2, lambda: self.client.get(reverse("users:logout")), repeatable=False)
+
+
+class UserAdminQueryBudgetTests(QueryBudgetTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.login(self.staff)
+
+    def test_user_changelist(self):
+        self.assertQueryBudget(4, lambda: self.client.get(reverse("admin:users_user_changelist")))
+
+    def test_create_password_request_changelist(self):
+        self.assertQueryBudget(4, lambda: self.client.get(reverse("admin:users_createpasswordrequest_changelist")))
+
+    def test_login_otp_changelist(self):
+        self.assertQueryBudget(3, lambda: self.client.get(reverse("admin:users_loginotp_changelist")))
+
+
+class CachedUserInvalidationTests(QueryBudgetTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.login(self.college_user)
+
+    def request_user(self):
+        response = self.client.get(reverse("colleges:college_dashboard"))
+        return response, response.wsgi_request.user
+
+    def test_user_change_is_seen_on_the_next_request(self):
+        self.request_user()
+        self.assertIsNotNone(cache.get(user_cache_key(self.college_user.pk)))
+
+        user = User.objects.get(pk=self.college_user.pk)
+        user.first_name = "Renamed"
+        user.save()
+
+        self.assertEqual(self.request_user()[1].first_name, "Renamed")
+
+    def test_deactivated_user_is_logged_out(self):
+        self.request_user()
+        user = User.objects.get(pk=self.college_user.pk)
+        user.is_active = False
+        user.save()
+
+        response, request_user = self.request_user()
+        self.assertFalse(request_user.is_authenticated)
+        self.assertEqual(response.status_code, 302)
+
+    def test_college_change_is_seen_on_the_next_request(self):
+        self.request_user()
+        self.college.name = "Renamed College"
+        self.college.save()
+
+        self.assertEqual(self.request_user()[1].college.name, "Renamed College")
+
+    def test_college_marked_with_update_is_seen_on_the_next_request(self):
+        self.request_user()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            request_college_purge(self.college)
+
+        self.assertTrue(self.request_user()[1].college.pending_deletion)
+
+
+@skipIf(fakeredis is None, "fakeredis is not installed")
+class RedisOTPStoreTests(SimpleTestCase):
+    """VERIFY_SCRIPT and RESEND_SCRIPT run on fakeredis's Lua interpreter."""
+
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis(decode_responses=True)
+        self.store = otp.RedisOTPStore(client=self.redis)
+        self.user = User(id=7, email="otp@example.com")
+        self.now = 1_000_000.0
+        self.sent = []
+        for target, replacement in (
+            ("users.otp.time", mock.Mock(time=lambda: self.now)),
+            ("users.otp.deliver_otp", lambda email, code: self.sent.append((email, code))),
+        ):
+            patcher = mock.patch(target, replacement)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.store.issue(self.user)
+
+    @property
+    def code(self):
+        return self.sent[-1][1]
+
+    def test_issue_stores_a_hash_that_expires(self):
+        key = self.store.key(self.user.id)
+        self.assertEqual(self.sent, [("otp@example.com", self.redis.hget(key, "code"))])
+        self.assertEqual(self.redis.ttl(key), otp.OTP_SESSION_TTL)
+        self.assertEqual(self.store.remaining(self.user.id), (otp.MAX_FAILED_ATTEMPTS, otp.MAX_RESENDS))
+
+    def test_right_code_is_consumed(self):
+        self.assertEqual(self.store.verify(self.user.id, self.code), (otp.OK, 0))
+        self.assertIsNone(self.store.remaining(self.user.id))
+        self.assertEqual(self.store.verify(self.user.id, self.code), (otp.MISSING, 0))
+
+    def test_wrong_code_counts_down_and_keeps_the_otp(self):
+        remaining = otp.MAX_FAILED_ATTEMPTS - 1
+        self.assertEqual(self.store.verify(self.user.id, WRONG_CODE), (otp.INVALID, remaining))
+        self.assertEqual(self.store.verify(self.user.id, ""), (otp.INVALID, remaining - 1))
+        self.assertEqual(self.store.verify(self.user.id, self.code), (otp.OK, 0))
+
+    def test_lockout_drops_the_otp(self):
+        for _ in range(otp.MAX_FAILED_ATTEMPTS - 1):
+            self.assertEqual(self.store.verify(self.user.id, WRONG_CODE)[0], otp.INVALID)
+        self.assertEqual(self.store.verify(self.user.id, WRONG_CODE), (otp.LOCKED, 0))
+        self.assertIsNone(self.store.remaining(self.user.id))
+        self.assertEqual(self.store.verify(self.user.id, self.code), (otp.MISSING, 0))
+
+    def test_expired_code_is_rejected_and_consumed(self):
+        self.now += otp.OTP_VALIDITY + 1
+        self.assertEqual(self.store.verify(self.user.id, self.code), (otp.EXPIRED, 0))
+        self.assertIsNone(self.store.remaining(self.user.id))
+
+    def test_resend_replaces_the_code(self):
+        self.assertEqual(self.store.resend(self.user.id), (otp.OK, ""))
+        self.assertEqual(len(self.sent), 2)
+        self.assertEqual(self.sent[-1][0], "otp@example.com")
+        self.assertEqual(self.store.remaining(self.user.id)[1], otp.MAX_RESENDS - 1)
+        self.assertEqual(self.redis.hget(self.store.key(self.user.id), "code"), self.code)
+        self.assertEqual(self.store.verify(self.user.id, self.code), (otp.OK, 0))
+
+    def test_resend_gives_the_new_code_a_fresh_validity(self):
+        self.now += otp.OTP_VALIDITY - 1
+        self.store.resend(self.user.id)
+        self.now += otp.OTP_VALIDITY - 1
+        self.assertEqual(self.store.verify(self.user.id, self.code), (otp.OK, 0))
+
+    def test_resend_is_throttled(self):
+        self.store.resend(self.user.id)
+        self.now += otp.RESEND_COOLDOWN - 1
+        self.assertEqual(self.store.resend(self.user.id), (otp.DENIED, "Please wait before requesting another OTP."))
+        self.assertEqual(len(self.sent), 2)
+
+        for _ in range(otp.MAX_RESENDS - 1):
+            self.now += otp.RESEND_COOLDOWN
+            self.assertEqual(self.store.resend(self.user.id), (otp.OK, ""))
+        self.now += otp.RESEND_COOLDOWN
+        self.assertEqual(
+            self.store.resend(self.user.id),
+            (otp.DENIED, "You have reached the maximum number of resend attempts."),
+        )
+        self.assertEqual(len(self.sent), 1 + otp.MAX_RESENDS)
+        self.assertEqual(self.store.remaining(self.user.id)[1], 0)
+
+    def test_resend_without_otp(self):
+        self.assertEqual(self.store.resend(99), (otp.MISSING, ""))
+        self.assertEqual(self.sent[1:], [])
+
+
+class OTPStoreContract:
+    """The same login flow against each OTP store; both must report the same counts."""
+
+    def make_store(self):
+        raise NotImplementedError
+
+    def setUp(self):
+        super().setUp()
+        self.store = self.make_store()
+        patcher = mock.patch("users.views.get_otp_store", return_value=self.store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.store.issue(self.staff)
+        session = self.client.session
+        session["otp_user_id"] = self.staff.id
+        session.save()
+
+    def test_failed_verifications_and_resends_are_counted_apart(self):
+        self.assertEqual(self.store.remaining(self.staff.id), (otp.MAX_FAILED_ATTEMPTS, otp.MAX_RESENDS))
+        self.assertEqual(self.store.verify(self.staff.id, WRONG_CODE), (otp.INVALID, otp.MAX_FAILED_ATTEMPTS - 1))
+        self.assertEqual(self.store.remaining(self.staff.id), (otp.MAX_FAILED_ATTEMPTS - 1, otp.MAX_RESENDS))
+
+        self.assertEqual(self.store.resend(self.staff.id), (otp.OK, ""))
+        self.assertEqual(self.store.remaining(self.staff.id), (otp.MAX_FAILED_ATTEMPTS - 1, otp.MAX_RESENDS - 1))
+
+    def test_lockout(self):
+        for _ in range(otp.MAX_FAILED_ATTEMPTS - 1):
+            self.assertEqual(self.store.verify(self.staff.id, WRONG_CODE)[0], otp.INVALID)
+        self.assertEqual(self.store.verify(self.staff.id, WRONG_CODE), (otp.LOCKED, 0))
+        self.assertIsNone(self.store.remaining(self.staff.id))
+
+    def test_verify_page_shows_both_counts(self):
+        response = self.client.post(reverse("users:otp_verify"), {"otp": WRONG_CODE})
+        self.assertEqual(response.context["remaining_attempts"], otp.MAX_FAILED_ATTEMPTS - 1)
+        self.assertEqual(response.context["remaining_resends"], otp.MAX_RESENDS)
+
+        self.client.post(reverse("users:resend_otp"))
+        response = self.client.get(reverse("users:otp_verify"))
+        self.assertEqual(response.context["remaining_attempts"], otp.MAX_FAILED_ATTEMPTS - 1)
+        self.assertEqual(response.context["remaining_resends"], otp.MAX_RESENDS - 1)
+        self.assertContains(response, "4 attempts and 4 resends left.")
+
+
+class DatabaseOTPStoreTests(OTPStoreContract, QueryBudgetTestCase):
+
+    def make_store(self):
+        return otp.DatabaseOTPStore()
+
+
+@skipIf(fakeredis is None, "fakeredis is not installed")
+class RedisOTPStoreContractTests(OTPStoreContract, QueryBudgetTestCase):
+
+    def make_store(self):
+        return otp.RedisOTPStore(client=fakeredis.FakeRedis(decode_responses=True))
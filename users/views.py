@@ -1,12 +1,15 @@
 import logging
-from django.shortcuts import render, redirect, get_object_or_404
+from django.shortcuts import render, redirect
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
-from .models import User, LoginOTP
+from .models import User
+from . import otp
+from .otp import get_otp_store
 from colleges.models import College
 from backups.models import Backup
 from django.http import HttpResponseNotFound
-from django.db.models import Max
+from django.db.models import Count
+from checkmate_central.db_routers import use_replica
 
 logger = logging.getLogger(__name__)
 
@@ -40,7 +43,7 @@ def email_password_login(request):
         password = request.POST.get("password")
         user = authenticate(request, email=email, password=password)
         if user and user.is_active:
-            LoginOTP.generate_for_user(user)
+            get_otp_store().issue(user)
             request.session["otp_user_id"] = user.id
             logger.info(f"OTP generated for {email} ({user.role})")
             return redirect("users:otp_verify")
@@ -58,39 +61,52 @@ def otp_verify(request):
     if not user_id:
         return redirect("users:login")
 
-    try:
-        user = User.objects.get(id=user_id)
-        otp_obj = LoginOTP.objects.filter(user=user).latest("created_at")
-    except (User.DoesNotExist, LoginOTP.DoesNotExist):
-        logger.error("OTP verification attempted with invalid user or OTP record.")
-        return redirect("users:login")
+    store = get_otp_store()
 
     if request.method == "POST":
         entered_otp = request.POST.get("otp")
-        if otp_obj.otp == entered_otp:
-            if otp_obj.is_valid():
-                otp_obj.delete()  # consume OTP
-                login(request, user)
-                request.session.pop("otp_user_id", None)
-                request.session.cycle_key()
-                logger.info(f"Successful OTP verification and login for {user.email} ({user.role})")
-                if user.role == User.Role.STAFF:
-                    return redirect("users:staff_dashboard")
-                elif user.role == User.Role.COLLEGE:
-                    return redirect("colleges:college_dashboard")
-            else:
-                otp_obj.delete()
-                logger.warning(f"Expired OTP used by {user.email}")
-                return render(request, "users/otp_verify.html", {"error": "OTP expired"})
+        status, remaining = store.verify(user_id, entered_otp)
+
+        if status == otp.OK:
+            try:
+                user = User.objects.get(id=user_id)
+            except User.DoesNotExist:
+                logger.error("OTP verification succeeded for a user that no longer exists.")
+                return redirect("users:login")
+            login(request, user)  # also rotates the session key
+            request.session.pop("otp_user_id", None)
+            logger.info(f"Successful OTP verification and login for {user.email} ({user.role})")
+            if user.role == User.Role.STAFF:
+                return redirect("users:staff_dashboard")
+            elif user.role == User.Role.COLLEGE:
+                return redirect("colleges:college_dashboard")
+        elif status == otp.EXPIRED:
+            logger.warning(f"Expired OTP used by user {user_id}")
+            return render(request, "users/otp_verify.html", {"error": "OTP expired"})
+        elif status == otp.LOCKED:
+            request.session.pop("otp_user_id", None)
+            logger.warning(f"Too many invalid OTP attempts by user {user_id}")
+            return render(request, "users/login.html", {"error": "Too many invalid OTP attempts. Please log in again."})
+        elif status == otp.MISSING:
+            logger.error("OTP verification attempted with invalid user or OTP record.")
+            return redirect("users:login")
         else:
-            logger.warning(f"Invalid OTP attempt by {user.email}")
-            return render(request, "users/otp_verify.html", {
-                "error": "Invalid OTP",
-                "remaining_attempts": 5 - otp_obj.resend_attempts
-            })
+            logger.warning(f"Invalid OTP attempt by user {user_id}")
+            return render(request, "users/otp_verify.html", _otp_context(store, user_id, error="Invalid OTP"))
+
+    context = _otp_context(store, user_id)
+    if "remaining_attempts" not in context:
+        logger.error("OTP verification attempted with invalid user or OTP record.")
+        return redirect("users:login")
+    return render(request, "users/otp_verify.html", context)
 
-    remaining_attempts = 5 - otp_obj.resend_attempts
-    return render(request, "users/otp_verify.html", {"remaining_attempts": remaining_attempts})
+
+def _otp_context(store, user_id, **context):
+    """Template context with the failed verifications and resends left, when the OTP still exists."""
+    remaining = store.remaining(user_id)
+    if remaining is not None:
+        context["remaining_attempts"], context["remaining_resends"] = remaining
+    return context
 
 
 # -----------------------------
@@ -101,17 +117,14 @@ def resend_otp(request):
     if not user_id:
         return redirect("users:login")
 
-    user = get_object_or_404(User, id=user_id)
-    otp_obj = LoginOTP.objects.filter(user=user).last()
-    if not otp_obj:
+    # generates a new OTP, marked as a resend
+    store = get_otp_store()
+    status, error_message = store.resend(user_id)
+    if status == otp.MISSING:
         return redirect("users:login")
+    if status == otp.DENIED:
+        return render(request, "users/otp_verify.html", _otp_context(store, user_id, error=error_message))
 
-    can_resend, error_message = otp_obj.can_resend()
-    if not can_resend:
-        return render(request, "users/otp_verify.html", {"error": error_message})
-
-    # generate a new OTP but mark it as a resend
-    LoginOTP.generate_for_user(user, is_resend=True)
     return redirect("users:otp_verify")
 
 
@@ -123,13 +136,17 @@ def user_logout(request):
 
 
 @login_required
+@use_replica
 def staff_dashboard(request):
     if request.user.role != "STAFF":
         logger.warning(f"Unauthorized access attempt to staff dashboard by {request.user.email} ({request.user.role})")
         return redirect("users:college_dashboard")
 
-    colleges = College.objects.all().order_by("name").annotate(last_backup_time=Max('backups__uploaded_at'))
-    total_backups = Backup.objects.count()
+    colleges = College.objects.filter(pending_deletion=False).order_by("name").annotate(
+        last_backup_time=Backup.objects.last_backup_time(),
+        user_count=Count('users', distinct=True),
+    )
+    total_backups = Backup.objects.catalog().count()
     total_colleges = colleges.count()
 
     logger.info(f"Staff dashboard accessed by {request.user.email}. Total colleges: {total_colleges}, backups: {total_backups}")